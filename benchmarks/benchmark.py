@@ -0,0 +1,287 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+benchmark
+-----------
+
+Throughput and peak memory of the dithering algorithms and palette
+operations, on synthetic images generated locally.
+
+Run from the repository root, e.g.::
+
+    python benchmarks/benchmark.py --sizes 256 1024 --colours 16 64
+
+or, to check the time taken to import the package and single algorithms
+in a new interpreter::
+
+    python benchmarks/benchmark.py --startup --max-startup-ms 25 \
+        --max-algorithm-startup-ms 300
+
+The bare package import is lazy and limited by ``--max-startup-ms``. The
+imports of single algorithms, which load NumPy and PIL, are limited by
+``--max-algorithm-startup-ms``.
+
+Every case is first run once on a small image, to compile Numba kernels,
+and then timed ``--repeat`` times on the full image with a new
+:class:`~hitherdither.palette.Palette`, so that tables derived from the
+palette are built in every timed run. The best time is reported, as
+megapixels per second. Peak memory is measured in a separate run with
+:mod:`tracemalloc`, which tracks memory allocated by Python and NumPy but
+not by Numba kernels, and excludes the input image.
+
+"""
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+from __future__ import absolute_import
+
+import argparse
+import gc
+import json
+import os
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, _ROOT)
+
+from hitherdither import threads
+from hitherdither.diffusion import _DIFFUSION_MAPS, error_diffusion_dithering
+from hitherdither.ordered.bayer import bayer_dithering
+from hitherdither.ordered.blue_noise import blue_noise_dithering
+from hitherdither.ordered.cluster import cluster_dot_dithering
+from hitherdither.ordered.yliluoma import yliluomas_1_ordered_dithering
+from hitherdither.palette import Palette
+
+SIZES = (256, 1024, 4096)
+COLOURS = (2, 16, 64, 256)
+THRESHOLDS = [256 / 4, 256 / 4, 256 / 4]
+STARTUP_STATEMENTS = (
+    "import hitherdither",
+    "from hitherdither.ordered.bayer import bayer_dithering",
+    "from hitherdither.ordered.cluster import cluster_dot_dithering",
+    "from hitherdither.ordered.yliluoma import yliluomas_1_ordered_dithering",
+    "from hitherdither.diffusion import error_diffusion_dithering",
+    "from hitherdither.palette import Palette",
+)
+
+
+def synthetic_image(size, seed=0):
+    """A ``[size x size x 3]`` image of smooth gradients with noise.
+
+    :param int size: Width and height in pixels.
+    :param int seed: Seed of the noise.
+    :return: A ``uint8`` array.
+
+    """
+    rng = np.random.RandomState(seed)
+    ramp = (np.arange(size, dtype="int16") * 256 // size).astype("int16")
+    image = np.empty((size, size, 3), "int16")
+    image[:, :, 0] = ramp[None, :]
+    image[:, :, 1] = ramp[:, None]
+    image[:, :, 2] = (ramp[None, :] + ramp[:, None]) // 2
+    image += rng.randint(-24, 25, image.shape).astype("int16")
+    return np.clip(image, 0, 255).astype("uint8")
+
+
+def synthetic_colours(n, seed=0):
+    """``n`` random palette colours, always including black and white."""
+    colours = np.random.RandomState(seed).randint(0, 256, (n, 3))
+    colours[0], colours[-1] = 0, 255
+    return colours.astype("uint8")
+
+
+def _cases():
+    cases = {
+        "bayer": lambda image, p: bayer_dithering(image, p, THRESHOLDS, order=8),
+        "cluster-dot": lambda image, p: cluster_dot_dithering(
+            image, p, THRESHOLDS, order=4
+        ),
+        "blue-noise": lambda image, p: blue_noise_dithering(
+            image, p, THRESHOLDS, shape=64
+        ),
+        "yliluoma-1": lambda image, p: yliluomas_1_ordered_dithering(image, p, order=8),
+        "image_closest_colour": lambda image, p: p.image_closest_colour(image),
+        "create_by_median_cut": lambda image, p: Palette.create_by_median_cut(
+            image, len(p)
+        ),
+        "create_by_kmeans": lambda image, p: Palette.create_by_kmeans(
+            image, len(p), random_state=0
+        ),
+    }
+    for method in sorted(_DIFFUSION_MAPS):
+        cases["error-diffusion:" + method] = (
+            lambda image, p, method=method: error_diffusion_dithering(
+                image, p, method=method
+            )
+        )
+    return cases
+
+
+CASES = _cases()
+
+
+def measure(case, image, colours, repeat=3):
+    """Time a case and measure its peak memory.
+
+    :param str case: Name of the case, a key of :data:`CASES`.
+    :param image: The image to process.
+    :param colours: The colours of the palette to use.
+    :param int repeat: Number of timed runs.
+    :return: A dict with the best time in seconds, the throughput in
+        megapixels per second and the peak memory in megabytes.
+
+    """
+    run = CASES[case]
+    run(image[:64, :64], Palette(colours))
+
+    times = []
+    for _ in range(repeat):
+        palette = Palette(colours)
+        gc.collect()
+        start = time.perf_counter()
+        run(image, palette)
+        times.append(time.perf_counter() - start)
+
+    palette = Palette(colours)
+    gc.collect()
+    tracemalloc.start()
+    try:
+        baseline = tracemalloc.get_traced_memory()[0]
+        run(image, palette)
+        peak = tracemalloc.get_traced_memory()[1] - baseline
+    finally:
+        tracemalloc.stop()
+
+    best = min(times)
+    pixels = image.shape[0] * image.shape[1]
+    return {
+        "seconds": best,
+        "mpixels_per_second": pixels / best / 1e6,
+        "peak_mb": peak / 2**20,
+    }
+
+
+def measure_startup(statement, repeat=5):
+    """Time an import in a new interpreter.
+
+    :param str statement: The import statement to run.
+    :param int repeat: Number of timed runs.
+    :return: The best time in seconds, less that of an empty interpreter.
+
+    """
+    env = dict(os.environ, PYTHONPATH=_ROOT)
+
+    def best(code):
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            subprocess.check_call([sys.executable, "-c", code], env=env)
+            times.append(time.perf_counter() - start)
+        return min(times)
+
+    return max(0.0, best(statement) - best("pass"))
+
+
+def startup(repeat=5, max_ms=None, max_algorithm_ms=None):
+    """Print the import times of :data:`STARTUP_STATEMENTS`.
+
+    :param int repeat: Number of timed runs per statement.
+    :param float max_ms: If given, the largest acceptable time in
+        milliseconds for ``import hitherdither``.
+    :param float max_algorithm_ms: If given, the largest acceptable time in
+        milliseconds for every other statement.
+    :return: The statements that took longer than acceptable.
+
+    """
+    header = "{0:72} {1:>8}".format("statement", "ms")
+    print(header)
+    print("-" * len(header))
+    slow = []
+    for statement in STARTUP_STATEMENTS:
+        ms = measure_startup(statement, repeat) * 1000.0
+        print("{0:72} {1:>8.1f}".format(statement, ms))
+        limit = max_ms if statement == "import hitherdither" else max_algorithm_ms
+        if limit is not None and ms > limit:
+            slow.append(statement)
+    return slow
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES)
+    parser.add_argument("--colours", type=int, nargs="+", default=COLOURS)
+    parser.add_argument(
+        "--cases",
+        nargs="+",
+        default=sorted(CASES),
+        help="Cases to run, by name or prefix, e.g. error-diffusion.",
+    )
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument(
+        "--threads",
+        type=int,
+        default=1,
+        help="Threads of the shared pool, 0 for the number of CPUs.",
+    )
+    parser.add_argument("--json", help="Also write the results to this file.")
+    parser.add_argument(
+        "--startup", action="store_true", help="Measure import times instead."
+    )
+    parser.add_argument(
+        "--max-startup-ms",
+        type=float,
+        help="Exit with an error if importing the package takes longer.",
+    )
+    parser.add_argument(
+        "--max-algorithm-startup-ms",
+        type=float,
+        help="Exit with an error if importing any algorithm takes longer.",
+    )
+    args = parser.parse_args(argv)
+
+    if args.startup:
+        slow = startup(
+            max(args.repeat, 5), args.max_startup_ms, args.max_algorithm_startup_ms
+        )
+        if slow:
+            sys.exit("Slower than allowed: {0}".format("; ".join(slow)))
+        return
+
+    threads.set_threads(args.threads)
+    cases = [c for c in sorted(CASES) if any(c.startswith(p) for p in args.cases)]
+    if not cases:
+        parser.error("No cases match {0}".format(" ".join(args.cases)))
+
+    header = "{0:36} {1:>6} {2:>7} {3:>10} {4:>8} {5:>9}".format(
+        "case", "size", "colours", "seconds", "MP/s", "peak MB"
+    )
+    print(header)
+    print("-" * len(header))
+    results = []
+    for size in args.sizes:
+        image = synthetic_image(size)
+        for n in args.colours:
+            colours = synthetic_colours(n)
+            for case in cases:
+                result = measure(case, image, colours, args.repeat)
+                result.update(case=case, size=size, colours=n)
+                results.append(result)
+                print(
+                    "{case:36} {size:>6} {colours:>7} {seconds:>10.4f} "
+                    "{mpixels_per_second:>8.2f} {peak_mb:>9.1f}".format(**result)
+                )
+                sys.stdout.flush()
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -6,10 +6,36 @@ from __future__ import print_function
 from __future__ import unicode_literals
 from __future__ import absolute_import
 
-from . import data
-from . import math
-from . import ordered
-from . import diffusion
-from . import palette
-from . import utils
+import importlib
+
 from .__version__ import __version__, version
+
+# Submodules are imported on first access, so that using one algorithm
+# only loads the modules it needs.
+__all__ = [
+    "batch",
+    "cache",
+    "data",
+    "diffusion",
+    "math",
+    "ordered",
+    "palette",
+    "parallel",
+    "profiling",
+    "quantization",
+    "sequence",
+    "spatial",
+    "streaming",
+    "threads",
+    "utils",
+]
+
+
+def __getattr__(name):
+    if name in __all__:
+        return importlib.import_module("." + name, __name__)
+    raise AttributeError("module {0!r} has no attribute {1!r}".format(__name__, name))
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
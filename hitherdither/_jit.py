@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+_jit
+-----------
+
+Optional `Numba <https://numba.pydata.org/>`_ support.
+
+If Numba is installed, functions decorated with :func:`jit` are compiled
+to native code that releases the GIL. Otherwise they are returned as is
+and callers are expected to check :data:`HAS_NUMBA` before relying on them
+for speed.
+
+Numba itself is only imported when a decorated function is first called,
+as it takes longer to import than the rest of the package together.
+
+"""
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+import functools
+import threading
+from importlib.util import find_spec
+
+HAS_NUMBA = find_spec("numba") is not None
+
+# Decorated functions not compiled yet.
+_pending = []
+_lock = threading.Lock()
+
+
+def jit(func):
+    """Compile ``func`` in nopython mode if Numba is available.
+
+    Compilation is deferred to the first call of any decorated function of
+    the same module, when all of them are compiled and replace the
+    decorated functions in the module, so that they can call each other.
+
+    :param func: The function to compile.
+    :return: A function that compiles ``func`` on first call, or ``func``
+        itself without Numba.
+
+    """
+    if not HAS_NUMBA:
+        return func
+    return _LazyJit(func)
+
+
+class _LazyJit(object):
+    def __init__(self, func):
+        functools.update_wrapper(self, func)
+        self.func = func
+        self.dispatcher = None
+        _pending.append(self)
+
+    def __call__(self, *args):
+        if self.dispatcher is None:
+            _compile_module(self.func.__globals__)
+        return self.dispatcher(*args)
+
+
+def _compile_module(namespace):
+    import numba
+
+    with _lock:
+        for lazy in [f for f in _pending if f.func.__globals__ is namespace]:
+            lazy.dispatcher = numba.njit(cache=True, nogil=True)(lazy.func)
+            namespace[lazy.func.__name__] = lazy.dispatcher
+            _pending.remove(lazy)
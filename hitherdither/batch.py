@@ -0,0 +1,206 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+batch
+-----------
+
+Dithering of many frames or images with one palette.
+
+"""
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+from __future__ import absolute_import
+
+import numpy as np
+
+from hitherdither import cache
+from hitherdither.diffusion import error_diffusion_dithering_indices
+from hitherdither.ordered._engine import _OrderedDithering
+from hitherdither.ordered.bayer import B
+from hitherdither.ordered.blue_noise import blue_noise_matrix
+from hitherdither.ordered.cluster import _cluster_dot_matrix
+from hitherdither.ordered.yliluoma._algorithm_one import _YliluomasOne
+from hitherdither.palette import Palette
+
+
+def _bayer(palette, thresholds, order=8):
+    return _OrderedDithering(palette, B(order), thresholds)
+
+
+def _cluster_dot(palette, thresholds, order=4):
+    return _OrderedDithering(palette, _cluster_dot_matrix(order), thresholds)
+
+
+def _blue_noise(palette, thresholds, shape=64, sigma=1.5, seed=0):
+    return _OrderedDithering(palette, blue_noise_matrix(shape, sigma, seed), thresholds)
+
+
+def _threshold_map(palette, threshold_matrix, thresholds, order=2):
+    return _OrderedDithering(palette, threshold_matrix, thresholds, order)
+
+
+def _error_diffusion(palette, **params):
+    def dither(image, out=None):
+        return error_diffusion_dithering_indices(image, palette, out=out, **params)
+
+    return dither
+
+
+# Factories of callables ``dither(image, out=None)`` returning the palette
+# colour indices of an image, with all tables prepared up front.
+_ALGORITHMS = {
+    "bayer": _bayer,
+    "cluster-dot": _cluster_dot,
+    "blue-noise": _blue_noise,
+    "threshold-map": _threshold_map,
+    "yliluoma-1": _YliluomasOne,
+    "error-diffusion": _error_diffusion,
+}
+
+
+def dither_frames(
+    frames, palette, algorithm, output="indices", processes=None, **params
+):
+    """Dither many frames or images with the same palette and parameters.
+
+    Palette tables, threshold matrices, mixing plans and buffers are
+    prepared once and shared by all frames.
+
+    :param frames: A ``[T x M x N x 3]`` ``uint8`` array, or an iterable of
+        :class:`PIL.Image` images or arrays.
+    :param :class:`~hitherdither.colour.Palette` palette: The palette to use.
+    :param str algorithm: One of ``"bayer"``, ``"cluster-dot"``,
+        ``"blue-noise"``, ``"threshold-map"``, ``"yliluoma-1"`` or
+        ``"error-diffusion"``.
+    :param str output: ``"indices"`` for arrays of palette colour indices,
+        or ``"images"`` for PIL images of type "P".
+    :param int processes: If given, frames are dithered by a pool of this
+        many processes. The frames, which must then all have the same
+        shape, and the indices are passed in shared memory, and every
+        process prepares its tables once, including the lookup table of
+        the palette if one was built with
+        :meth:`~hitherdither.palette.Palette.build_lut`.
+    :param params: Parameters of the algorithm, as for the functions
+        :func:`~hitherdither.ordered.bayer.bayer_dithering`,
+        :func:`~hitherdither.ordered.cluster.cluster_dot_dithering`,
+        :func:`~hitherdither.ordered.blue_noise.blue_noise_dithering`,
+        :func:`~hitherdither.ordered.threshold.threshold_map_dithering`,
+        :func:`~hitherdither.ordered.yliluoma.yliluomas_1_ordered_dithering`
+        and :func:`~hitherdither.diffusion.error_diffusion_dithering`.
+    :return: For ``"indices"``, a ``[T x M x N]`` array if
+        ``frames`` is an array or ``processes`` is given, and a list of
+        ``[M x N]`` arrays otherwise, ``uint8`` (``uint16`` for palettes of
+        more than 256 colours). For ``"images"``, a list of images.
+
+    """
+    if algorithm not in _ALGORITHMS:
+        raise ValueError("Unknown dithering algorithm: {0}".format(algorithm))
+    if output not in ("indices", "images"):
+        raise ValueError("Unknown output: {0}".format(output))
+
+    if processes:
+        indices = _dither_in_processes(frames, palette, algorithm, params, processes)
+    else:
+        dither = _ALGORITHMS[algorithm](palette, **params)
+        if isinstance(frames, np.ndarray):
+            indices = np.empty(frames.shape[:3], _index_dtype(palette))
+            for frame, out in zip(frames, indices):
+                dither(frame, out)
+        else:
+            indices = [dither(frame) for frame in frames]
+
+    if output == "images":
+        return [palette.create_PIL_png_from_closest_colour(cc) for cc in indices]
+    return indices
+
+
+def _index_dtype(palette):
+    return np.dtype("uint8" if len(palette) <= 256 else "uint16")
+
+
+def _dither_in_processes(frames, palette, algorithm, params, processes):
+    # Imported here, as shared memory needs Python 3.8.
+    from concurrent.futures import ProcessPoolExecutor
+    from multiprocessing import shared_memory
+
+    if not isinstance(frames, np.ndarray):
+        frames = [np.asarray(frame, "uint8") for frame in frames]
+        if len(set(frame.shape for frame in frames)) > 1:
+            raise ValueError("Frames must have the same shape to use processes.")
+        frames = np.stack(frames) if frames else np.empty((0, 0, 0, 3), "uint8")
+    frames = np.asarray(frames, "uint8")
+    dtype = _index_dtype(palette)
+    if len(frames) == 0:
+        return np.empty(frames.shape[:3], dtype)
+
+    shm_in = shared_memory.SharedMemory(create=True, size=frames.nbytes)
+    shm_out = shared_memory.SharedMemory(
+        create=True, size=int(np.prod(frames.shape[:3])) * dtype.itemsize
+    )
+    try:
+        shared_frames = np.ndarray(frames.shape, "uint8", buffer=shm_in.buf)
+        shared_frames[...] = frames
+        del shared_frames
+        n_chunks = min(len(frames), 4 * processes)
+        bounds = np.linspace(0, len(frames), n_chunks + 1).astype("int")
+        tasks = [
+            (shm_in.name, shm_out.name, frames.shape, dtype.str, start, stop)
+            for start, stop in zip(bounds[:-1], bounds[1:])
+            if stop > start
+        ]
+        with ProcessPoolExecutor(
+            processes,
+            initializer=_init_worker,
+            initargs=_worker_args(palette, algorithm, params),
+        ) as pool:
+            for _ in pool.map(_dither_shared_frames, tasks):
+                pass
+        indices = np.ndarray(frames.shape[:3], dtype, buffer=shm_out.buf).copy()
+    finally:
+        shm_in.close()
+        shm_in.unlink()
+        shm_out.close()
+        shm_out.unlink()
+    return indices
+
+
+# The ditherer of a worker process, prepared once by its initializer.
+_worker_dither = None
+
+
+def _worker_args(palette, algorithm, params):
+    # Workers rebuild the palette, and its lookup table if it has one, so
+    # that they map colours as the calling process does.
+    if palette._lut is None:
+        lut = None
+    else:
+        lut = (palette._lut.shape[0].bit_length() - 1, palette._lut_order)
+    return palette.colours, lut, algorithm, params, cache.get_disk_cache()
+
+
+def _init_worker(colours, lut, algorithm, params, disk_cache):
+    global _worker_dither
+    cache.set_disk_cache(disk_cache)
+    palette = Palette(colours)
+    if lut is not None:
+        palette.build_lut(*lut)
+    _worker_dither = _ALGORITHMS[algorithm](palette, **params)
+
+
+def _dither_shared_frames(task):
+    from multiprocessing import shared_memory
+
+    in_name, out_name, shape, dtype, start, stop = task
+    shm_in = shared_memory.SharedMemory(name=in_name)
+    shm_out = shared_memory.SharedMemory(name=out_name)
+    try:
+        frames = np.ndarray(shape, "uint8", buffer=shm_in.buf)
+        indices = np.ndarray(shape[:3], dtype, buffer=shm_out.buf)
+        for n in range(start, stop):
+            _worker_dither(frames[n], indices[n])
+        del frames, indices
+    finally:
+        shm_in.close()
+        shm_out.close()
@@ -0,0 +1,298 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+cache
+-----------
+
+Caches for tables derived from palettes, in memory and on disk.
+
+"""
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+from __future__ import absolute_import
+
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+import uuid
+from collections import OrderedDict
+
+import numpy as np
+
+from hitherdither import profiling
+
+# Bump when the layout or contents of cached tables change.
+_DISK_CACHE_VERSION = 1
+
+
+class LRUCache(object):
+    """A dict-like cache that holds at most ``maxsize`` items.
+
+    When full, the least recently used item is evicted. It may be used by
+    several threads at once.
+
+    :param int maxsize: Maximum number of items to hold.
+
+    """
+
+    def __init__(self, maxsize=2**16):
+        self._items = OrderedDict()
+        self._maxsize = maxsize
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def maxsize(self):
+        return self._maxsize
+
+    @maxsize.setter
+    def maxsize(self, value):
+        with self._lock:
+            self._maxsize = value
+            self._evict()
+
+    def _evict(self):
+        while len(self._items) > self._maxsize:
+            self._items.popitem(last=False)
+
+    def __len__(self):
+        return len(self._items)
+
+    def __contains__(self, key):
+        return key in self._items
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value = self._items[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            self._items.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def __setitem__(self, key, value):
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            self._evict()
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+class DiskCache(object):
+    """A directory of tables derived from palettes, shared between processes.
+
+    Every entry is a tuple of arrays, stored as ``.npy`` files in a
+    directory named by a hash of its key. Entries are loaded memory mapped
+    and read-only, so all processes on a host share one copy of a table
+    in the page cache. Entries are written to a temporary directory first
+    and renamed into place, and renamed out of place before they are
+    removed, so concurrent readers never see partial entries.
+
+    When the total size of the entries exceeds ``max_bytes``, entries are
+    evicted oldest first. With ``policy="lru"`` an entry gets younger every
+    time it is loaded, with ``policy="fifo"`` only when it is written.
+
+    :param str directory: Directory to keep the entries in. Defaults to
+        the ``HITHERDITHER_CACHE_DIR`` environment variable, or
+        ``~/.cache/hitherdither``.
+    :param int max_bytes: Maximum total size of the entries.
+    :param str policy: Eviction policy, ``"lru"`` or ``"fifo"``.
+
+    """
+
+    def __init__(self, directory=None, max_bytes=2**30, policy="lru"):
+        if policy not in ("lru", "fifo"):
+            raise ValueError("Unknown eviction policy: {0}".format(policy))
+        if directory is None:
+            directory = os.environ.get(
+                "HITHERDITHER_CACHE_DIR",
+                os.path.join(os.path.expanduser("~"), ".cache", "hitherdither"),
+            )
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.policy = policy
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(colours, *params):
+        """Content hash of palette colours and the parameters of a table.
+
+        :param colours: The ``[N x 3]`` palette colours.
+        :param params: Name and parameters of the table, e.g. order, metric
+            and bit depth, with stable ``repr``.
+        :return: A hexadecimal digest.
+
+        """
+        colours = np.ascontiguousarray(colours)
+        digest = hashlib.sha256()
+        digest.update(
+            repr((_DISK_CACHE_VERSION, colours.dtype.str, colours.shape)).encode()
+        )
+        digest.update(colours.tobytes())
+        digest.update(repr(params).encode())
+        return digest.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key)
+
+    def load(self, key):
+        """Load an entry, or return ``None`` if there is none.
+
+        :param str key: The key of the entry, see :meth:`key`.
+        :return: A tuple of read-only memory mapped arrays.
+
+        """
+        path = self._path(key)
+        try:
+            names = sorted(
+                (n for n in os.listdir(path) if n.endswith(".npy")),
+                key=lambda n: int(n[:-4]),
+            )
+            if not names or [int(n[:-4]) for n in names] != list(range(len(names))):
+                # Not an entry written by store, whole.
+                return None
+            arrays = tuple(np.load(os.path.join(path, n), mmap_mode="r") for n in names)
+        except (OSError, IOError, ValueError):
+            return None
+        if self.policy == "lru":
+            try:
+                os.utime(path, None)
+            except OSError:
+                pass
+        return arrays
+
+    def store(self, key, arrays):
+        """Write an entry and evict old entries beyond :attr:`max_bytes`.
+
+        :param str key: The key of the entry, see :meth:`key`.
+        :param arrays: A tuple of arrays.
+
+        """
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+        tmp = tempfile.mkdtemp(prefix=".tmp-", dir=self.directory)
+        try:
+            for n, array in enumerate(arrays):
+                np.save(os.path.join(tmp, "{0}.npy".format(n)), array)
+            os.rename(tmp, self._path(key))
+        except OSError:
+            # Most likely another process stored the same entry first.
+            shutil.rmtree(tmp, ignore_errors=True)
+        self.evict()
+
+    def get(self, key, factory):
+        """Load an entry, building and storing it with ``factory`` if missing.
+
+        :param str key: The key of the entry, see :meth:`key`.
+        :param factory: A callable without arguments returning a tuple of
+            arrays.
+        :return: A tuple of read-only memory mapped arrays, or the arrays
+            built if they could not be stored.
+
+        """
+        with profiling.stage("disk_cache"):
+            arrays = self.load(key)
+        if arrays is not None:
+            self.hits += 1
+            profiling.record_cache("disk_cache", hits=1)
+            return arrays
+        self.misses += 1
+        profiling.record_cache("disk_cache", misses=1)
+        built = tuple(factory())
+        try:
+            self.store(key, built)
+        except OSError:
+            return built
+        arrays = self.load(key)
+        # Entries larger than the whole cache are evicted right away.
+        return built if arrays is None else arrays
+
+    def entries(self):
+        """List the entries in the cache.
+
+        :return: A list of ``(key, size in bytes, age)`` tuples, oldest first,
+            where age is the modification time of the entry.
+
+        """
+        try:
+            keys = [k for k in os.listdir(self.directory) if not k.startswith(".")]
+        except OSError:
+            return []
+        entries = []
+        for key in keys:
+            path = self._path(key)
+            try:
+                size = sum(
+                    os.path.getsize(os.path.join(path, n)) for n in os.listdir(path)
+                )
+                entries.append((key, size, os.path.getmtime(path)))
+            except OSError:
+                continue
+        return sorted(entries, key=lambda entry: entry[2])
+
+    def evict(self):
+        """Remove the oldest entries until the cache fits in :attr:`max_bytes`."""
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        for key, size, _ in entries:
+            if total <= self.max_bytes:
+                break
+            self._remove(key)
+            total -= size
+
+    def clear(self):
+        """Remove all entries."""
+        for key, _, _ in self.entries():
+            self._remove(key)
+        self.hits = 0
+        self.misses = 0
+
+    def _remove(self, key):
+        # Renamed out of place first, so that concurrent loads find either
+        # the whole entry or none. Memory maps of removed files stay valid
+        # where they are open.
+        tmp = os.path.join(self.directory, ".tmp-" + uuid.uuid4().hex)
+        try:
+            os.rename(self._path(key), tmp)
+        except OSError:
+            # Already removed by another process.
+            return
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+_disk_cache = None
+if os.environ.get("HITHERDITHER_CACHE_DIR"):
+    _disk_cache = DiskCache()
+
+
+def get_disk_cache():
+    """Get the disk cache used for palette derived tables, or ``None``.
+
+    It is enabled by default if the ``HITHERDITHER_CACHE_DIR`` environment
+    variable is set.
+
+    """
+    return _disk_cache
+
+
+def set_disk_cache(cache):
+    """Set the disk cache used for palette derived tables.
+
+    :param cache: A :class:`DiskCache`, or ``None`` to disable it.
+
+    """
+    global _disk_cache
+    _disk_cache = cache
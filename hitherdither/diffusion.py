@@ -14,8 +14,15 @@ from __future__ import print_function
 from __future__ import unicode_literals
 from __future__ import absolute_import
 
+import threading
+
 import numpy as np
 
+from hitherdither import profiling
+from hitherdither._jit import jit, HAS_NUMBA
+from hitherdither.spatial import SPATIAL_INDEX_MIN_COLOURS, SUPPORTED_ORDERS
+from hitherdither.utils import index_array
+
 _DIFFUSION_MAPS = {
     "floyd-steinberg": (
         (1, 0, 7 / 16),
@@ -97,12 +104,21 @@ _DIFFUSION_MAPS = {
 }
 
 
-def error_diffusion_dithering(image, palette, method="floyd-steinberg", order=2):
+def error_diffusion_dithering(
+    image,
+    palette,
+    method="floyd-steinberg",
+    order=2,
+    backend="auto",
+    serpentine=False,
+    n_threads=1,
+):
     """Perform image dithering by error diffusion method.
 
-    .. note:: Error diffusion is totally unoptimized and therefore very slow.
-        It is included more as a reference implementation than as a useful
-        method.
+    .. note:: The ``"python"`` backend is totally unoptimized and therefore
+        very slow. It is kept as a reference implementation. If
+        `Numba <https://numba.pydata.org/>`_ is installed, the ``"numba"``
+        backend produces identical output at close to native speed.
 
     Reference:
         http://bisqwit.iki.fi/jutut/kuvat/ordered_dither/error_diffusion.txt
@@ -170,16 +186,98 @@ def error_diffusion_dithering(image, palette, method="floyd-steinberg", order=2)
     :param str method: The error diffusion map to use.
     :param int order: Metric parameter ``ord`` to send to
         :method:`numpy.linalg.norm`.
+    :param str backend: One of ``"python"``, ``"rows"`` or ``"numba"``.
+        The ``"rows"`` backend keeps only a ring buffer of as many float
+        rows as the diffusion map reaches down, converts source rows
+        on demand and diffuses error to the rows below one row at a time.
+        The default, ``"auto"``, uses Numba if it is installed and
+        ``"rows"`` otherwise.
+    :param bool serpentine: Scan odd rows from right to left, with the
+        diffusion map mirrored, instead of always left to right.
+    :param int n_threads: Number of threads to use with the ``"numba"``
+        backend. Rows are then processed as a wavefront: a row only
+        advances over a column once the row above it is done with every
+        pixel that can diffuse error to the same pixels, so the output
+        is identical to that of the serial scan. With ``serpentine``, rows
+        alternate direction and can therefore hardly overlap.
     :return: The error diffusion dithered PIL image of type
         "P" using the input palette.
 
     """
-    ni = np.array(image, "float")
+    return palette.create_PIL_png_from_closest_colour(
+        error_diffusion_dithering_indices(
+            image, palette, method, order, backend, serpentine, n_threads
+        )
+    )
+
+
+def error_diffusion_dithering_indices(
+    image,
+    palette,
+    method="floyd-steinberg",
+    order=2,
+    backend="auto",
+    serpentine=False,
+    n_threads=1,
+    out=None,
+):
+    """Error diffusion dithering to an array of palette colour indices.
+
+    Like :func:`error_diffusion_dithering`, without creating a PIL image.
+    The ``"rows"`` and ``"numba"`` backends read rows from a ``uint8``
+    image array without copying it.
+
+    :param :class:`numpy.ndarray` out: Optional ``[M x N]`` integer array
+        to write the indices to.
+    :return: A ``[M x N]`` array of palette colour indices, ``uint8``
+        (``uint16`` for palettes of more than 256 colours).
 
+    """
     diff_map = _DIFFUSION_MAPS.get(method.lower())
+    if backend == "auto":
+        backend = "numba" if HAS_NUMBA else "rows"
+    if n_threads > 1 and backend != "numba":
+        raise ValueError("Only the numba backend can use several threads.")
+
+    if backend not in ("python", "rows", "numba"):
+        raise ValueError("Unknown error diffusion backend: {0}".format(backend))
+    if backend == "numba" and not HAS_NUMBA:
+        raise ImportError("The numba backend requires Numba to be installed.")
+
+    with profiling.stage("error_diffusion") as stage:
+        with profiling.stage("convert"):
+            ni = np.asarray(image)
+        stage.pixels = ni.shape[0] * ni.shape[1]
+        out = index_array(ni.shape[:2], len(palette), out)
+        if backend == "python":
+            dithered = _error_diffusion_python(ni, palette, diff_map, order, serpentine)
+            # Every pixel is a palette colour, so only the distinct colours
+            # are looked up, by exact distance rather than a lookup table.
+            colours, inverse = np.unique(
+                dithered.reshape((-1, 3)), axis=0, return_inverse=True
+            )
+            indices = np.argmin(palette.image_distance(colours[None]), axis=2)[0]
+            out[...] = indices[inverse.ravel()].reshape(out.shape)
+        elif backend == "rows":
+            _error_diffusion_rows(ni, palette, diff_map, order, serpentine, out)
+        else:
+            _error_diffusion_numba(
+                ni, palette, diff_map, order, serpentine, n_threads, out
+            )
+    return out
+
+
+def _error_diffusion_python(image, palette, diff_map, order, serpentine=False):
+    """Reference implementation of error diffusion dithering.
+
+    :return: The dithered ``[M x N x 3]`` ``uint8`` image.
+
+    """
+    ni = np.array(image, "float")
 
     for y in range(ni.shape[0]):
-        for x in range(ni.shape[1]):
+        step = _scan_step(y, serpentine)
+        for x in range(ni.shape[1])[::step]:
             old_pixel = ni[y, x]
             old_pixel[old_pixel < 0.0] = 0.0
             old_pixel[old_pixel > 255.0] = 255.0
@@ -187,7 +285,378 @@ def error_diffusion_dithering(image, palette, method="floyd-steinberg", order=2)
             quantization_error = old_pixel - new_pixel
             ni[y, x] = new_pixel
             for dx, dy, diffusion_coefficient in diff_map:
-                xn, yn = x + dx, y + dy
+                xn, yn = x + step * dx, y + dy
                 if (0 <= xn < ni.shape[1]) and (0 <= yn < ni.shape[0]):
                     ni[yn, xn] += quantization_error * diffusion_coefficient
-    return palette.create_PIL_png_from_rgb_array(np.array(ni, "uint8"))
+    return np.array(ni, "uint8")
+
+
+def _error_diffusion_rows(image, palette, diff_map, order, serpentine=False, cc=None):
+    """Error diffusion over a rolling buffer of float rows.
+
+    :return: A ``[M x N]`` array of palette colour indices, ``cc`` if
+        given.
+
+    """
+    ni = np.asarray(image)
+    if cc is None:
+        cc = index_array(ni.shape[:2], len(palette))
+    for y, cc_row in _iter_error_diffusion_rows(
+        ni, palette, diff_map, order, serpentine
+    ):
+        cc[y] = cc_row
+    return cc
+
+
+def _iter_error_diffusion_rows(ni, palette, diff_map, order, serpentine=False):
+    """Error diffusion over a rolling buffer of float rows, row by row.
+
+    Row ``y + dy`` is kept in slot ``(y + dy) % n_slots`` of the buffer and
+    converted from the source image when it first receives error. The
+    error of a finished row is spread to the rows below with one shifted
+    array operation per map entry, in an order that adds the contributions
+    to every pixel exactly as the reference implementation does.
+
+    :param ni: The image, an array or any object with a ``shape`` whose
+        rows ``ni[y]`` are requested in increasing order.
+    :return: A generator of ``(y, indices)`` for every row, where indices
+        is a ``[N]`` array of palette colour indices, ``uint8`` (``uint16``
+        for palettes of more than 256 colours).
+
+    """
+    h, w = ni.shape[:2]
+    colours = np.array(palette.colours, "float")
+    if len(palette) >= SPATIAL_INDEX_MIN_COLOURS and order in SUPPORTED_ORDERS:
+        spatial_index = palette.spatial_index(order)
+    else:
+        spatial_index = None
+
+    # Entries within the current row are applied pixel by pixel, the ones
+    # below per row. Sources are scanned in the direction of the map, so
+    # for any target the source with the largest dx comes first.
+    in_row = [(dx, c) for dx, dy, c in diff_map if dy == 0]
+    below = sorted(((dy, -dx, c) for dx, dy, c in diff_map if dy > 0))
+    n_slots = 1 + max([dy for _, dy, _ in diff_map])
+
+    buffer = np.empty((n_slots, w) + tuple(ni.shape[2:]), "float")
+    for y in range(min(n_slots, h)):
+        buffer[y] = ni[y]
+
+    quantization_error = np.empty_like(buffer[0])
+    for y in range(h):
+        row = buffer[y % n_slots]
+        cc_row = index_array((w,), len(palette))
+        step = _scan_step(y, serpentine)
+        for x in range(w)[::step]:
+            old_pixel = row[x]
+            old_pixel[old_pixel < 0.0] = 0.0
+            old_pixel[old_pixel > 255.0] = 255.0
+            if spatial_index is None:
+                index = np.argmin(
+                    np.linalg.norm(old_pixel - colours, ord=order, axis=1)
+                )
+            else:
+                index = spatial_index.query_pixel(old_pixel)
+            cc_row[x] = index
+            error = quantization_error[x]
+            np.subtract(old_pixel, colours[index], out=error)
+            for dx, diffusion_coefficient in in_row:
+                if 0 <= x + step * dx < w:
+                    row[x + step * dx] += error * diffusion_coefficient
+
+        # Row y is done: its slot is recycled for row y + n_slots.
+        if y + n_slots < h:
+            row[:] = ni[y + n_slots]
+        for dy, dx, diffusion_coefficient in below:
+            if y + dy >= h:
+                continue
+            dx = -dx * step
+            target = buffer[(y + dy) % n_slots]
+            if dx >= 0:
+                target[dx:] += quantization_error[: w - dx] * diffusion_coefficient
+            else:
+                target[:dx] += quantization_error[-dx:] * diffusion_coefficient
+        yield y, cc_row
+
+
+def _error_diffusion_numba(
+    image, palette, diff_map, order, serpentine, n_threads, cc=None
+):
+    """Compiled error diffusion, optionally scheduled as a wavefront.
+
+    :return: A ``[M x N]`` array of palette colour indices, ``cc`` if
+        given.
+
+    """
+    ni = np.asarray(image)
+    h, w = ni.shape[:2]
+    dxs, dys, coefs = _diffusion_map_arrays(diff_map)
+    colours = np.array(palette.colours, "float")
+    if cc is None:
+        cc = index_array((h, w), len(palette))
+    n_threads = max(1, min(n_threads, h))
+
+    # Rows y, ..., y + max(dy) are in the buffer while row y is processed.
+    # Each thread in the wavefront needs its own window of rows.
+    n_slots = int(dys.max()) + n_threads
+    buffer = np.empty((n_slots, w) + ni.shape[2:], "float")
+    for y in range(min(int(dys.max()), h)):
+        buffer[y % n_slots] = ni[y]
+
+    if n_threads == 1:
+        _error_diffusion_kernel(
+            ni, buffer, colours, dxs, dys, coefs, float(order), serpentine, cc
+        )
+    else:
+        _Wavefront(
+            ni, buffer, colours, dxs, dys, coefs, float(order), serpentine, cc
+        ).run(n_threads)
+    return cc
+
+
+def _iter_error_diffusion_numba(ni, palette, diff_map, order, serpentine=False):
+    """Compiled error diffusion, row by row.
+
+    See :func:`_iter_error_diffusion_rows` for the parameters. Only the
+    rows of the buffer are held, each row is processed by the compiled
+    kernel of the serial scan.
+
+    """
+    h, w = ni.shape[:2]
+    dxs, dys, coefs = _diffusion_map_arrays(diff_map)
+    colours = np.array(palette.colours, "float")
+    max_dy = int(dys.max())
+    buffer = np.empty((max_dy + 1, w) + tuple(ni.shape[2:]), "float")
+    for y in range(min(max_dy, h)):
+        buffer[y] = ni[y]
+    for y in range(h):
+        if y + max_dy < h:
+            buffer[(y + max_dy) % buffer.shape[0]] = ni[y + max_dy]
+        cc_row = index_array((w,), len(palette))
+        step = _scan_step(y, serpentine)
+        start = 0 if step == 1 else w - 1
+        _diffuse_row_segment(
+            buffer,
+            h,
+            y,
+            start,
+            start + step * w,
+            step,
+            colours,
+            dxs,
+            dys,
+            coefs,
+            float(order),
+            cc_row,
+        )
+        yield y, cc_row
+
+
+class _Wavefront(object):
+    """Runs compiled error diffusion on rows in parallel threads.
+
+    Thread ``k`` processes rows ``k, k + n_threads, ...`` in segments. Row
+    ``y`` may process a segment once row ``y - 1`` is done with all pixels
+    within twice the horizontal reach of the map from it: those pixels
+    are all that diffuse error into the pixels the segment reads from or
+    writes to, so every pixel receives its error in serial scan order.
+
+    """
+
+    def __init__(self, ni, buffer, colours, dxs, dys, coefs, order, serpentine, cc):
+        self.ni = ni
+        self.buffer = buffer
+        self.colours = colours
+        self.dxs = dxs
+        self.dys = dys
+        self.coefs = coefs
+        self.order = order
+        self.serpentine = serpentine
+        self.cc = cc
+        self.reach = int(np.abs(dxs).max())
+        self.segment = max(64, 4 * self.reach)
+        self.progress = [0] * ni.shape[0]
+        self.condition = threading.Condition()
+        self.error = None
+
+    def run(self, n_threads):
+        threads = [
+            threading.Thread(target=self._process_rows, args=(k, n_threads))
+            for k in range(n_threads)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        if self.error is not None:
+            raise self.error
+
+    def _process_rows(self, first_row, n_threads):
+        h, w = self.ni.shape[:2]
+        max_dy = int(self.dys.max())
+        try:
+            for y in range(first_row, h, n_threads):
+                if y + max_dy < h:
+                    self.buffer[(y + max_dy) % self.buffer.shape[0]] = self.ni[
+                        y + max_dy
+                    ]
+                step = _scan_step(y, self.serpentine)
+                for done in range(0, w, self.segment):
+                    n = min(self.segment, w - done)
+                    start = done if step == 1 else w - 1 - done
+                    stop = start + step * n
+                    if y > 0:
+                        lo, hi = sorted((start, stop - step))
+                        self._wait_for(y - 1, lo - 2 * self.reach, hi + 2 * self.reach)
+                    _diffuse_row_segment(
+                        self.buffer,
+                        self.ni.shape[0],
+                        y,
+                        start,
+                        stop,
+                        step,
+                        self.colours,
+                        self.dxs,
+                        self.dys,
+                        self.coefs,
+                        self.order,
+                        self.cc[y],
+                    )
+                    with self.condition:
+                        self.progress[y] = done + n
+                        self.condition.notify_all()
+        except BaseException as e:
+            with self.condition:
+                self.error = e
+                # Release all waiting threads; the result is discarded.
+                self.progress = [w] * h
+                self.condition.notify_all()
+
+    def _wait_for(self, y, lo, hi):
+        """Wait until row ``y`` has processed columns ``lo`` to ``hi``."""
+        w = self.ni.shape[1]
+        if _scan_step(y, self.serpentine) == 1:
+            needed = min(w, hi + 1)
+        else:
+            needed = w - max(0, lo)
+        with self.condition:
+            while self.progress[y] < needed:
+                self.condition.wait()
+
+
+def _scan_step(y, serpentine):
+    """Scan direction of row ``y``, ``1`` for left to right."""
+    return -1 if (serpentine and y % 2) else 1
+
+
+def _diffusion_map_arrays(diff_map):
+    """Split a diffusion map into ``dx``, ``dy`` and coefficient arrays."""
+    dxs = np.array([d[0] for d in diff_map], "int64")
+    dys = np.array([d[1] for d in diff_map], "int64")
+    coefs = np.array([d[2] for d in diff_map], "float")
+    return dxs, dys, coefs
+
+
+@jit
+def _pixel_distance(pixel, colour, order):
+    """Distance between two colours, computed as :func:`numpy.linalg.norm`
+    does it for vectors, so that results are bit for bit identical."""
+    n = pixel.shape[0]
+    if order == 2.0:
+        s = 0.0
+        for k in range(n):
+            d = pixel[k] - colour[k]
+            s += d * d
+        return np.sqrt(s)
+    elif order == 1.0:
+        s = 0.0
+        for k in range(n):
+            s += abs(pixel[k] - colour[k])
+        return s
+    elif order == np.inf:
+        s = abs(pixel[0] - colour[0])
+        for k in range(1, n):
+            s = max(s, abs(pixel[k] - colour[k]))
+        return s
+    elif order == -np.inf:
+        s = abs(pixel[0] - colour[0])
+        for k in range(1, n):
+            s = min(s, abs(pixel[k] - colour[k]))
+        return s
+    elif order == 0.0:
+        s = 0.0
+        for k in range(n):
+            if pixel[k] != colour[k]:
+                s += 1.0
+        return s
+    else:
+        s = 0.0
+        for k in range(n):
+            s += abs(pixel[k] - colour[k]) ** order
+        return s ** (1.0 / order)
+
+
+@jit
+def _closest_colour_index(pixel, colours, order):
+    """Index of the first palette colour closest to ``pixel``."""
+    best = 0
+    best_distance = _pixel_distance(pixel, colours[0], order)
+    for i in range(1, colours.shape[0]):
+        distance = _pixel_distance(pixel, colours[i], order)
+        if distance < best_distance:
+            best = i
+            best_distance = distance
+    return best
+
+
+@jit
+def _diffuse_row_segment(
+    buffer, h, y, start, stop, step, colours, dxs, dys, coefs, order, cc_row
+):
+    """Compiled error diffusion of columns ``start`` to ``stop`` of row ``y``.
+
+    Row ``y + dy`` is expected in slot ``(y + dy) % n_slots`` of the float
+    row buffer. Mirrors :func:`_error_diffusion_python` operation by
+    operation and writes the chosen palette indices to ``cc_row``.
+
+    """
+    n_slots, w, c = buffer.shape
+    row = buffer[y % n_slots]
+    quantization_error = np.empty(c)
+    for x in range(start, stop, step):
+        for k in range(c):
+            if row[x, k] < 0.0:
+                row[x, k] = 0.0
+            elif row[x, k] > 255.0:
+                row[x, k] = 255.0
+        index = _closest_colour_index(row[x], colours, order)
+        for k in range(c):
+            quantization_error[k] = row[x, k] - colours[index, k]
+        for m in range(dxs.shape[0]):
+            xn, yn = x + step * dxs[m], y + dys[m]
+            if (0 <= xn < w) and (yn < h):
+                target = buffer[yn % n_slots]
+                for k in range(c):
+                    target[xn, k] += quantization_error[k] * coefs[m]
+        cc_row[x] = index
+
+
+@jit
+def _error_diffusion_kernel(
+    ni, buffer, colours, dxs, dys, coefs, order, serpentine, cc
+):
+    """Compiled serial error diffusion over a buffer of float rows."""
+    h, w = ni.shape[0], ni.shape[1]
+    n_slots = buffer.shape[0]
+    max_dy = dys.max()
+    for y in range(h):
+        if y + max_dy < h:
+            buffer[(y + max_dy) % n_slots] = ni[y + max_dy]
+        if serpentine and y % 2:
+            _diffuse_row_segment(
+                buffer, h, y, w - 1, -1, -1, colours, dxs, dys, coefs, order, cc[y]
+            )
+        else:
+            _diffuse_row_segment(
+                buffer, h, y, 0, w, 1, colours, dxs, dys, coefs, order, cc[y]
+            )
@@ -1,3 +1,16 @@
-from . import bayer
-from . import yliluoma
-from . import cluster
+from __future__ import absolute_import
+
+import importlib
+
+# Submodules are imported on first access.
+__all__ = ["bayer", "blue_noise", "cluster", "threshold", "yliluoma"]
+
+
+def __getattr__(name):
+    if name in __all__:
+        return importlib.import_module("." + name, __name__)
+    raise AttributeError("module {0!r} has no attribute {1!r}".format(__name__, name))
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
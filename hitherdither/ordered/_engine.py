@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+_engine
+-----------
+
+Shared implementation of threshold matrix ordered dithering.
+
+"""
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+from __future__ import absolute_import
+
+import numpy as np
+
+from hitherdither import profiling
+from hitherdither import threads
+from hitherdither.utils import index_array
+
+
+def ordered_dithering(
+    image, palette, threshold_matrix, thresholds, order=2, max_bytes=2**22
+):
+    """Map an image to a palette after adding a tiled threshold matrix.
+
+    Every pixel gets ``threshold_matrix[y % h, x % w] * thresholds`` added,
+    rounded to whole levels, before it is mapped to its closest palette
+    colour. The addition is done in ``int16``, which holds the sum of two
+    ``uint8`` values, one band of rows at a time into a reused buffer, with
+    the threshold matrix tiled once over the width of the image. Apart
+    from the output, memory use is bounded by ``max_bytes``, per thread if
+    the bands are dithered by the threads of :mod:`hitherdither.threads`.
+
+    :param image: The image to dither, a :class:`PIL.Image` or array.
+    :param :class:`~hitherdither.colour.Palette` palette: The palette to use.
+    :param threshold_matrix: ``[h x w]`` matrix of factors in ``[0, 1]``.
+    :param thresholds: Thresholds to apply dithering at, per channel.
+    :param int order: Metric parameter ``ord`` to send to
+        :func:`numpy.linalg.norm` when mapping to the palette.
+    :param int max_bytes: Approximate memory budget for a band of rows.
+    :return: A ``[M x N]`` array of palette colour indices, ``uint8``
+        (``uint16`` for palettes of more than 256 colours).
+
+    """
+    return _OrderedDithering(palette, threshold_matrix, thresholds, order, max_bytes)(
+        image
+    )
+
+
+class _OrderedDithering(object):
+    """Ordered dithering with its tables kept for consecutive images.
+
+    The tiled threshold matrix and the band buffer are built for the first
+    image and reused for following images of the same or a smaller width,
+    such as the tiles of a larger image.
+
+    """
+
+    def __init__(self, palette, threshold_matrix, thresholds, order=2, max_bytes=2**22):
+        self.palette = palette
+        self.order = order
+        self.max_bytes = max_bytes
+        threshold_matrix = np.asarray(threshold_matrix, "float")
+        thresholds = np.array(thresholds, "uint8").reshape(-1)
+        # Images processed in parts must be split on multiples of period.
+        self.period, self.matrix_width = threshold_matrix.shape
+        self.addend = np.rint(threshold_matrix[:, :, None] * thresholds).astype("int16")
+        self.tile = None
+        self.buffer = None
+
+    def _tile(self, width):
+        if self.tile is None or self.tile.shape[1] < width:
+            n_tiles = -(-width // self.matrix_width)
+            self.tile = np.tile(self.addend, (1, n_tiles, 1))
+        return self.tile[:, :width]
+
+    def _buffer(self, n_rows, width, n_channels):
+        size = n_rows * width * n_channels
+        if self.buffer is None or self.buffer.size < size:
+            self.buffer = np.empty(size, "int16")
+        return self.buffer[:size].reshape((n_rows, width, n_channels))
+
+    def __call__(self, image, out=None):
+        """Dither an image.
+
+        :param image: The image to dither, a :class:`PIL.Image` or array.
+        :param out: Optional ``[M x N]`` integer array to write the
+            indices to.
+        :return: A ``[M x N]`` array of palette colour indices.
+
+        """
+        with profiling.stage("ordered_dithering") as stage:
+            with profiling.stage("convert"):
+                ni = np.asarray(image, "uint8")
+            stage.pixels = ni.shape[0] * ni.shape[1]
+            return self._dither(ni, out)
+
+    def _dither(self, ni, out):
+        if ni.ndim == 2:
+            ni = ni[:, :, None]
+        height, width = ni.shape[:2]
+        n_channels = max(ni.shape[2], self.addend.shape[2])
+        period = self.period
+        tile = self._tile(width)
+
+        # The int16 buffer and the temporaries of the palette mapping, per row.
+        bytes_per_row = width * (2 * n_channels + 8 * (len(self.palette) + 7))
+        n_rows = threads.band_rows(
+            height, width, int(self.max_bytes // bytes_per_row), period
+        )
+        out = index_array((height, width), len(self.palette), out)
+        if threads.active():
+            # Every band gets its own buffer, and the palette tables are
+            # built before the threads need them.
+            buffer = None
+            self.palette._closest_colour(
+                np.zeros((1, 1, n_channels), "int16"), self.order
+            )
+        else:
+            buffer = self._buffer(min(n_rows, height), width, n_channels)
+
+        def dither_band(start):
+            band = ni[start : start + n_rows]
+            if buffer is None:
+                summed = np.empty((len(band), width, n_channels), "int16")
+            else:
+                summed = buffer[: len(band)]
+            # Bands start on a period of the matrix, so whole periods of rows
+            # get the tile added at once.
+            full = len(band) // period * period
+            if full:
+                shape = (full // period, period, width, n_channels)
+                np.add(
+                    band[:full].reshape(shape[:3] + band.shape[2:]),
+                    tile,
+                    out=summed[:full].reshape(shape),
+                )
+            np.add(band[full:], tile[: len(band) - full], out=summed[full:])
+            out[start : start + len(band)] = self.palette._image_closest_colour(
+                summed, self.order
+            )
+
+        threads.for_each(dither_band, range(0, height, n_rows))
+        return out
@@ -13,58 +13,72 @@ from __future__ import print_function
 from __future__ import unicode_literals
 from __future__ import absolute_import
 
+import functools
+
 import numpy as np
 
+from ._engine import _OrderedDithering
+
 
 def B(n, transposed=False):
     """Get the Bayer matrix with side of length ``n``.
 
-    Will only work if ``n`` is a power of 2.
+    Will only work if ``n`` is a power of 2. The matrix is computed once
+    per ``n`` and ``transposed`` and returned read-only.
 
     Reference: http://caca.zoy.org/study/part2.html
 
     :param int n: Power of 2 side length of matrix.
+    :param bool transposed: If the transposed matrix should be returned.
     :return: The Bayer matrix.
 
     """
-    return (1 + I(n, transposed)) / (1 + (n * n))
+    return _bayer_matrix(n, bool(transposed))
 
 
 def I(n, transposed=False):
     """Get the index matrix with side of length ``n``.
 
-    Will only work if ``n`` is a power of 2.
+    Will only work if ``n`` is a power of 2. The matrix is computed once
+    per ``n`` and ``transposed`` and returned read-only.
 
     Reference: http://caca.zoy.org/study/part2.html
 
     :param int n: Power of 2 side length of matrix.
-    :param bool transposed:
+    :param bool transposed: If the transposed matrix should be returned.
     :return: The index matrix.
 
     """
-    if n == 0:
-        return np.array([[0, 0], [0, 0]], "int")
-    if n == 2:
-        if transposed:
-            return np.array([[0, 3], [2, 1]], "int")
-        else:
-            return np.array([[0, 2], [3, 1]], "int")
-    else:
-        smaller_I = I(n >> 1, transposed)
-        if transposed:
-            return np.bmat(
-                [
-                    [4 * smaller_I, 4 * smaller_I + 3],
-                    [4 * smaller_I + 2, 4 * smaller_I + 1],
-                ]
-            )
-        else:
-            return np.bmat(
-                [
-                    [4 * smaller_I, 4 * smaller_I + 2],
-                    [4 * smaller_I + 3, 4 * smaller_I + 1],
-                ]
-            )
+    return _index_matrix(n, bool(transposed))
+
+
+@functools.lru_cache(maxsize=None)
+def _bayer_matrix(n, transposed):
+    matrix = (1 + _index_matrix(n, transposed)) / (1 + (n * n))
+    matrix.setflags(write=False)
+    return matrix
+
+
+@functools.lru_cache(maxsize=None)
+def _index_matrix(n, transposed):
+    if n < 1 or n & (n - 1):
+        raise ValueError("The side length must be a power of 2: {0}".format(n))
+    # The index matrix of side 2n is made of four copies of the one of side
+    # n, times 4, plus [[0, 2], [3, 1]]. Unrolled, every bit b of the row
+    # and column of an element, counted from the least significant of the
+    # k bits, adds the entry of [[0, 2], [3, 1]] picked by those bits,
+    # 2 * (x_b ^ y_b) + y_b, times 4 ** (k - 1 - b).
+    k = n.bit_length() - 1
+    y = np.arange(n)[:, None]
+    x = np.arange(n)[None, :]
+    if transposed:
+        x, y = y, x
+    matrix = np.zeros((n, n), "int")
+    for b in range(k):
+        x_b, y_b = (x >> b) & 1, (y >> b) & 1
+        matrix += (2 * (x_b ^ y_b) + y_b) << (2 * (k - 1 - b))
+    matrix.setflags(write=False)
+    return matrix
 
 
 def bayer_dithering(image, palette, thresholds, order=8):
@@ -73,18 +87,31 @@ def bayer_dithering(image, palette, thresholds, order=8):
     :param :class:`PIL.Image` image: The image to apply
         Bayer ordered dithering to.
     :param :class:`~hitherdither.colour.Palette` palette: The palette to use.
-    :param thresholds: Thresholds to apply dithering at.
+    :param thresholds: Thresholds to apply dithering at. The threshold
+        offsets are rounded to whole levels, see
+        :func:`~hitherdither.ordered._engine.ordered_dithering`.
     :param int order: The size of the Bayer matrix.
     :return:  The Bayer matrix dithered PIL image of type "P"
         using the input palette.
 
     """
-    bayer_matrix = B(order)
-    ni = np.array(image, "uint8")
-    thresholds = np.array(thresholds, "uint8")
-    xx, yy = np.meshgrid(range(ni.shape[1]), range(ni.shape[0]))
-    xx %= order
-    yy %= order
-    factor_threshold_matrix = np.expand_dims(bayer_matrix[yy, xx], axis=2) * thresholds
-    new_image = ni + factor_threshold_matrix
-    return palette.create_PIL_png_from_rgb_array(new_image)
+    cc = bayer_dithering_indices(image, palette, thresholds, order)
+    return palette.create_PIL_png_from_closest_colour(cc)
+
+
+def bayer_dithering_indices(image, palette, thresholds, order=8, out=None):
+    """Bayer ordered dithering to an array of palette colour indices.
+
+    Like :func:`bayer_dithering`, without creating a PIL image. A ``uint8``
+    image array is used without copying.
+
+    :param image: The image to dither, a :class:`PIL.Image` or array.
+    :param :class:`~hitherdither.colour.Palette` palette: The palette to use.
+    :param thresholds: Thresholds to apply dithering at.
+    :param int order: The size of the Bayer matrix.
+    :param :class:`numpy.ndarray` out: Optional ``[M x N]`` ``uint8`` array
+        to write the indices to.
+    :return: A ``[M x N]`` array of palette colour indices.
+
+    """
+    return _OrderedDithering(palette, B(order), thresholds)(image, out)
@@ -0,0 +1,187 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+blue_noise
+-----------
+
+Ordered dithering with blue noise threshold matrices made by the
+void-and-cluster method.
+
+Reference: Ulichney, R., "The void-and-cluster method for dither array
+generation", Proc. SPIE 1913, 1993.
+
+"""
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+from __future__ import absolute_import
+
+import functools
+
+import numpy as np
+
+from .. import cache
+from .. import profiling
+from ._engine import _OrderedDithering
+
+
+def blue_noise_dithering(image, palette, thresholds, shape=64, sigma=1.5, seed=0):
+    """Render the image using a blue noise threshold matrix.
+
+    Blue noise matrices have no visible period and no low frequency
+    structure, so the result looks like error diffusion at the speed of
+    Bayer dithering.
+
+    :param :class:`PIL.Image` image: The image to apply the
+        ordered dithering to.
+    :param :class:`~hitherdither.colour.Palette` palette: The palette to use.
+    :param thresholds: Thresholds to apply dithering at. The threshold
+        offsets are rounded to whole levels, see
+        :func:`~hitherdither.ordered._engine.ordered_dithering`.
+    :param shape: Side length, or ``(height, width)``, of the matrix.
+    :param float sigma: Standard deviation of the Gaussian filter that
+        measures clusters and voids, see :func:`void_and_cluster`.
+    :param int seed: Seed of the initial random pattern.
+    :return:  The dithered PIL image of type "P" using the input palette.
+
+    """
+    cc = blue_noise_dithering_indices(image, palette, thresholds, shape, sigma, seed)
+    return palette.create_PIL_png_from_closest_colour(cc)
+
+
+def blue_noise_dithering_indices(
+    image, palette, thresholds, shape=64, sigma=1.5, seed=0, out=None
+):
+    """Blue noise ordered dithering to an array of palette colour indices.
+
+    Like :func:`blue_noise_dithering`, without creating a PIL image. A
+    ``uint8`` image array is used without copying.
+
+    :param :class:`numpy.ndarray` out: Optional ``[M x N]`` ``uint8`` array
+        to write the indices to.
+    :return: A ``[M x N]`` array of palette colour indices.
+
+    """
+    matrix = blue_noise_matrix(shape, sigma, seed)
+    return _OrderedDithering(palette, matrix, thresholds)(image, out)
+
+
+def blue_noise_matrix(shape=64, sigma=1.5, seed=0):
+    """Get a blue noise threshold matrix.
+
+    The matrix is made by :func:`void_and_cluster` once per set of
+    parameters and returned read-only. It is also kept in the disk cache,
+    if one is set with :func:`hitherdither.cache.set_disk_cache`, as it
+    takes a while to make for large sizes.
+
+    :param shape: Side length, or ``(height, width)``, of the matrix.
+    :param float sigma: Standard deviation of the Gaussian filter.
+    :param int seed: Seed of the initial random pattern.
+    :return: A ``[height x width]`` matrix with the values
+        ``(1 + rank) / (1 + height * width)``, as for
+        :func:`~hitherdither.ordered.bayer.B`.
+
+    """
+    if np.isscalar(shape):
+        shape = (shape, shape)
+    return _blue_noise_matrix(tuple(int(s) for s in shape), float(sigma), int(seed))
+
+
+@functools.lru_cache(maxsize=None)
+def _blue_noise_matrix(shape, sigma, seed):
+    def build():
+        ranks = void_and_cluster(shape, sigma, seed)
+        return ((1.0 + ranks) / (1.0 + ranks.size),)
+
+    disk_cache = cache.get_disk_cache()
+    if disk_cache is None:
+        (matrix,) = build()
+        matrix.setflags(write=False)
+    else:
+        # Not derived from a palette, so keyed by the parameters only.
+        key = disk_cache.key(
+            np.empty((0, 3), "uint8"), "blue_noise", shape, sigma, seed
+        )
+        (matrix,) = disk_cache.get(key, build)
+    return matrix
+
+
+def void_and_cluster(shape, sigma=1.5, seed=0):
+    """Rank the elements of a matrix by the void-and-cluster method.
+
+    Clusters and voids of a binary pattern are measured by filtering the
+    pattern with a Gaussian, on a torus so that the matrix tiles without
+    seams. A random pattern of a tenth of the elements is first evened
+    out by moving the one in the tightest cluster to the largest void,
+    until that is where it came from. Ones are then removed from the
+    tightest cluster in turn, ranked from the number of ones down, and
+    ones are added to the largest void in turn, ranked from it up, until
+    the matrix is full. As the filter has a constant sum, the largest void
+    is also the tightest cluster of zeros, so there is no separate phase
+    for the zeros.
+
+    The filter is applied to the initial pattern with FFTs. Adding or
+    removing a one adds or subtracts the filter centred on it, read from
+    a view of a doubled, precomputed filter, so every step takes a few
+    passes over the matrix.
+
+    :param shape: ``(height, width)`` of the matrix.
+    :param float sigma: Standard deviation of the Gaussian filter, in
+        elements.
+    :param int seed: Seed of the initial random pattern.
+    :return: A ``[height x width]`` integer matrix of the ranks
+        ``0`` to ``height * width - 1``.
+
+    """
+    height, width = shape
+    size = height * width
+    with profiling.stage("void_and_cluster", size):
+        dy = np.minimum(np.arange(height), height - np.arange(height))
+        dx = np.minimum(np.arange(width), width - np.arange(width))
+        kernel = np.exp(-(dy[:, None] ** 2 + dx[None, :] ** 2) / (2.0 * sigma**2))
+        # The filter centred on (y, x) is doubled[height - y :, width - x :].
+        doubled = np.tile(kernel, (2, 2))
+        kernel_fft = np.fft.rfft2(kernel)
+
+        def filtered(pattern):
+            return np.fft.irfft2(np.fft.rfft2(pattern) * kernel_fft, s=shape)
+
+        def centred(position):
+            y, x = divmod(position, width)
+            return doubled[height - y : 2 * height - y, width - x : 2 * width - x]
+
+        rng = np.random.RandomState(seed)
+        pattern = np.zeros(shape, "bool")
+        n_ones = max(1, size // 10)
+        pattern.flat[rng.choice(size, n_ones, replace=False)] = True
+
+        # Even out the initial pattern.
+        energy = filtered(pattern)
+        for _ in range(size):
+            cluster = np.argmax(np.where(pattern, energy, -np.inf))
+            pattern.flat[cluster] = False
+            energy -= centred(cluster)
+            void = np.argmin(np.where(pattern, np.inf, energy))
+            pattern.flat[void] = True
+            energy += centred(void)
+            if void == cluster:
+                break
+
+        ranks = np.empty(size, "intp")
+        # Rank the ones, tightest cluster last.
+        energy = np.where(pattern, filtered(pattern), -np.inf)
+        for rank in range(n_ones - 1, -1, -1):
+            cluster = np.argmax(energy)
+            ranks[cluster] = rank
+            energy.flat[cluster] = -np.inf
+            energy -= centred(cluster)
+
+        # Rank the zeros, largest void first.
+        energy = np.where(pattern, np.inf, filtered(pattern))
+        for rank in range(n_ones, size):
+            void = np.argmin(energy)
+            ranks[void] = rank
+            energy.flat[void] = np.inf
+            energy += centred(void)
+        return ranks.reshape(shape)
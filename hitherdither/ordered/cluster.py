@@ -15,6 +15,8 @@ from __future__ import absolute_import
 
 import numpy as np
 
+from ._engine import _OrderedDithering
+
 _CLUSTER_DOT_MATRICES = {
     4: np.array([[12, 5, 6, 13], [4, 0, 1, 7], [11, 3, 2, 8], [15, 10, 9, 14]], "float")
     / 16.0,
@@ -45,23 +47,47 @@ def cluster_dot_dithering(image, palette, thresholds, order=4):
     :param :class:`PIL.Image` image: The image to apply the
         ordered dithering to.
     :param :class:`~hitherdither.colour.Palette` palette: The palette to use.
-    :param thresholds: Thresholds to apply dithering at.
-    :param int order: The size of the Bayer matrix.
+    :param thresholds: Thresholds to apply dithering at. The threshold
+        offsets are rounded to whole levels, see
+        :func:`~hitherdither.ordered._engine.ordered_dithering`.
+    :param order: The size of the cluster dot matrix, 4, 8 or ``(5, 3)``
+        for the 5 wide and 3 high line screen.
     :return:  The Bayer matrix dithered PIL image of type "P"
         using the input palette.
 
     """
 
+    cc = cluster_dot_dithering_indices(image, palette, thresholds, order)
+    return palette.create_PIL_png_from_closest_colour(cc)
+
+
+def cluster_dot_dithering_indices(image, palette, thresholds, order=4, out=None):
+    """Cluster dot ordered dithering to an array of palette colour indices.
+
+    Like :func:`cluster_dot_dithering`, without creating a PIL image. A
+    ``uint8`` image array is used without copying.
+
+    :param image: The image to dither, a :class:`PIL.Image` or array.
+    :param :class:`~hitherdither.colour.Palette` palette: The palette to use.
+    :param thresholds: Thresholds to apply dithering at.
+    :param order: The size of the cluster dot matrix, 4, 8 or ``(5, 3)``.
+    :param :class:`numpy.ndarray` out: Optional ``[M x N]`` ``uint8`` array
+        to write the indices to.
+    :return: A ``[M x N]`` array of palette colour indices.
+
+    """
+    return _OrderedDithering(palette, _cluster_dot_matrix(order), thresholds)(
+        image, out
+    )
+
+
+def _cluster_dot_matrix(order):
+    if isinstance(order, list):
+        # E.g. (5, 3) from parameters read as JSON.
+        order = tuple(order)
     cluster_dot_matrix = _CLUSTER_DOT_MATRICES.get(order)
     if cluster_dot_matrix is None:
-        raise NotImplementedError("Only order 4 and 8 is implemented as of yet.")
-    ni = np.array(image, "uint8")
-    thresholds = np.array(thresholds, "uint8")
-    xx, yy = np.meshgrid(range(ni.shape[1]), range(ni.shape[0]))
-    xx %= order
-    yy %= order
-    factor_threshold_matrix = (
-        np.expand_dims(cluster_dot_matrix[yy, xx], axis=2) * thresholds
-    )
-    new_image = ni + factor_threshold_matrix
-    return palette.create_PIL_png_from_rgb_array(new_image)
+        raise NotImplementedError(
+            "Only order 4, 8 and (5, 3) is implemented as of yet."
+        )
+    return cluster_dot_matrix
@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+threshold
+-----------
+
+Ordered dithering with any threshold matrix, e.g. one of
+:func:`~hitherdither.ordered.bayer.B`,
+:func:`~hitherdither.ordered.blue_noise.blue_noise_matrix` or one loaded
+from a file.
+
+"""
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+from __future__ import absolute_import
+
+from ._engine import _OrderedDithering
+
+
+def threshold_map_dithering(image, palette, threshold_matrix, thresholds, order=2):
+    """Render the image using a tiled threshold matrix.
+
+    :param :class:`PIL.Image` image: The image to apply the
+        ordered dithering to.
+    :param :class:`~hitherdither.colour.Palette` palette: The palette to use.
+    :param threshold_matrix: ``[h x w]`` matrix of factors in ``[0, 1]``,
+        which need not be square.
+    :param thresholds: Thresholds to apply dithering at. The threshold
+        offsets are rounded to whole levels, see
+        :func:`~hitherdither.ordered._engine.ordered_dithering`.
+    :param int order: Metric parameter ``ord`` to send to
+        :func:`numpy.linalg.norm` when mapping to the palette.
+    :return:  The dithered PIL image of type "P" using the input palette.
+
+    """
+    cc = threshold_map_dithering_indices(
+        image, palette, threshold_matrix, thresholds, order
+    )
+    return palette.create_PIL_png_from_closest_colour(cc)
+
+
+def threshold_map_dithering_indices(
+    image, palette, threshold_matrix, thresholds, order=2, out=None
+):
+    """Threshold matrix ordered dithering to an array of palette colour indices.
+
+    Like :func:`threshold_map_dithering`, without creating a PIL image. A
+    ``uint8`` image array is used without copying.
+
+    :param :class:`numpy.ndarray` out: Optional ``[M x N]`` ``uint8`` array
+        to write the indices to.
+    :return: A ``[M x N]`` array of palette colour indices.
+
+    """
+    return _OrderedDithering(palette, threshold_matrix, thresholds, order)(image, out)
@@ -1 +1,4 @@
-from ._algorithm_one import yliluomas_1_ordered_dithering
+from ._algorithm_one import (
+    yliluomas_1_ordered_dithering,
+    yliluomas_1_ordered_dithering_indices,
+)
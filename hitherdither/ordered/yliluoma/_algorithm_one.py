@@ -15,48 +15,148 @@ from __future__ import unicode_literals
 
 import numpy as np
 
-from ._utils import color_compare, CCIR_LUMINOSITY
+from ._utils import color_compare, luminosity, CCIR_LUMINOSITY
 from ..bayer import I
+from ..._jit import jit, HAS_NUMBA
+from ... import profiling
+from ... import threads
+from ...cache import LRUCache
+from ...utils import index_array
 
+# Number of pixels in a band of rows processed together.
+_BAND_PIXELS = 2**18
 
-def _get_mixing_plan_matrix(palette, order=8):
-    mixing_matrix = []
-    colours = {}
-    colour_component_distances = []
-
-    nn = order * order
-    for i in range(len(palette)):
-        for j in range(i, len(palette)):
-            for ratio in range(0, nn):
-                if i == j and ratio != 0:
-                    break
-                # Determine the two component colors.
-                c_mix = _colour_combine(palette, i, j, ratio / nn)
-                hex_colour = palette.rgb2hex(*c_mix.tolist())
-                colours[hex_colour] = (i, j, ratio / nn)
-                mixing_matrix.append(c_mix)
-
-                c1 = np.array(palette[i], "int")
-                c2 = np.array(palette[j], "int")
-                cmpval = (
-                    color_compare(c1, c2)
-                    * 0.1
-                    * (np.abs((ratio / float(nn)) - 0.5) + 0.5)
-                )
-                colour_component_distances.append(cmpval)
 
-    mixing_matrix = np.array(mixing_matrix)
-    colour_component_distances = np.array(colour_component_distances)
+class _MixingPlans(object):
+    """Enumeration of the mixing plans of a palette.
+
+    Plan ``(i, j, ratio)`` mixes palette colours ``i <= j`` in proportion
+    ``ratio = r / order ** 2`` for ``r`` in ``range(order ** 2)``, with only
+    ``r = 0`` for ``i == j``. Plans are numbered in that order, so the plan
+    of any index can be computed without building the table of all plans.
+
+    """
+
+    def __init__(self, n_colours, order=8):
+        self.nn = order * order
+        self.pair_i, self.pair_j = np.triu_indices(n_colours)
+        counts = np.where(self.pair_i == self.pair_j, 1, self.nn)
+        self.offsets = np.concatenate(([0], np.cumsum(counts)))
+
+    def __len__(self):
+        return int(self.offsets[-1])
+
+    def locate(self, indices):
+        """Get the colour pairs and ratios of an array of plan indices.
+
+        :return: Indices into :attr:`pair_i` and :attr:`pair_j`, and ratios.
+
+        """
+        indices = np.asarray(indices)
+        pair = np.searchsorted(self.offsets, indices, side="right") - 1
+        return pair, (indices - self.offsets[pair]) / self.nn
+
+    def __getitem__(self, indices):
+        """Get the plans of an array of plan indices.
+
+        :return: A structured array with fields ``i``, ``j`` and ``ratio``.
+
+        """
+        pair, ratio = self.locate(indices)
+        plans = np.empty(
+            ratio.shape, dtype=[("i", "intp"), ("j", "intp"), ("ratio", "float")]
+        )
+        plans["i"] = self.pair_i[pair]
+        plans["j"] = self.pair_j[pair]
+        plans["ratio"] = ratio
+        return plans
+
+
+def _get_mixing_plan_matrix(palette, order=8, start=0, stop=None):
+    """Build the mixed colours of the mixing plans of a palette.
+
+    All plans are built at once with array operations. For large palettes,
+    where the ``O(N^2 order^2)`` table gets big, ``start`` and ``stop``
+    select a range of plan indices to build on demand.
+
+    :param :class:`~hitherdither.colour.Palette` palette: The palette to use.
+    :param int order: Square root of the number of ratios to mix in.
+    :param int start: Index of the first plan to build.
+    :param int stop: Index after the last plan to build, by default the
+        number of plans.
+    :return: The ``[M x 3]`` ``uint8`` mixed colours, the ``[M]`` weighted
+        distances between their component colours and the ``[M]`` plans,
+        a structured array with fields ``i``, ``j`` and ``ratio``.
+
+    """
+    mixing_plans = _MixingPlans(len(palette), order)
+    if stop is None:
+        stop = len(mixing_plans)
+    with profiling.stage("mixing_plans"):
+        return _build_mixing_plan_matrix(palette, mixing_plans, start, stop)
+
+
+def _build_mixing_plan_matrix(palette, mixing_plans, start, stop):
+    indices = np.arange(start, stop)
+    pair, ratio = mixing_plans.locate(indices)
+
+    # Plans of a range are consecutive, so only the pairs in between are
+    # compared, once each rather than once per ratio.
+    pairs = slice(pair[0], pair[-1] + 1) if len(pair) else slice(0, 0)
+    colours = np.array(palette.colours, "int")
+    c1 = colours[mixing_plans.pair_i[pairs]]
+    c2 = colours[mixing_plans.pair_j[pairs]]
+    pair_distances = color_compare(c1, c2)
+    pair -= pairs.start
+
+    c1, c2 = c1[pair], c2[pair]
+    mixing_matrix = np.array(c1 + ratio[:, None] * (c2 - c1), "uint8")
+    colour_component_distances = (
+        pair_distances[pair] * 0.1 * (np.abs(ratio - 0.5) + 0.5)
+    )
+    return mixing_matrix, colour_component_distances, mixing_plans[indices]
+
+
+def _mixing_plan_matrix(palette):
+    """The mixed colours, component distances and luminosity tables kept
+    with a palette.
+
+    They are kept in the disk cache, if one is set, so that processes
+    using it map one read-only copy instead of building their own.
+
+    :return: The ``[M x 3]`` ``uint8`` mixed colours, the ``[M]``
+        component distances and the tables of :func:`_luma_tables`.
+
+    """
+
+    def build():
+        mixing_matrix, distances, _ = _get_mixing_plan_matrix(palette)
+        return (mixing_matrix, distances) + _luma_tables(mixing_matrix)
+
+    return palette.derived(("yliluoma_1_mixing_tables", 8), build, persistent=True)
+
 
-    for c in mixing_matrix:
-        assert palette.rgb2hex(*c.tolist()) in colours
+def _luma_tables(mixing_matrix):
+    """The luminosity of the mixed colours, and its order and sorted values."""
+    luma_mat = luminosity(mixing_matrix, CCIR_LUMINOSITY / 1000.0 / 255.0)
+    luma_order = np.argsort(luma_mat, kind="stable")
+    return luma_mat, luma_order, luma_mat[luma_order]
 
-    return mixing_matrix, colours, colour_component_distances
 
+def _iter_mixing_plan_matrix(palette, order=8, max_mixes=None):
+    """Build the mixing plan matrix incrementally.
 
-def _colour_combine(palette, i, j, ratio):
-    c1, c2 = np.array(palette[i], "int"), np.array(palette[j], "int")
-    return np.array(c1 + ratio * (c2 - c1), "uint8")
+    :param int max_mixes: Maximum number of plans per part.
+    :return: A generator of ``(start, (mixing_matrix, distances, plans))``
+        for consecutive ranges of plans, see :func:`_get_mixing_plan_matrix`.
+
+    """
+    n_plans = len(_MixingPlans(len(palette), order))
+    step = n_plans if max_mixes is None else max(1, max_mixes)
+    for start in range(0, n_plans, step):
+        yield start, _get_mixing_plan_matrix(
+            palette, order, start, min(start + step, n_plans)
+        )
 
 
 def _improved_mixing_error_fcn(
@@ -84,20 +184,221 @@ def _improved_mixing_error_fcn(
     :return: :class:`numpy.ndarray`
 
     """
-    colour = np.array(colour, "int")
+    colour = np.asarray(colour, "int")
     if luma_mat is None:
-        luma_mat = mixing_matrix.dot(CCIR_LUMINOSITY / 1000.0 / 255.0)
-    luma_colour = colour.dot(CCIR_LUMINOSITY) / (255.0 * 1000.0)
-    luma_diff_squared = (luma_mat - luma_colour) ** 2
-    diff_colour_squared = ((colour - mixing_matrix) / 255.0) ** 2
-    cmpvals = diff_colour_squared.dot(CCIR_LUMINOSITY) / 1000.0
+        luma_mat = luminosity(mixing_matrix, CCIR_LUMINOSITY / 1000.0 / 255.0)
+    luma_colour = luminosity(colour) / (255.0 * 1000.0)
+    luma_diff_squared = (luma_mat - luma_colour[..., None]) ** 2
+    diff_colour_squared = ((colour[..., None, :] - mixing_matrix) / 255.0) ** 2
+    cmpvals = luminosity(diff_colour_squared) / 1000.0
     cmpvals *= 0.75
     cmpvals += luma_diff_squared
     cmpvals += colour_component_distances
     return cmpvals
 
 
-def yliluomas_1_ordered_dithering(image, palette, order=8):
+class _MixingErrors(object):
+    """Evaluates :func:`_improved_mixing_error_fcn` for blocks of pixels.
+
+    The luminosity weighted squared difference of every channel value to
+    every other is tabulated once, in a ``[256 x 256]`` table per channel,
+    so a block of pixels needs one gather per channel instead of
+    arithmetic over a ``[pixels x mixes x 3]`` array. The results are bit
+    for bit identical.
+
+    With ``compiled=True``, :meth:`closest` instead runs a Numba kernel
+    that skips all mixes whose luminosity difference alone exceeds the
+    best error found so far.
+
+    """
+
+    def __init__(
+        self, mixing_matrix, colour_component_distances, compiled=False, luma=None
+    ):
+        self.compiled = compiled
+        # Used as given, which may be a read-only memory map of the disk
+        # cache, shared with other processes.
+        self.mixing_matrix = mixing_matrix
+        self.colour_component_distances = colour_component_distances
+        if luma is None:
+            luma = _luma_tables(mixing_matrix)
+        self.luma_mat, self.luma_order, self.luma_sorted = luma
+        if not compiled:
+            values = np.arange(256)
+            diff_squared = ((values[:, None] - values[None, :]) / 255.0) ** 2
+            # tables[k][c, v] is the weighted term of channel k for value c
+            # and mixed value v. Gathered per block of pixels, so that memory
+            # does not grow with the number of mixes.
+            self.tables = [diff_squared * CCIR_LUMINOSITY[k] for k in range(3)]
+
+    def __len__(self):
+        return len(self.mixing_matrix)
+
+    def __call__(self, colours):
+        """Mixing errors of a ``[P x 3]`` block of colours to all mixes.
+
+        :return: A ``[P x M]`` array of errors.
+
+        """
+        colours = np.asarray(colours, "int")
+        luma_colour = luminosity(colours) / (255.0 * 1000.0)
+        mixes = self.mixing_matrix
+        # Gathering the rows of the pixels first, then the columns of the
+        # mixes, is faster than gathering every error on its own.
+        cmpvals = self.tables[0][colours[:, 0]][:, mixes[:, 0]]
+        cmpvals += self.tables[1][colours[:, 1]][:, mixes[:, 1]]
+        cmpvals += self.tables[2][colours[:, 2]][:, mixes[:, 2]]
+        cmpvals /= 1000.0
+        cmpvals *= 0.75
+        luma_diff_squared = self.luma_mat - luma_colour[:, None]
+        luma_diff_squared **= 2
+        cmpvals += luma_diff_squared
+        cmpvals += self.colour_component_distances
+        return cmpvals
+
+    def closest(self, colours, max_bytes=2**20, return_errors=False):
+        """Index of the mix with the smallest error for each colour.
+
+        :param colours: A ``[P x 3]`` array of colours.
+        :param int max_bytes: Approximate size of the error array for a
+            block of colours, which are evaluated together.
+        :param bool return_errors: Also return the smallest errors.
+        :return: A ``[P]`` array of indices into the mixing matrix, and
+            the ``[P]`` errors of those mixes if ``return_errors`` is set.
+
+        """
+        min_index = np.empty(len(colours), "intp")
+        min_error = np.empty(len(colours), "float")
+        if not self.compiled:
+            block_size = max(1, int(max_bytes // (8 * len(self))))
+            for start in range(0, len(colours), block_size):
+                block = slice(start, start + block_size)
+                errors = self(colours[block])
+                min_index[block] = np.argmin(errors, axis=1)
+                min_error[block] = errors[np.arange(len(errors)), min_index[block]]
+        else:
+            _closest_mix_kernel(
+                np.asarray(colours, "int64"),
+                self.mixing_matrix,
+                self.luma_mat,
+                self.colour_component_distances,
+                self.luma_order,
+                self.luma_sorted,
+                min_index,
+                min_error,
+            )
+        if return_errors:
+            return min_index, min_error
+        return min_index
+
+
+def _mixing_errors(palette, compiled):
+    tables = _mixing_plan_matrix(palette)
+    return _MixingErrors(tables[0], tables[1], compiled, luma=tables[2:])
+
+
+class _ChunkedMixingErrors(object):
+    """Closest mix search over a mixing table built in parts.
+
+    Only ``max_mixes`` mixes are built and evaluated at a time, so the
+    ``O(N^2 order^2)`` table of a large palette is never held in memory
+    at once. The smallest error is kept across parts, replaced only by
+    strictly smaller errors, so ties still resolve to the lowest index.
+    Parts are rebuilt on every call, trading time for memory.
+
+    """
+
+    def __init__(self, palette, order=8, max_mixes=2**16, compiled=False):
+        self.palette = palette
+        self.order = order
+        self.max_mixes = max_mixes
+        self.compiled = compiled
+
+    def closest(self, colours, max_bytes=2**20):
+        min_index = np.zeros(len(colours), "intp")
+        min_error = np.full(len(colours), np.inf)
+        for start, (mixing_matrix, distances, _) in _iter_mixing_plan_matrix(
+            self.palette, self.order, self.max_mixes
+        ):
+            index, error = _MixingErrors(
+                mixing_matrix, distances, self.compiled
+            ).closest(colours, max_bytes, return_errors=True)
+            better = error < min_error
+            min_index[better] = index[better] + start
+            min_error[better] = error[better]
+        return min_index
+
+
+@jit
+def _closest_mix_kernel(
+    colours,
+    mixing_matrix,
+    luma_mat,
+    colour_component_distances,
+    luma_order,
+    luma_sorted,
+    min_index,
+    min_error,
+):
+    """Compiled, pruned search for the mix with the smallest error.
+
+    Mixes are visited outwards from the luminosity of the colour. As every
+    term of the error is non-negative, the search in a direction ends once
+    the squared luminosity difference exceeds the best error. Errors are
+    computed as in :func:`_improved_mixing_error_fcn` and ties resolve to
+    the lowest index, so the result equals the argmin over all mixes.
+
+    """
+    n = mixing_matrix.shape[0]
+    for p in range(colours.shape[0]):
+        c0, c1, c2 = colours[p, 0], colours[p, 1], colours[p, 2]
+        luma_colour = (
+            c0 * CCIR_LUMINOSITY[0] + c1 * CCIR_LUMINOSITY[1] + c2 * CCIR_LUMINOSITY[2]
+        ) / (255.0 * 1000.0)
+        above = np.searchsorted(luma_sorted, luma_colour)
+        below = above - 1
+        best_error = np.inf
+        best = -1
+        while below >= 0 or above < n:
+            if above < n and (
+                below < 0
+                or luma_sorted[above] - luma_colour <= luma_colour - luma_sorted[below]
+            ):
+                k = luma_order[above]
+                above += 1
+            else:
+                k = luma_order[below]
+                below -= 1
+            luma_diff_squared = (luma_mat[k] - luma_colour) ** 2
+            if luma_diff_squared > best_error:
+                break
+            d0 = (c0 - mixing_matrix[k, 0]) / 255.0
+            d1 = (c1 - mixing_matrix[k, 1]) / 255.0
+            d2 = (c2 - mixing_matrix[k, 2]) / 255.0
+            error = (
+                (d0 * d0) * CCIR_LUMINOSITY[0]
+                + (d1 * d1) * CCIR_LUMINOSITY[1]
+                + (d2 * d2) * CCIR_LUMINOSITY[2]
+            ) / 1000.0
+            error *= 0.75
+            error += luma_diff_squared
+            error += colour_component_distances[k]
+            if error < best_error or (error == best_error and k < best):
+                best_error = error
+                best = k
+        min_index[p] = best
+        min_error[p] = best_error
+
+
+def yliluomas_1_ordered_dithering(
+    image,
+    palette,
+    order=8,
+    max_bytes=2**20,
+    backend="auto",
+    cache_size=None,
+    max_mixes=None,
+):
     """A dithering method that weighs in color combinations of palette.
 
     N.B. tri-tone dithering is not implemented.
@@ -106,35 +407,189 @@ def yliluomas_1_ordered_dithering(image, palette, order=8):
         Bayer ordered dithering to.
     :param :class:`~hitherdither.colour.Palette` palette: The palette to use.
     :param int order: The Bayer matrix size to use.
+    :param int max_bytes: Approximate memory budget for the mixing errors
+        of a block of pixels, which are evaluated together. Blocks that fit
+        in the CPU cache are the fastest.
+    :param str backend: ``"numpy"`` to evaluate the errors of all mixes
+        for a band of pixels at once, or ``"numba"`` for a compiled search
+        that prunes mixes by luminosity. Both give identical results. The
+        default, ``"auto"``, uses Numba if it is installed.
+    :param int cache_size: If given, the mixing plans of the colours seen
+        are kept in a least recently used cache of this many colours,
+        attached to the palette. Subsequent calls with the same palette,
+        e.g. for the frames of a video, only solve colours not seen before.
+        Within a call, every distinct colour is solved once regardless.
+    :param int max_mixes: If given, the table of mixed colours is built
+        and searched in parts of at most this many mixes, bounding its
+        memory use for large palettes at the cost of rebuilding the parts
+        for every band of the image. The result is the same. Otherwise
+        the table is kept with the palette, and in the disk cache if one
+        is set, see :func:`hitherdither.cache.set_disk_cache`.
     :return:  The dithered PIL image of type "P" using the input palette.
 
     """
-    bayer_matrix = I(order, transposed=True) / 64.0
-    ni = np.array(image, "uint8")
-    xx, yy = np.meshgrid(range(ni.shape[1]), range(ni.shape[0]))
-    factor_matrix = bayer_matrix[yy % order, xx % order]
-
-    # Prepare all precalculated mixed colours and their respective
-    mixing_matrix, colour_map, colour_component_distances = _get_mixing_plan_matrix(
-        palette
+    cc = yliluomas_1_ordered_dithering_indices(
+        image, palette, order, max_bytes, backend, cache_size, max_mixes
     )
-    mixing_matrix = np.array(mixing_matrix, "int")
-    luma_mat = mixing_matrix.dot(CCIR_LUMINOSITY / 1000.0 / 255.0)
+    return palette.create_PIL_png_from_closest_colour(cc)
+
+
+def yliluomas_1_ordered_dithering_indices(
+    image,
+    palette,
+    order=8,
+    max_bytes=2**20,
+    backend="auto",
+    cache_size=None,
+    max_mixes=None,
+    out=None,
+):
+    """Yliluoma's algorithm 1 to an array of palette colour indices.
+
+    Like :func:`yliluomas_1_ordered_dithering`, without creating a PIL
+    image. A ``uint8`` image array is used without copying.
 
-    color_matrix = np.zeros(ni.shape[:2], dtype="uint8")
-    for x, y in zip(np.nditer(xx), np.nditer(yy)):
+    :param :class:`numpy.ndarray` out: Optional ``[M x N]`` ``uint8`` array
+        to write the indices to.
+    :return: A ``[M x N]`` array of palette colour indices.
 
-        min_index = np.argmin(
-            _improved_mixing_error_fcn(
-                ni[y, x, :], mixing_matrix, colour_component_distances, luma_mat
+    """
+    ditherer = _YliluomasOne(palette, order, max_bytes, backend, cache_size, max_mixes)
+    return ditherer(image, out)
+
+
+class _YliluomasOne(object):
+    """Yliluoma's algorithm 1 with its tables prepared for many images.
+
+    See :func:`yliluomas_1_ordered_dithering` for the parameters.
+
+    """
+
+    def __init__(
+        self,
+        palette,
+        order=8,
+        max_bytes=2**20,
+        backend="auto",
+        cache_size=None,
+        max_mixes=None,
+    ):
+        if backend == "auto":
+            backend = "numba" if HAS_NUMBA else "numpy"
+        if backend not in ("numpy", "numba"):
+            raise ValueError("Unknown Yliluoma backend: {0}".format(backend))
+        if backend == "numba" and not HAS_NUMBA:
+            raise ImportError("The numba backend requires Numba to be installed.")
+
+        self.n_colours = len(palette)
+        self.order = order
+        # Images processed in parts must be split on multiples of these.
+        self.period = self.matrix_width = order
+        self.max_bytes = max_bytes
+        self.bayer_matrix = I(order, transposed=True) / 64.0
+
+        # Prepare all precalculated mixed colours and their respective plans.
+        self.plans = _MixingPlans(len(palette))
+        if max_mixes is None:
+            self.mixing_errors = palette.derived(
+                ("yliluoma_1_mixing_errors", 8, backend),
+                lambda: _mixing_errors(palette, backend == "numba"),
             )
+        else:
+            self.mixing_errors = _ChunkedMixingErrors(
+                palette, max_mixes=max_mixes, compiled=backend == "numba"
+            )
+        if cache_size is None:
+            self.cache = None
+        else:
+            self.cache = palette.derived(("yliluoma_1_plan_cache", order), LRUCache)
+            self.cache.maxsize = cache_size
+
+    def __call__(self, image, out=None):
+        """Dither an RGB image.
+
+        :param image: The image to dither, a :class:`PIL.Image` or array.
+        :param out: Optional ``[M x N]`` integer array to write the
+            indices to.
+        :return: A ``[M x N]`` array of palette colour indices.
+
+        """
+        with profiling.stage("yliluoma_1") as stage:
+            with profiling.stage("convert"):
+                ni = np.asarray(image, "uint8")
+            stage.pixels = ni.shape[0] * ni.shape[1]
+            return self._dither(ni, out)
+
+    def _dither(self, ni, out):
+        order = self.order
+        out = index_array(ni.shape[:2], self.n_colours, out)
+        # The image is processed in bands of rows to bound the size of the
+        # threshold and plan arrays.
+        n_rows = threads.band_rows(
+            ni.shape[0], ni.shape[1], max(1, _BAND_PIXELS // max(1, ni.shape[1]))
         )
-        closest_mix_colour = mixing_matrix[min_index, :].tolist()
-        closest_mix_hexcolour = palette.rgb2hex(*closest_mix_colour)
-        plan = colour_map.get(closest_mix_hexcolour)
-        color_matrix[y, x] = plan[1] if (factor_matrix[y, x] < plan[-1]) else plan[0]
+        xx = np.arange(ni.shape[1]) % order
+
+        def dither_band(start):
+            band = ni[start : start + n_rows]
+            yy = np.arange(start, start + len(band)) % order
+            factor_matrix = self.bayer_matrix[yy[:, None], xx[None, :]]
+
+            with profiling.stage("closest_mixes", band.shape[0] * band.shape[1]):
+                min_index = _closest_mixes(
+                    band.reshape((-1, 3)),
+                    self.mixing_errors,
+                    self.max_bytes,
+                    self.cache,
+                )
+            plan = self.plans[min_index].reshape(band.shape[:2])
+            out[start : start + len(band)] = np.where(
+                factor_matrix < plan["ratio"], plan["j"], plan["i"]
+            )
+
+        threads.for_each(dither_band, range(0, ni.shape[0], n_rows))
+        return out
+
+
+def _closest_mixes(pixels, mixing_errors, max_bytes, cache=None):
+    """Index of the mix with the smallest error for every pixel.
+
+    Each distinct colour among ``pixels`` is solved only once, and not at
+    all if it is found in ``cache``.
 
-    return palette.create_PIL_png_from_closest_colour(color_matrix)
+    :param pixels: A ``[P x 3]`` ``uint8`` array of colours.
+    :param :class:`_MixingErrors` mixing_errors: The mixes to choose from.
+    :param int max_bytes: Memory budget for the errors of a block of colours.
+    :param :class:`~hitherdither.cache.LRUCache` cache: Optional cache
+        from packed 24-bit RGB colour to mix index.
+    :return: A ``[P]`` array of indices into the mixing matrix.
+
+    """
+    packed = pixels[:, 0].astype("uint32") << 16
+    packed |= pixels[:, 1].astype("uint32") << 8
+    packed |= pixels[:, 2]
+    keys, inverse = np.unique(packed, return_inverse=True)
+    colours = np.stack(((keys >> 16) & 0xFF, (keys >> 8) & 0xFF, keys & 0xFF), axis=1)
+
+    if cache is None:
+        solved = mixing_errors.closest(colours, max_bytes)
+    else:
+        solved = np.empty(len(keys), "intp")
+        missing = []
+        for n, key in enumerate(keys.tolist()):
+            index = cache.get(key)
+            if index is None:
+                missing.append(n)
+            else:
+                solved[n] = index
+        profiling.record_cache(
+            "yliluoma_1_plans", len(keys) - len(missing), len(missing)
+        )
+        if missing:
+            solved[missing] = mixing_errors.closest(colours[missing], max_bytes)
+            for key, index in zip(keys[missing].tolist(), solved[missing].tolist()):
+                cache[key] = index
+    return solved[inverse.ravel()]
 
 
 def _evaluate_mixing_error(
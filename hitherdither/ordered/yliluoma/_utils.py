@@ -35,8 +35,23 @@ def color_compare(c1, c2):
     :return: float
 
     """
-    luma_diff = c1.dot(CCIR_LUMINOSITY) / (255.0 * 1000.0) - c2.dot(CCIR_LUMINOSITY) / (
-        255.0 * 1000.0
-    )
+    luma_diff = luminosity(c1) / (255.0 * 1000.0) - luminosity(c2) / (255.0 * 1000.0)
     diff_col = (c1 - c2) / 255.0
-    return ((diff_col ** 2).dot(CCIR_LUMINOSITY / 1000.0) * 0.75) + (luma_diff ** 2)
+    return (luminosity(diff_col**2, CCIR_LUMINOSITY / 1000.0) * 0.75) + (
+        luma_diff**2
+    )
+
+
+def luminosity(colours, weights=CCIR_LUMINOSITY):
+    """CCIR 601 weighted sum over the last axis of ``colours``.
+
+    Summed explicitly rather than with :func:`numpy.dot`, whose summation
+    order depends on the BLAS implementation and the shape of the input,
+    so that single colours and arrays of colours get identical results.
+
+    """
+    return (
+        colours[..., 0] * weights[0]
+        + colours[..., 1] * weights[1]
+        + colours[..., 2] * weights[2]
+    )
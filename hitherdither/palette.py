@@ -17,7 +17,18 @@ import numpy as np
 from PIL import Image
 from PIL.ImagePalette import ImagePalette
 
+from hitherdither import cache
+from hitherdither import profiling
+from hitherdither import quantization
+from hitherdither import threads
 from hitherdither.exceptions import PaletteCouldNotBeCreatedError
+from hitherdither.spatial import (
+    GridIndex,
+    SUPPORTED_ORDERS,
+    SPATIAL_INDEX_MIN_COLOURS,
+    closest_colours,
+    closest_colours_on_grid,
+)
 
 try:
     string_type = basestring
@@ -71,6 +82,10 @@ class Palette(object):
     """
 
     def __init__(self, data):
+        self._colours = None
+        self._lut = None
+        self._lut_order = None
+        self._derived = {}
         if isinstance(data, np.ndarray):
             if data.ndim == 1:
                 self.colours = data.reshape((3, len(data) // 3))
@@ -106,6 +121,57 @@ class Palette(object):
                 self.colours = np.array(data)
                 self.hex = [rgb2hex(*colour) for colour in data]
 
+    @property
+    def colours(self):
+        """The ``[N x 3]`` array of palette colours.
+
+        Assigning a new array discards tables derived from the colours,
+        such as the lookup table, spatial indices and other tables kept by
+        :meth:`derived`. Modifying the array in
+        place does not.
+
+        """
+        return self._colours
+
+    @colours.setter
+    def colours(self, value):
+        self._colours = value
+        self._lut = None
+        self._lut_order = None
+        self._derived = {}
+
+    def derived(self, key, factory, persistent=False):
+        """Get a table derived from the colours of this palette.
+
+        The table is built by calling ``factory`` on first request and kept
+        until :attr:`colours` is reassigned.
+
+        Persistent tables are also kept in the disk cache, if one is set
+        with :func:`hitherdither.cache.set_disk_cache`, keyed by the content
+        of :attr:`colours` and ``key``. They are then loaded as read-only
+        memory mapped arrays, shared with other processes using the cache.
+
+        :param key: A hashable key identifying the table and its parameters.
+        :param factory: A callable without arguments that builds the table.
+        :param bool persistent: If the table is a tuple of arrays that may
+            be kept in the disk cache.
+        :return: The table.
+
+        """
+        try:
+            table = self._derived[key]
+        except KeyError:
+            profiling.record_cache("palette_tables", misses=1)
+            disk_cache = cache.get_disk_cache() if persistent else None
+            if disk_cache is None:
+                table = factory()
+            else:
+                table = disk_cache.get(disk_cache.key(self.colours, key), factory)
+            self._derived[key] = table
+            return table
+        profiling.record_cache("palette_tables", hits=1)
+        return table
+
     def __iter__(self):
         for colour in self.colours:
             yield colour
@@ -129,68 +195,334 @@ class Palette(object):
             distances[:, :, i] = np.linalg.norm(ni - colour, ord=order, axis=2)
         return distances
 
-    def image_closest_colour(self, image, order=2):
-        return np.argmin(self.image_distance(image, order=order), axis=2)
+    def image_closest_colour(self, image, order=2, max_bytes=None):
+        """Get the index of the closest palette colour for every pixel.
+
+        If a lookup table has been built with :meth:`build_lut` for the
+        same ``order``, RGB images are mapped through it.
+
+        :param image: The image to map to this palette.
+        :param int order: Metric parameter ``ord`` to send to
+            :func:`numpy.linalg.norm`.
+        :param int max_bytes: If given, the image is processed in bands of
+            rows small enough for the temporary arrays of each band to stay
+            within roughly this many bytes, and the indices are written to
+            a preallocated ``uint8`` array (``uint16`` for palettes of
+            more than 256 colours). Bands are mapped in parallel by the
+            threads of :mod:`hitherdither.threads`, if enabled, with this
+            budget per thread.
+        :return: A ``[M x N]`` array of palette colour indices.
+
+        """
+        ni = np.asarray(image)
+        if max_bytes is None and not threads.active():
+            return self._image_closest_colour(ni, order)
+
+        cc = np.empty(ni.shape[:2], "uint8" if len(self) <= 256 else "uint16")
+        if max_bytes is None:
+            n_rows = len(ni)
+        else:
+            # The distance cube, the float copy of the band with its
+            # difference to a colour and the argmin result, per pixel.
+            bytes_per_row = ni.shape[1] * 8 * (len(self) + 7)
+            n_rows = int(max_bytes // bytes_per_row)
+        n_rows = threads.band_rows(len(ni), ni.shape[1], n_rows)
+        if threads.active():
+            # Build the tables once, before the threads need them.
+            self._closest_colour(ni[:1, :1], order)
+
+        def map_band(start):
+            band = slice(start, start + n_rows)
+            cc[band] = self._image_closest_colour(ni[band], order)
+
+        threads.for_each(map_band, range(0, len(ni), n_rows))
+        return cc
+
+    def _image_closest_colour(self, ni, order):
+        with profiling.stage("closest_colour", ni.shape[0] * ni.shape[1]):
+            return self._closest_colour(ni, order)
+
+    def _closest_colour(self, ni, order):
+        if self._lut is not None and order == self._lut_order and ni.ndim == 3:
+            return self.lut_closest_colour(ni)
+        index = self._spatial_index_for(ni, order)
+        if index is not None:
+            return index.query(ni)
+        return np.argmin(self.image_distance(ni, order=order), axis=2)
+
+    def spatial_index(self, order=2):
+        """Get the spatial index of this palette for the given metric.
+
+        The index is built on first request and kept until
+        :attr:`colours` is reassigned.
+
+        :param int order: Metric parameter ``ord`` to send to
+            :func:`numpy.linalg.norm`, one of ``1``, ``2`` or ``numpy.inf``.
+        :return: A :class:`~hitherdither.spatial.GridIndex`.
+
+        """
+        return self.derived(
+            ("spatial_index", order), lambda: GridIndex(self.colours, order=order)
+        )
+
+    def _spatial_index_for(self, ni, order):
+        if (
+            len(self) >= SPATIAL_INDEX_MIN_COLOURS
+            and order in SUPPORTED_ORDERS
+            and ni.shape[-1:] == (3,)
+        ):
+            return self.spatial_index(order)
+        return None
+
+    def build_lut(self, bits=6, order=2):
+        """Precompute a lookup table from RGB colour to closest palette colour.
+
+        Every channel is quantized to its ``bits`` most significant bits and
+        each cell of the resulting ``2 ** bits`` cube is mapped to the palette
+        colour closest to the centre of the cell. Mapping an image is then a
+        single gather, regardless of the number of colours in the palette.
+
+        With ``bits=8`` the table is exact for ``uint8`` images. With fewer
+        bits it is an approximation, as are values outside ``[0, 255]``,
+        which are clipped before lookup.
+
+        The table is kept in the disk cache, if one is set.
+
+        :param int bits: Precision of the table in bits per channel, 1 to 8.
+            The table has ``2 ** (3 * bits)`` entries.
+        :param int order: Metric parameter ``ord`` to send to
+            :func:`numpy.linalg.norm`.
+        :return: The lookup table, a ``[2^bits x 2^bits x 2^bits]`` array.
+
+        """
+        if not 1 <= bits <= 8:
+            raise ValueError("LUT precision must be between 1 and 8 bits.")
+        (lut,) = self.derived(
+            ("lut", bits, order), lambda: (self._build_lut(bits, order),), True
+        )
+        self._lut = lut
+        self._lut_order = order
+        return lut
+
+    def _build_lut(self, bits, order):
+        with profiling.stage("lut"):
+            return self._lut_of(bits, order)
+
+    def _lut_of(self, bits, order):
+        n = 1 << bits
+        shift = 8 - bits
+        levels = (np.arange(n) << shift) + ((1 << shift) - 1) / 2.0
+
+        lut = np.empty((n, n, n), "uint8" if len(self) <= 256 else "uint16")
+        if order in SUPPORTED_ORDERS:
+            return closest_colours_on_grid(self.colours, levels, order, out=lut)
+        plane = np.empty((n, n, 3), "float")
+        plane[:, :, 1], plane[:, :, 2] = np.meshgrid(levels, levels, indexing="ij")
+        for i, level in enumerate(levels):
+            plane[:, :, 0] = level
+            lut[i].flat = closest_colours(self.colours, plane.reshape((-1, 3)), order)
+        return lut
+
+    def lut_closest_colour(self, image):
+        """Map an RGB image to palette colour indices with the lookup table.
+
+        :param image: A ``[M x N x 3]`` image. Values that are not ``uint8``
+            are rounded and clipped to ``[0, 255]``.
+        :return: A ``[M x N]`` array of palette colour indices.
+
+        """
+        if self._lut is None:
+            raise ValueError("No lookup table has been built for this palette.")
+        ni = np.asarray(image)
+        if np.issubdtype(ni.dtype, np.integer):
+            if ni.dtype != np.uint8:
+                ni = np.clip(ni, 0, 255).astype("uint8")
+        else:
+            ni = np.clip(np.rint(ni), 0, 255).astype("uint8")
+        bits = self._lut.shape[0].bit_length() - 1
+        shift = 8 - bits
+        flat_index = (ni[:, :, 0] >> shift).astype(np.intp) << (2 * bits)
+        flat_index |= (ni[:, :, 1] >> shift).astype(np.intp) << bits
+        flat_index |= ni[:, :, 2] >> shift
+        return np.asarray(self._lut).ravel().take(flat_index)
 
     def pixel_distance(self, pixel, order=2):
-        return np.array([np.linalg.norm(pixel - colour, ord=order) for colour in self])
+        # Reduce over the colour axis like `image_distance` does, rather than
+        # per colour, so that the summation order does not depend on BLAS.
+        return np.linalg.norm(pixel - self.colours, ord=order, axis=1)
 
     def pixel_closest_colour(self, pixel, order=2):
+        index = self._spatial_index_for(np.asarray(pixel), order)
+        if index is not None:
+            return self.colours[index.query_pixel(pixel), :].copy()
         return self.colours[
             np.argmin(self.pixel_distance(pixel, order=order)), :
         ].copy()
 
     @classmethod
-    def create_by_kmeans(cls, image):
-        raise NotImplementedError()
+    def create_by_kmeans(
+        cls,
+        image,
+        n=16,
+        init="k-means++",
+        max_iter=50,
+        tol=0.5,
+        batch_size=None,
+        random_state=None,
+        bits=5,
+        stride=1,
+        max_pixels=2**20,
+    ):
+        """Create a palette of ``n`` colours by k-means clustering.
+
+        The colours of the image are counted in a histogram with ``bits``
+        bits per channel, and the mean colours of its cells, weighted by
+        their pixel counts, are clustered by
+        :func:`~hitherdither.quantization.kmeans`. If there are no more
+        than ``n`` cells, the precision is raised a bit at a time. Larger
+        images are sampled, so the time taken hardly depends on the number
+        of pixels.
+
+        Images with at most ``n`` distinct colours get a palette of those
+        colours, as far as they occur in the sample.
+
+        :param image: The image to create a palette from.
+        :param int n: Number of colours.
+        :param init: ``"k-means++"`` to seed by
+            :func:`~hitherdither.quantization.kmeans_plus_plus`,
+            ``"median-cut"`` to seed by the colours of
+            :meth:`create_by_median_cut`, or a :class:`Palette` or array of
+            initial colours.
+        :param int max_iter: Maximum number of iterations.
+        :param float tol: Largest colour movement at which to stop.
+        :param int batch_size: If given, iterate on mini-batches of this
+            many histogram cells, drawn by pixel count, instead of on all.
+        :param random_state: Seed or :class:`numpy.random.RandomState`.
+        :param int bits: Precision of the histogram in bits per channel.
+        :param int stride: Only count every ``stride``-th pixel.
+        :param int max_pixels: If given, count a random sample of this many
+            of the pixels of larger images.
+        :return: The :class:`Palette`.
+
+        """
+        rng = random_state
+        if not isinstance(rng, np.random.RandomState):
+            rng = np.random.RandomState(random_state)
+        pixels = quantization.image_pixels(image)[::stride]
+        if max_pixels is not None and len(pixels) > max_pixels:
+            pixels = pixels[rng.randint(0, len(pixels), max_pixels)]
+        histogram = quantization.ColourHistogram(pixels, bits)
+        while len(histogram) <= n and histogram.bits < 8:
+            histogram = quantization.ColourHistogram(pixels, histogram.bits + 1)
+        points = histogram.sums / histogram.counts[:, None]
+        if len(histogram) <= n:
+            return cls(np.rint(points).astype("uint8"))
+
+        if isinstance(init, string_type) and init == "k-means++":
+            centroids = quantization.kmeans_plus_plus(points, histogram.counts, n, rng)
+        elif isinstance(init, string_type) and init == "median-cut":
+            boxes = quantization.median_cut(histogram, n)
+            centroids = [
+                histogram.sums[box].sum(axis=0) / histogram.counts[box].sum()
+                for box in boxes
+            ]
+        elif isinstance(init, string_type):
+            raise ValueError("Unknown initialization: {0}".format(init))
+        else:
+            centroids = getattr(init, "colours", init)
+        with profiling.stage("kmeans"):
+            centroids = quantization.kmeans(
+                points, histogram.counts, centroids, max_iter, tol, batch_size, rng
+            )
+        return cls(np.clip(np.rint(centroids), 0, 255).astype("uint8"))
 
     @classmethod
-    def create_by_median_cut(cls, image, n=16, dim=None):
-        img = np.array(image)
-        # Create pixel buckets to simplify sorting and splitting.
-        if img.ndim == 3:
-            pixels = img.reshape((img.shape[0] * img.shape[1], img.shape[2]))
-        elif img.ndim == 2:
-            pixels = img.reshape((img.shape[0] * img.shape[1], 1))
-
-        def median_cut(p, dim=None):
-            """Median cut method.
-
-            Reference:
-            https://en.wikipedia.org/wiki/Median_cut
-
-            :param p: The pixel array to split in two.
-            :return: Two numpy arrays, split by median cut method.
-            """
-            if dim is not None:
-                sort_dim = dim
-            else:
-                mins = p.min(axis=0)
-                maxs = p.max(axis=0)
-                sort_dim = np.argmax(maxs - mins)
-
-            argument = np.argsort(p[:, sort_dim])
-            p = p[argument, :]
-            m = np.median(p[:, sort_dim])
-            split_mask = p[:, sort_dim] >= m
-            return [p[~split_mask, :].copy(), p[split_mask, :].copy()]
-
-        # Do actual splitting loop.
-        bins = [
-            pixels,
-        ]
-        while len(bins) < n:
-            new_bins = []
-            for bin in bins:
-                if len(bin) != 0:
-                    new_bins += median_cut(bin, dim)
-            bins = new_bins
-
-        # Average over pixels in each bin to create
-        colours = np.array(
-            [np.array(bin.mean(axis=0).round(), "uint8") for bin in bins], "uint8"
-        )
-        return cls(colours)
+    def create_by_median_cut(cls, image, n=16, dim=None, bits=5):
+        """Create a palette of ``n`` colours by the median cut method.
+
+        The colours of the image are counted in a histogram with ``bits``
+        bits per channel, so apart from counting, the time taken does not
+        depend on the number of pixels. Boxes of histogram cells are split
+        at the weighted median of their longest side, largest box first,
+        until there are ``n`` of them. Each colour is the mean of the
+        pixels in a box.
+
+        If the histogram has fewer than ``n`` occupied cells, the exact
+        colours are used instead. Images with fewer than ``n`` distinct
+        colours get a palette of those colours.
+
+        :param image: The image to create a palette from.
+        :param int n: Number of colours.
+        :param int dim: If given, always split along this channel.
+        :param int bits: Precision of the histogram in bits per channel.
+        :return: The :class:`Palette`.
+
+        """
+        pixels = quantization.image_pixels(image)
+        histogram = quantization.ColourHistogram(pixels, bits)
+        if len(histogram) < n and bits < 8:
+            histogram = quantization.ColourHistogram(pixels, 8)
+        with profiling.stage("median_cut"):
+            boxes = quantization.median_cut(histogram, n, dim)
+        return cls(np.array([histogram.mean_colour(box) for box in boxes], "uint8"))
+
+    @classmethod
+    def create_by_octree(cls, image, n=16, bits=5, stride=1):
+        """Create a palette of ``n`` colours by octree reduction.
+
+        The colours of the image are counted in a histogram with ``bits``
+        bits per channel, whose cells are merged by
+        :func:`~hitherdither.quantization.octree`. Each colour is the mean
+        of the pixels in a group of cells.
+
+        As for :meth:`create_by_median_cut`, exact colours are used if the
+        histogram has fewer than ``n`` occupied cells, and images with
+        fewer than ``n`` distinct colours get a palette of those colours.
+
+        :param image: The image to create a palette from.
+        :param int n: Number of colours.
+        :param int bits: Precision of the histogram in bits per channel.
+        :param int stride: Only count every ``stride``-th pixel.
+        :return: The :class:`Palette`.
+
+        """
+        pixels = quantization.image_pixels(image)
+        histogram = quantization.ColourHistogram(pixels, bits, stride)
+        if len(histogram) < n and bits < 8:
+            histogram = quantization.ColourHistogram(pixels, 8, stride)
+        with profiling.stage("octree"):
+            groups = quantization.octree(histogram, n)
+        return cls(np.array([histogram.mean_colour(g) for g in groups], "uint8"))
+
+    @classmethod
+    def create_by_wu(cls, image, n=16, bits=5, stride=1):
+        """Create a palette of ``n`` colours by Wu's variance minimization.
+
+        The colours of the image are counted in a histogram with ``bits``
+        bits per channel, which is split into boxes by
+        :func:`~hitherdither.quantization.wu`. Each colour is the mean of
+        the pixels in a box.
+
+        If the histogram has fewer than ``n`` occupied cells, the exact
+        colours are split by median cut instead. Images with fewer than
+        ``n`` distinct colours get a palette of those colours.
+
+        :param image: The image to create a palette from.
+        :param int n: Number of colours.
+        :param int bits: Precision of the histogram in bits per channel.
+        :param int stride: Only count every ``stride``-th pixel.
+        :return: The :class:`Palette`.
+
+        """
+        pixels = quantization.image_pixels(image)
+        histogram = quantization.ColourHistogram(pixels, bits, stride)
+        if len(histogram) < n and bits < 8:
+            histogram = quantization.ColourHistogram(pixels, 8, stride)
+            boxes = quantization.median_cut(histogram, n)
+        else:
+            with profiling.stage("wu"):
+                boxes = quantization.wu(histogram, n)
+        return cls(np.array([histogram.mean_colour(box) for box in boxes], "uint8"))
 
     def create_PIL_png_from_closest_colour(self, cc):
         """Create a ``P`` PIL image with this palette.
@@ -204,17 +536,25 @@ class Palette(object):
         :return: A :class:`PIL.Image.Image` image of mode ``P``.
 
         """
-        pa_image = Image.new("P", cc.shape[::-1])
+        cc = np.asarray(cc, "uint8")
+        with profiling.stage("png", cc.size):
+            pa_image = self.derived(("pil_palette_image",), self._pil_palette_image)
+            im = Image.fromarray(cc).im.convert("P", 0, pa_image.im)
+            try:
+                # Pillow >= 4
+                return pa_image._new(im)
+            except AttributeError:
+                # Pillow < 4
+                return pa_image._makeself(im)
+
+    def _pil_palette_image(self):
+        # Only used as the source of the palette of new images, which
+        # get copies of it.
+        pa_image = Image.new("P", (1, 1))
         pa_image.putpalette(self.colours.flatten().tolist())
-        im = Image.fromarray(np.array(cc, "uint8")).im.convert("P", 0, pa_image.im)
-        try:
-            # Pillow >= 4
-            return pa_image._new(im)
-        except AttributeError:
-            # Pillow < 4
-            return pa_image._makeself(im)
+        return pa_image
 
-    def create_PIL_png_from_rgb_array(self, img_array):
+    def create_PIL_png_from_rgb_array(self, img_array, max_bytes=None):
         """Create a ``P`` PIL image from a RGB image with this palette.
 
         Avoids the PIL dithering in favour of our own.
@@ -223,20 +563,14 @@ class Palette(object):
 
         :param :class:`numpy.ndarray` img_array: A ``[M x N x 3]`` uint8
             array representing RGB colours.
+        :param int max_bytes: Memory budget for mapping the image in bands,
+            see :meth:`image_closest_colour`.
         :return: A :class:`PIL.Image.Image` image of mode ``P`` with colours
             available in this palette.
 
         """
-        cc = self.image_closest_colour(img_array, order=2)
-        pa_image = Image.new("P", cc.shape[::-1])
-        pa_image.putpalette(self.colours.flatten().tolist())
-        im = Image.fromarray(np.array(cc, "uint8")).im.convert("P", 0, pa_image.im)
-        try:
-            # Pillow >= 4
-            return pa_image._new(im)
-        except AttributeError:
-            # Pillow < 4
-            return pa_image._makeself(im)
+        cc = self.image_closest_colour(img_array, order=2, max_bytes=max_bytes)
+        return self.create_PIL_png_from_closest_colour(cc)
 
     @staticmethod
     def hex2rgb(x):
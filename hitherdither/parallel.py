@@ -0,0 +1,216 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+parallel
+-----------
+
+Ordered dithering of large images by many processes.
+
+Ordered dithering maps every pixel on its own, given its position in the
+threshold matrix, so an image can be split into tiles that start on whole
+periods of the matrix and dithered by separate processes. The image and
+the palette colour indices are passed in shared memory, and every process
+prepares the palette tables once.
+
+"""
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+from __future__ import absolute_import
+
+import os
+
+import numpy as np
+
+from hitherdither import batch
+from hitherdither import profiling
+
+# Largest width of tiles when the tile shape is chosen automatically.
+_TILE_WIDTH = 4096
+# Largest height of tiles when the tile shape is chosen automatically.
+_TILE_HEIGHT = 512
+
+
+def dither_in_processes(
+    image, palette, algorithm, processes=None, tile_shape=None, **params
+):
+    """Dither an image in tiles by a pool of processes.
+
+    Starting the processes takes a while, so use a :class:`TileScheduler`
+    to dither many images.
+
+    :param image: The image to dither, a :class:`PIL.Image` or array.
+    :param :class:`~hitherdither.colour.Palette` palette: The palette to use.
+    :param str algorithm: One of the ordered algorithms, see
+        :class:`TileScheduler`.
+    :param int processes: Number of processes. Defaults to the number of
+        CPUs.
+    :param tuple tile_shape: ``(height, width)`` of the tiles, see
+        :class:`TileScheduler`.
+    :param params: Parameters of the algorithm, see
+        :func:`~hitherdither.batch.dither_frames`.
+    :return: A ``[M x N]`` array of palette colour indices.
+
+    """
+    with TileScheduler(palette, algorithm, processes, tile_shape, **params) as tiles:
+        return tiles(image)
+
+
+class TileScheduler(object):
+    """A pool of processes that dither images in tiles.
+
+    Each process prepares the tables of the algorithm once, when it
+    starts. Images are copied to shared memory, and the processes write the
+    palette colour indices of their tiles in place to a shared index
+    image, which is returned as is.
+
+    .. code:: python
+
+        with TileScheduler(palette, "bayer", thresholds=[64, 64, 64]) as tiles:
+            for image in images:
+                indices = tiles(image)
+
+    :param :class:`~hitherdither.colour.Palette` palette: The palette to use.
+    :param str algorithm: One of the ordered algorithms ``"bayer"``,
+        ``"cluster-dot"``, ``"blue-noise"``, ``"threshold-map"`` or
+        ``"yliluoma-1"``. Error diffusion depends on every pixel before it,
+        so it is not supported.
+    :param int processes: Number of processes. Defaults to the number of
+        CPUs.
+    :param tuple tile_shape: ``(height, width)`` of the tiles, rounded up to
+        whole periods of the threshold matrix. By default, tiles are at most
+        512 by 4096 pixels, and low enough for at least four per process.
+    :param params: Parameters of the algorithm, see
+        :func:`~hitherdither.batch.dither_frames`.
+
+    """
+
+    def __init__(self, palette, algorithm, processes=None, tile_shape=None, **params):
+        # Imported here, as shared memory needs Python 3.8.
+        from concurrent.futures import ProcessPoolExecutor
+
+        if algorithm == "error-diffusion" or algorithm not in batch._ALGORITHMS:
+            raise ValueError("Unsupported algorithm for tiles: {0}".format(algorithm))
+        self.n_colours = len(palette)
+        self.processes = processes or os.cpu_count() or 1
+        self.tile_shape = tile_shape
+        if os.name == "posix":
+            from multiprocessing import resource_tracker
+
+            # Processes attaching to shared memory register it with the
+            # resource tracker. Started before the processes, it is shared
+            # with them instead of each starting its own, which would warn
+            # about the blocks at exit.
+            resource_tracker.ensure_running()
+        self.pool = ProcessPoolExecutor(
+            self.processes,
+            initializer=batch._init_worker,
+            initargs=batch._worker_args(palette, algorithm, params),
+        )
+        # The threshold matrix is only made by the processes.
+        self.period, self.matrix_width = self.pool.submit(_matrix_shape).result()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+    def close(self):
+        """Stop the processes."""
+        self.pool.shutdown()
+
+    def _tiles(self, height, width):
+        if self.tile_shape is None:
+            n_columns = -(-width // _TILE_WIDTH)
+            # At least four tiles per process, to balance the load.
+            rows = height * n_columns // (4 * self.processes)
+            tile_shape = (min(_TILE_HEIGHT, max(1, rows)), -(-width // n_columns))
+        else:
+            tile_shape = self.tile_shape
+        rows = -(-tile_shape[0] // self.period) * self.period
+        columns = -(-tile_shape[1] // self.matrix_width) * self.matrix_width
+        return [
+            (slice(top, top + rows), slice(left, left + columns))
+            for top in range(0, height, rows)
+            for left in range(0, width, columns)
+        ]
+
+    def __call__(self, image):
+        """Dither an image.
+
+        :param image: The image to dither, a :class:`PIL.Image` or array.
+        :return: A ``[M x N]`` array of palette colour indices, ``uint8``
+            (``uint16`` for palettes of more than 256 colours), in shared
+            memory that is freed with the array.
+
+        """
+        from multiprocessing import shared_memory
+
+        ni = np.asarray(image, "uint8")
+        dtype = np.dtype("uint8" if self.n_colours <= 256 else "uint16")
+        shape = ni.shape[:2]
+        if ni.size == 0:
+            return np.empty(shape, dtype)
+
+        with profiling.stage("process_tiles", shape[0] * shape[1]):
+            shm_in = shared_memory.SharedMemory(create=True, size=ni.nbytes)
+            shm_out = shared_memory.SharedMemory(
+                create=True, size=shape[0] * shape[1] * dtype.itemsize
+            )
+            try:
+                with profiling.stage("share"):
+                    shared = np.ndarray(ni.shape, "uint8", buffer=shm_in.buf)
+                    shared[...] = ni
+                    del shared
+                tasks = [
+                    (shm_in.name, shm_out.name, ni.shape, dtype.str, rows, columns)
+                    for rows, columns in self._tiles(*shape)
+                ]
+                for _ in self.pool.map(_dither_shared_tile, tasks):
+                    pass
+            except BaseException:
+                shm_out.close()
+                shm_out.unlink()
+                raise
+            finally:
+                shm_in.close()
+                shm_in.unlink()
+            # Still mapped here, and freed once the array is.
+            shm_out.unlink()
+            return np.asarray(_SharedArray(shm_out, shape, dtype))
+
+
+class _SharedArray(object):
+    """Shared memory exposed as an array, closed when the array is freed."""
+
+    def __init__(self, shm, shape, dtype):
+        self.shm = shm
+        view = np.ndarray(shape, dtype, buffer=shm.buf)
+        self.__array_interface__ = view.__array_interface__
+        del view
+
+    def __del__(self):
+        self.shm.close()
+
+
+def _matrix_shape():
+    return batch._worker_dither.period, batch._worker_dither.matrix_width
+
+
+def _dither_shared_tile(task):
+    from multiprocessing import shared_memory
+
+    in_name, out_name, shape, dtype, rows, columns = task
+    shm_in = shared_memory.SharedMemory(name=in_name)
+    shm_out = shared_memory.SharedMemory(name=out_name)
+    try:
+        image = np.ndarray(shape, "uint8", buffer=shm_in.buf)
+        indices = np.ndarray(shape[:2], dtype, buffer=shm_out.buf)
+        batch._worker_dither(image[rows, columns], indices[rows, columns])
+        del image, indices
+    finally:
+        shm_in.close()
+        shm_out.close()
@@ -0,0 +1,304 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+profiling
+-----------
+
+Opt-in instrumentation of the stages of dithering and palette operations.
+
+The algorithms mark their stages, such as image conversion, building
+palette tables, closest colour search and PIL image creation, with
+:func:`stage`, and report cache lookups with :func:`record_cache`. These
+are recorded by every :class:`Profile` active in the calling thread.
+Without one, recording costs a check of an empty tuple.
+
+.. code:: python
+
+    with hitherdither.profiling.Profile() as profile:
+        hitherdither.ordered.bayer.bayer_dithering(img, palette, thresholds)
+    print(profile.to_prometheus())
+
+"""
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+from __future__ import absolute_import
+
+import contextlib
+import contextvars
+import threading
+import time
+import tracemalloc
+
+# The active profiles, innermost last, and the path of the innermost open
+# stage, of every thread or asynchronous task.
+_profiles = contextvars.ContextVar("hitherdither_profiles", default=())
+_stage_path = contextvars.ContextVar("hitherdither_stage_path", default=None)
+# The open stages of all threads that measure memory. The peak of
+# tracemalloc is global, so it is passed on to all of them when reset.
+_traced = []
+_traced_lock = threading.Lock()
+
+
+class Profile(object):
+    """Record the stages and cache lookups of the calls made within it.
+
+    Stages are keyed by the path of the nested stages they were entered
+    in, e.g. ``"ordered_dithering/closest_colour"``, and accumulate
+    their number of calls, wall time in seconds and number of pixels.
+    Caches accumulate their numbers of hits and misses.
+
+    A profile records the thread or asynchronous task it is entered in,
+    and the threads of :mod:`hitherdither.threads` while they work for it.
+    Memory peaks are those of the whole process.
+
+    :param bool memory: Also record the peak memory allocated by Python
+        and NumPy within each stage, with :mod:`tracemalloc`. This slows
+        down allocations.
+    :param sink: Optional callable, called with the profile when it exits,
+        e.g. to write :meth:`to_prometheus` to a file.
+
+    """
+
+    def __init__(self, memory=False, sink=None):
+        self.memory = memory
+        self.sink = sink
+        self.stages = {}
+        self.caches = {}
+        self._lock = threading.Lock()
+        self._tracing = False
+
+    def __enter__(self):
+        if self.memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._tracing = True
+        _profiles.set(_profiles.get() + (self,))
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        _profiles.set(tuple(p for p in _profiles.get() if p is not self))
+        if self._tracing:
+            tracemalloc.stop()
+            self._tracing = False
+        if self.sink is not None:
+            self.sink(self)
+        return False
+
+    def _add_stage(self, path, seconds, pixels, peak_bytes):
+        with self._lock:
+            record = self.stages.get(path)
+            if record is None:
+                record = self.stages[path] = {
+                    "calls": 0,
+                    "seconds": 0.0,
+                    "pixels": 0,
+                    "peak_bytes": 0,
+                }
+            record["calls"] += 1
+            record["seconds"] += seconds
+            record["pixels"] += pixels
+            if peak_bytes is not None:
+                record["peak_bytes"] = max(record["peak_bytes"], peak_bytes)
+
+    def _add_cache(self, name, hits, misses):
+        with self._lock:
+            record = self.caches.setdefault(name, {"hits": 0, "misses": 0})
+            record["hits"] += hits
+            record["misses"] += misses
+
+    def as_dict(self):
+        """The recorded stages and caches.
+
+        :return: A dict with the dicts ``"stages"``, from stage path to
+            ``calls``, ``seconds``, ``pixels`` and ``peak_bytes``, and
+            ``"caches"``, from cache name to ``hits``, ``misses`` and
+            ``hit_rate``.
+
+        """
+        with self._lock:
+            stages = dict((k, dict(v)) for k, v in self.stages.items())
+            caches = dict((k, dict(v)) for k, v in self.caches.items())
+        for record in caches.values():
+            lookups = record["hits"] + record["misses"]
+            record["hit_rate"] = record["hits"] / lookups if lookups else 0.0
+        return {"stages": stages, "caches": caches}
+
+    def to_prometheus(self, prefix="hitherdither"):
+        """The recorded stages and caches in the Prometheus text format.
+
+        :param str prefix: Prefix of the metric names.
+        :return: The metrics, one per line.
+
+        """
+        profile = self.as_dict()
+        metrics = [
+            ("stage_calls_total", "counter", "stages", "stage", "calls"),
+            ("stage_seconds_total", "counter", "stages", "stage", "seconds"),
+            ("stage_pixels_total", "counter", "stages", "stage", "pixels"),
+            ("stage_peak_bytes", "gauge", "stages", "stage", "peak_bytes"),
+            ("cache_hits_total", "counter", "caches", "cache", "hits"),
+            ("cache_misses_total", "counter", "caches", "cache", "misses"),
+            ("cache_hit_ratio", "gauge", "caches", "cache", "hit_rate"),
+        ]
+        lines = []
+        for name, kind, group, label, field in metrics:
+            name = "{0}_{1}".format(prefix, name)
+            lines.append("# TYPE {0} {1}".format(name, kind))
+            for key, record in sorted(profile[group].items()):
+                lines.append(
+                    '{0}{{{1}="{2}"}} {3}'.format(
+                        name, label, _escape_label(key), record[field]
+                    )
+                )
+        return "\n".join(lines) + "\n"
+
+    def to_statsd(self, prefix="hitherdither"):
+        """The recorded stages and caches in the StatsD line format.
+
+        Stage times are in milliseconds, and the ``/`` of stage paths are
+        replaced by ``.``.
+
+        :param str prefix: Prefix of the metric names.
+        :return: The metrics, one per line.
+
+        """
+        profile = self.as_dict()
+        lines = []
+        for path, record in sorted(profile["stages"].items()):
+            name = "{0}.stage.{1}".format(prefix, path.replace("/", "."))
+            lines += [
+                "{0}.calls:{1}|c".format(name, record["calls"]),
+                "{0}.time:{1:.3f}|ms".format(name, record["seconds"] * 1000.0),
+                "{0}.pixels:{1}|c".format(name, record["pixels"]),
+                "{0}.peak_bytes:{1}|g".format(name, record["peak_bytes"]),
+            ]
+        for cache, record in sorted(profile["caches"].items()):
+            name = "{0}.cache.{1}".format(prefix, cache)
+            lines += [
+                "{0}.hits:{1}|c".format(name, record["hits"]),
+                "{0}.misses:{1}|c".format(name, record["misses"]),
+                "{0}.hit_rate:{1}|g".format(name, record["hit_rate"]),
+            ]
+        return "\n".join(lines) + "\n"
+
+
+def _escape_label(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class _Stage(object):
+    __slots__ = ("name", "pixels", "path", "token", "start", "memory_start", "peak")
+
+    def __init__(self, name, pixels):
+        self.name = name
+        self.pixels = pixels
+
+    def __enter__(self):
+        parent = _stage_path.get()
+        self.path = self.name if parent is None else parent + "/" + self.name
+        self.peak = None
+        if tracemalloc.is_tracing():
+            with _traced_lock:
+                current, peak = tracemalloc.get_traced_memory()
+                if hasattr(tracemalloc, "reset_peak"):
+                    # Python 3.9 or later, otherwise peaks are since tracing
+                    # began. The open stages keep the peak so far.
+                    for other in _traced:
+                        other.peak = max(other.peak, peak)
+                    tracemalloc.reset_peak()
+                self.memory_start = self.peak = current
+                _traced.append(self)
+        self.token = _stage_path.set(self.path)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        seconds = time.perf_counter() - self.start
+        _stage_path.reset(self.token)
+        peak_bytes = None
+        if self.peak is not None:
+            with _traced_lock:
+                _traced.remove(self)
+                if tracemalloc.is_tracing():
+                    self.peak = max(self.peak, tracemalloc.get_traced_memory()[1])
+                    peak_bytes = self.peak - self.memory_start
+        for profile in _profiles.get():
+            profile._add_stage(self.path, seconds, self.pixels, peak_bytes)
+        return False
+
+
+class _NoStage(object):
+    # Pixels set on it are ignored.
+    __slots__ = ("pixels",)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+_NO_STAGE = _NoStage()
+
+
+def stage(name, pixels=0):
+    """Mark a stage of an algorithm, as a context manager.
+
+    :param str name: Name of the stage.
+    :param int pixels: Number of pixels processed in the stage, which can
+        also be set as the ``pixels`` attribute of the stage within it.
+    :return: A context manager that records the stage in the active
+        profiles, or does nothing if there are none.
+
+    """
+    if not _profiles.get():
+        return _NO_STAGE
+    return _Stage(name, pixels)
+
+
+def record_cache(name, hits=0, misses=0):
+    """Record lookups of a cache in the active profiles.
+
+    :param str name: Name of the cache.
+    :param int hits: Number of lookups that found their value.
+    :param int misses: Number of lookups that did not.
+
+    """
+    for profile in _profiles.get():
+        profile._add_cache(name, hits, misses)
+
+
+def enabled():
+    """If any profile is active in the calling thread or task."""
+    return bool(_profiles.get())
+
+
+def context():
+    """The active profiles and the open stage of the calling thread or task.
+
+    :return: An opaque value, to record work handed to other threads with
+        :func:`use_context`.
+
+    """
+    return _profiles.get(), _stage_path.get()
+
+
+@contextlib.contextmanager
+def use_context(context):
+    """Record the calls made within it as if made in another thread.
+
+    Stages are recorded in the profiles of the :func:`context`, nested in
+    its open stage.
+
+    :param context: The value of :func:`context` in the other thread.
+
+    """
+    profiles, path = context
+    profiles_token = _profiles.set(profiles)
+    path_token = _stage_path.set(path)
+    try:
+        yield
+    finally:
+        _stage_path.reset(path_token)
+        _profiles.reset(profiles_token)
@@ -0,0 +1,458 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+quantization
+-----------
+
+Colour quantization algorithms for creating palettes from images.
+
+"""
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+from __future__ import absolute_import
+
+import heapq
+import itertools
+
+import numpy as np
+
+from hitherdither import profiling
+from hitherdither.spatial import closest_colours
+
+# Histograms with at most this many cells are counted densely.
+_MAX_DENSE_CELLS = 2**18
+
+
+def image_pixels(image):
+    """Get the pixels of an image as a ``[P x C]`` ``uint8`` array.
+
+    :param image: A :class:`PIL.Image` or an ``[M x N x C]`` or ``[M x N]``
+        array. Arrays that are not ``uint8`` are rounded and clipped.
+    :return: The pixels, without copying ``uint8`` arrays where possible.
+
+    """
+    img = np.asarray(image)
+    if img.dtype != np.uint8:
+        img = np.clip(np.rint(img), 0, 255).astype("uint8")
+    if img.ndim == 2:
+        return img.reshape((-1, 1))
+    return img.reshape((-1, img.shape[-1]))
+
+
+class ColourHistogram(object):
+    """Histogram of the colours of an image over a grid of cells.
+
+    Every channel is quantized to its ``bits`` most significant bits. Only
+    cells that contain pixels are kept, with their pixel count and the sum
+    of their pixels, so that the mean colour of any set of cells is exact.
+
+    :param pixels: A ``[P x C]`` ``uint8`` array, see :func:`image_pixels`.
+    :param int bits: Bits per channel of the grid, 1 to 8.
+    :param int stride: Only use every ``stride``-th pixel.
+
+    """
+
+    def __init__(self, pixels, bits=5, stride=1):
+        if not 1 <= bits <= 8:
+            raise ValueError("Histogram precision must be between 1 and 8 bits.")
+        pixels = pixels[::stride]
+        with profiling.stage("histogram", len(pixels)):
+            self._count(pixels, bits)
+
+    def _count(self, pixels, bits):
+        self.bits = bits
+        n_channels = pixels.shape[1]
+        shift = 8 - bits
+
+        keys = np.zeros(len(pixels), "int64")
+        for c in range(n_channels):
+            keys <<= bits
+            keys |= pixels[:, c] >> shift
+        n_cells = 1 << (bits * n_channels)
+        if n_cells <= max(_MAX_DENSE_CELLS, len(pixels)):
+            counts = np.bincount(keys, minlength=n_cells)
+            occupied = np.flatnonzero(counts)
+            inverse = None
+            self.counts = counts[occupied]
+        else:
+            occupied, inverse, self.counts = np.unique(
+                keys, return_inverse=True, return_counts=True
+            )
+            inverse = inverse.ravel()
+
+        self.cells = np.empty((len(occupied), n_channels), "intp")
+        self.sums = np.empty((len(occupied), n_channels), "float")
+        for c in range(n_channels):
+            shift_c = bits * (n_channels - 1 - c)
+            self.cells[:, c] = (occupied >> shift_c) & ((1 << bits) - 1)
+            if inverse is None:
+                sums = np.bincount(keys, weights=pixels[:, c], minlength=n_cells)
+                self.sums[:, c] = sums[occupied]
+            else:
+                self.sums[:, c] = np.bincount(inverse, weights=pixels[:, c])
+
+    def __len__(self):
+        return len(self.counts)
+
+    def mean_colour(self, cells):
+        """Mean colour of the pixels in some cells, rounded to ``uint8``."""
+        total = self.sums[cells].sum(axis=0) / self.counts[cells].sum()
+        return np.clip(np.rint(total), 0, 255).astype("uint8")
+
+
+def median_cut(histogram, n, dim=None):
+    """Split the cells of a histogram into ``n`` boxes by median cut.
+
+    Boxes are split in turn, the box with the largest range along any
+    channel first and the most populated of equal boxes first, at the
+    weighted median of that channel. Splitting stops when ``n`` boxes
+    are made or no box spans more than one cell.
+
+    Reference: https://en.wikipedia.org/wiki/Median_cut
+
+    :param :class:`ColourHistogram` histogram: The colours to split.
+    :param int n: The number of boxes to make.
+    :param int dim: If given, always split along this channel.
+    :return: A list of arrays of cell indices, one per box.
+
+    """
+    cells, counts = histogram.cells, histogram.counts
+    heap = []
+    # Keeps the order of equal boxes stable.
+    counter = itertools.count()
+
+    def push(box):
+        coords = cells[box]
+        ranges = coords.max(axis=0) - coords.min(axis=0)
+        split_dim = np.argmax(ranges) if dim is None else dim
+        entry = (-ranges[split_dim], -counts[box].sum(), next(counter), split_dim, box)
+        heapq.heappush(heap, entry)
+
+    push(np.arange(len(cells)))
+    boxes = []
+    while heap and len(heap) + len(boxes) < n:
+        negative_range, _, _, split_dim, box = heapq.heappop(heap)
+        if negative_range == 0:
+            boxes.append(box)
+            continue
+        coords = cells[box, split_dim]
+        lo = coords.min()
+        # Weighted median by counting the pixels per coordinate value.
+        cumulative = np.cumsum(np.bincount(coords - lo, weights=counts[box]))
+        split = np.searchsorted(cumulative, cumulative[-1] / 2.0)
+        split = min(split, len(cumulative) - 2)
+        lower = coords - lo <= split
+        push(box[lower])
+        push(box[~lower])
+    return boxes + [entry[-1] for entry in heap]
+
+
+def _random_state(random_state):
+    if isinstance(random_state, np.random.RandomState):
+        return random_state
+    return np.random.RandomState(random_state)
+
+
+def _squared_distances(points, point):
+    difference = points - point
+    return np.einsum("ij,ij->i", difference, difference)
+
+
+def _draw(rng, weights):
+    # One index with probability proportional to its weight, without the
+    # checks that make RandomState.choice slow on many points.
+    cumulative = np.cumsum(weights)
+    index = np.searchsorted(cumulative, rng.random_sample() * cumulative[-1], "right")
+    return min(index, len(weights) - 1)
+
+
+def kmeans_plus_plus(points, weights, n, random_state=None):
+    """Choose ``n`` initial centroids among weighted points by k-means++.
+
+    The first centroid is drawn with probability proportional to the
+    weight of a point, and every following one proportional to the weight
+    times the squared distance to the closest centroid already chosen.
+    Fewer centroids are returned if there are fewer than ``n`` distinct
+    points.
+
+    Reference: Arthur, D. and Vassilvitskii, S., "k-means++: The
+    Advantages of Careful Seeding", 2007.
+
+    :param points: ``[P x C]`` array of points.
+    :param weights: ``[P]`` array of positive weights, e.g. pixel counts.
+    :param int n: The number of centroids.
+    :param random_state: Seed or :class:`numpy.random.RandomState`.
+    :return: A ``[n x C]`` array of centroids.
+
+    """
+    rng = _random_state(random_state)
+    points = np.asarray(points, "float")
+    weights = np.asarray(weights, "float")
+    chosen = [_draw(rng, weights)]
+    distances = _squared_distances(points, points[chosen[0]])
+    while len(chosen) < n:
+        probabilities = weights * distances
+        if probabilities.sum() <= 0:
+            break
+        chosen.append(_draw(rng, probabilities))
+        np.minimum(
+            distances, _squared_distances(points, points[chosen[-1]]), out=distances
+        )
+    return points[chosen]
+
+
+def _closest_centroids(centroids, points, order, chunk=4096):
+    # Euclidean assignment by |c|^2 - 2 p.c, which is a matrix product
+    # instead of the spatial index built anew by closest_colours.
+    if order != 2:
+        return closest_colours(centroids, points, order)
+    norms = (centroids**2).sum(axis=1)
+    scaled = -2 * centroids.T
+    labels = np.empty(len(points), "intp")
+    for start in range(0, len(points), chunk):
+        distances = points[start : start + chunk].dot(scaled)
+        distances += norms
+        labels[start : start + chunk] = distances.argmin(axis=1)
+    return labels
+
+
+def kmeans(
+    points,
+    weights,
+    centroids,
+    max_iter=50,
+    tol=0.5,
+    batch_size=None,
+    random_state=None,
+    order=2,
+):
+    """Refine centroids of weighted points by k-means.
+
+    Without ``batch_size``, every iteration assigns all points to their
+    closest centroid and moves each centroid to the weighted mean of its
+    points. With ``batch_size``, every iteration instead draws that many
+    points, with probability proportional to their weight, and moves each
+    centroid towards the mean of its drawn points with a learning rate of
+    one over the number of points it has been assigned so far.
+
+    Points are assigned to the Euclidean closest centroid by a matrix
+    product, or by :func:`~hitherdither.spatial.closest_colours` for other
+    orders.
+    Centroids without any points keep their position. Iteration stops
+    when no centroid moves more than ``tol`` along any channel.
+
+    Reference: Sculley, D., "Web-Scale K-Means Clustering", 2010.
+
+    :param points: ``[P x C]`` array of points.
+    :param weights: ``[P]`` array of positive weights, e.g. pixel counts.
+    :param centroids: ``[K x C]`` array of initial centroids.
+    :param int max_iter: Maximum number of iterations.
+    :param float tol: Largest centroid movement at which to stop.
+    :param int batch_size: If given, the number of points per mini-batch.
+    :param random_state: Seed or :class:`numpy.random.RandomState` for
+        drawing mini-batches.
+    :param int order: Metric parameter ``ord`` of :func:`numpy.linalg.norm`
+        used for assignment.
+    :return: A ``[K x C]`` array of centroids.
+
+    """
+    points = np.asarray(points, "float")
+    weights = np.asarray(weights, "float")
+    centroids = np.array(centroids, "float")
+    n_centroids, n_channels = centroids.shape
+    if batch_size is not None:
+        rng = _random_state(random_state)
+        probabilities = weights / weights.sum()
+        seen = np.zeros(n_centroids)
+
+    for _ in range(max_iter):
+        if batch_size is None:
+            batch, batch_weights = points, weights
+        else:
+            batch = points[rng.choice(len(points), batch_size, p=probabilities)]
+            batch_weights = None
+        labels = _closest_centroids(centroids, batch, order)
+        counts = np.bincount(labels, weights=batch_weights, minlength=n_centroids)
+        sums = np.empty((n_centroids, n_channels))
+        for c in range(n_channels):
+            channel = batch[:, c] if batch_weights is None else batch[:, c] * weights
+            sums[:, c] = np.bincount(labels, weights=channel, minlength=n_centroids)
+
+        assigned = counts > 0
+        previous = centroids.copy()
+        if batch_size is None:
+            centroids[assigned] = sums[assigned] / counts[assigned, None]
+        else:
+            # The running mean of all points assigned to each centroid.
+            seen += counts
+            centroids[assigned] += (
+                sums[assigned] - counts[assigned, None] * centroids[assigned]
+            ) / seen[assigned, None]
+        if np.abs(centroids - previous).max() <= tol:
+            break
+    return centroids
+
+
+def _group_cells(labels, n_groups):
+    # Cell indices per group, in order of the cells.
+    order = np.argsort(labels, kind="stable")
+    return np.split(order, np.cumsum(np.bincount(labels, minlength=n_groups))[:-1])
+
+
+def octree(histogram, n):
+    """Merge the cells of a histogram into ``n`` groups by octree reduction.
+
+    The cells are the leaves of a tree that halves every channel per
+    level, an octree for RGB. Nodes are reduced by merging their leaves
+    into one, deepest level first and least populated node first, until
+    ``n`` leaves are left. The last node reduced may only get its least
+    populated leaves merged, to leave exactly ``n``.
+
+    Reference: Gervautz, M. and Purgathofer, W., "A Simple Method for
+    Color Quantization: Octree Quantization", 1988.
+
+    :param :class:`ColourHistogram` histogram: The colours to merge.
+    :param int n: The number of groups to make.
+    :return: A list of arrays of cell indices, one per group.
+
+    """
+    labels = np.arange(len(histogram))
+    nodes = histogram.cells
+    leaf_counts = histogram.counts
+    excess = len(labels) - n
+    depth = histogram.bits
+    while excess > 0 and depth > 0:
+        depth -= 1
+        parents = nodes >> 1
+        keys = np.zeros(len(parents), "int64")
+        for c in range(parents.shape[1]):
+            keys <<= depth
+            keys |= parents[:, c]
+        _, first, parent_of, n_children = np.unique(
+            keys, return_index=True, return_inverse=True, return_counts=True
+        )
+        parent_of = parent_of.ravel()
+        parent_counts = np.bincount(parent_of, weights=leaf_counts)
+
+        order = np.argsort(parent_counts, kind="stable")
+        reduced = np.cumsum(n_children[order] - 1)
+        n_full = np.searchsorted(reduced, excess, side="right")
+        if n_full == len(order):
+            # All nodes of this level reduced, continue one level up.
+            labels = parent_of[labels]
+            nodes = parents[first]
+            leaf_counts = parent_counts
+            excess -= reduced[-1]
+            continue
+
+        merge = np.isin(parent_of, order[:n_full])
+        remaining = excess - (reduced[n_full - 1] if n_full else 0)
+        if remaining:
+            children = np.flatnonzero(parent_of == order[n_full])
+            smallest = np.argsort(leaf_counts[children], kind="stable")
+            merge[children[smallest[: remaining + 1]]] = True
+        leaf_keys = np.where(merge, parent_of, len(first) + np.arange(len(merge)))
+        _, leaf_of = np.unique(leaf_keys, return_inverse=True)
+        labels = leaf_of.ravel()[labels]
+        excess = 0
+    return _group_cells(labels, labels.max() + 1)
+
+
+def wu(histogram, n):
+    """Split the cells of a histogram into ``n`` boxes by Wu's method.
+
+    Boxes are split in turn, the box with the largest sum of squared
+    deviations from its mean first, at the plane across any channel that
+    leaves the smallest sum for the two halves. The pixel counts, colour
+    sums and squared colour norms of any box are read from cumulative
+    moment tables over the whole grid in constant time. Deviations are
+    measured between the mean colours of the cells.
+
+    The tables take ``(2 ** bits + 1) ** C * (C + 2)`` floats for a
+    histogram of ``C`` channels.
+
+    Reference: Wu, X., "Efficient Statistical Computations for Optimal
+    Color Quantization", Graphics Gems II, 1991.
+
+    :param :class:`ColourHistogram` histogram: The colours to split.
+    :param int n: The number of boxes to make.
+    :return: A list of arrays of cell indices, one per box.
+
+    """
+    cells, counts, sums = histogram.cells, histogram.counts, histogram.sums
+    n_channels = cells.shape[1]
+    size = 1 << histogram.bits
+
+    # Moments per cell: count, colour sums and count times squared norm of
+    # the mean colour, summed over all cells up to an index in every channel.
+    moments = np.zeros((size + 1,) * n_channels + (n_channels + 2,))
+    index = tuple(cells.T + 1)
+    moments[index + (0,)] = counts
+    moments[index + (slice(1, -1),)] = sums
+    moments[index + (-1,)] = (sums**2).sum(axis=1) / counts
+    for c in range(n_channels):
+        np.cumsum(moments, axis=c, out=moments)
+
+    corners = list(itertools.product((False, True), repeat=n_channels))
+
+    def box_moments(lo, hi, dim=None, positions=None):
+        # Moments of the box from lo (exclusive) to hi (inclusive), or of
+        # the boxes with their upper bound across dim at positions.
+        total = 0.0
+        for corner in corners:
+            index = list(np.where(corner, hi, lo))
+            if dim is not None and corner[dim]:
+                index[dim] = positions
+            sign = (-1) ** (n_channels - sum(corner))
+            total = total + sign * moments[tuple(index)]
+        return total
+
+    def variance(box_sums):
+        return box_sums[-1] - (box_sums[1:-1] ** 2).sum() / box_sums[0]
+
+    def cut(lo, hi):
+        whole = box_moments(lo, hi)
+        best, best_score = None, -np.inf
+        for dim in range(n_channels):
+            positions = np.arange(lo[dim] + 1, hi[dim])
+            if not len(positions):
+                continue
+            lower = box_moments(lo, hi, dim, positions)
+            upper = whole - lower
+            valid = (lower[:, 0] > 0) & (upper[:, 0] > 0)
+            if not valid.any():
+                continue
+            lower, upper, positions = lower[valid], upper[valid], positions[valid]
+            score = (lower[:, 1:-1] ** 2).sum(axis=1) / lower[:, 0] + (
+                upper[:, 1:-1] ** 2
+            ).sum(axis=1) / upper[:, 0]
+            k = np.argmax(score)
+            if score[k] > best_score:
+                best, best_score = (dim, positions[k]), score[k]
+        return best
+
+    boxes = [(np.zeros(n_channels, "intp"), np.full(n_channels, size, "intp"))]
+    variances = [variance(box_moments(*boxes[0]))]
+    while len(boxes) < n:
+        k = int(np.argmax(variances))
+        if variances[k] <= 0:
+            break
+        lo, hi = boxes[k]
+        split = cut(lo, hi)
+        if split is None:
+            variances[k] = 0.0
+            continue
+        dim, position = split
+        lower_hi, upper_lo = hi.copy(), lo.copy()
+        lower_hi[dim] = upper_lo[dim] = position
+        boxes[k] = (lo, lower_hi)
+        boxes.append((upper_lo, hi))
+        variances[k] = variance(box_moments(lo, lower_hi))
+        variances.append(variance(box_moments(upper_lo, hi)))
+
+    tags = np.empty((size,) * n_channels, "intp")
+    for k, (lo, hi) in enumerate(boxes):
+        tags[tuple(slice(low, high) for low, high in zip(lo, hi))] = k
+    return _group_cells(tags[tuple(cells.T)], len(boxes))
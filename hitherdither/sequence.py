@@ -0,0 +1,166 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+sequence
+-----------
+
+Temporally coherent dithering of animations and video.
+
+Ordered dithering maps every pixel on its own, so the pixels that did not
+change from one frame to the next can keep their palette colour indices.
+Only the tiles that changed are dithered again, which saves time and
+keeps static parts of a scene from flickering, and the changed
+rectangles are reported, e.g. to write GIF or APNG frames as deltas.
+
+"""
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+from __future__ import absolute_import
+
+import numpy as np
+
+from hitherdither import profiling
+from hitherdither.batch import _ALGORITHMS
+
+
+def dither_sequence(
+    frames, palette, algorithm, tile_size=32, tolerance=0, output="indices", **params
+):
+    """Dither a sequence of frames, reusing indices where frames are unchanged.
+
+    Pixels are compared to the pixels their indices were last dithered
+    from, so that slow changes within ``tolerance`` do not add up. Tiles
+    with any changed pixel are dithered again, and the changed pixels get
+    the new indices. Tiles are aligned to the period of the threshold
+    matrix, so the result is the same as dithering every frame in full,
+    up to the pixels within ``tolerance``.
+
+    The boxes can be used to write only the changed parts of frames, e.g.
+    to an animated GIF that keeps the previous frame::
+
+        sequence = dither_sequence(frames, palette, "bayer", output="images", ...)
+        for image, boxes in sequence:
+            deltas = [(image.crop(box), box[:2]) for box in boxes]
+
+    :param frames: An iterable of :class:`PIL.Image` images or arrays, all
+        of the same shape, or a ``[T x M x N x 3]`` ``uint8`` array.
+    :param :class:`~hitherdither.colour.Palette` palette: The palette to use.
+    :param str algorithm: One of the ordered algorithms ``"bayer"``,
+        ``"cluster-dot"``, ``"blue-noise"``, ``"threshold-map"`` or
+        ``"yliluoma-1"``. Error diffusion spreads every change over the rest
+        of the image, so it is not supported.
+    :param int tile_size: Approximate side of the tiles that are dithered
+        again when changed, rounded up to whole periods of the threshold
+        matrix.
+    :param int tolerance: Largest difference of any channel value for a
+        pixel to count as unchanged.
+    :param str output: ``"indices"`` for arrays of palette colour indices,
+        or ``"images"`` for PIL images of type "P".
+    :param params: Parameters of the algorithm, see
+        :func:`~hitherdither.batch.dither_frames`.
+    :return: A generator of ``(indices, boxes)``, where ``indices`` is the
+        ``[M x N]`` array of palette colour indices, or the image, of a
+        frame and ``boxes`` a list of the ``(left, upper, right, lower)``
+        pixel boxes, as for :meth:`PIL.Image.Image.crop`, of the regions that
+        changed from the previous frame. The whole frame is one box for the
+        first frame.
+
+    """
+    if algorithm == "error-diffusion" or algorithm not in _ALGORITHMS:
+        raise ValueError("Unsupported algorithm for sequences: {0}".format(algorithm))
+    if output not in ("indices", "images"):
+        raise ValueError("Unknown output: {0}".format(output))
+    dither = _ALGORITHMS[algorithm](palette, **params)
+    tile_shape = (
+        -(-tile_size // dither.period) * dither.period,
+        -(-tile_size // dither.matrix_width) * dither.matrix_width,
+    )
+    return _dither_sequence(frames, palette, dither, tile_shape, tolerance, output)
+
+
+def _dither_sequence(frames, palette, dither, tile_shape, tolerance, output):
+    reference = indices = None
+    for frame in frames:
+        frame = np.asarray(frame, "uint8")
+        if reference is None:
+            reference = frame.copy()
+            indices = dither(frame)
+            boxes = [(0, 0, frame.shape[1], frame.shape[0])]
+        else:
+            if frame.shape != reference.shape:
+                raise ValueError("Frames must have the same shape.")
+            with profiling.stage("changes", frame.shape[0] * frame.shape[1]):
+                changed = _changed_pixels(frame, reference, tolerance)
+                boxes = dirty_boxes(changed, tile_shape)
+            for left, upper, right, lower in boxes:
+                rows, columns = slice(upper, lower), slice(left, right)
+                mask = changed[rows, columns]
+                region = dither(frame[rows, columns])
+                np.copyto(indices[rows, columns], region, where=mask)
+                if reference.ndim == 3:
+                    mask = mask[:, :, None]
+                np.copyto(reference[rows, columns], frame[rows, columns], where=mask)
+
+        if output == "images":
+            yield palette.create_PIL_png_from_closest_colour(indices), boxes
+        else:
+            yield indices.copy(), boxes
+
+
+def _changed_pixels(frame, reference, tolerance):
+    if tolerance <= 0:
+        changed = frame != reference
+    else:
+        difference = np.abs(frame.astype("int16") - reference)
+        changed = difference > tolerance
+    if changed.ndim == 3:
+        changed = changed.any(axis=2)
+    return changed
+
+
+def dirty_boxes(changed, tile_shape):
+    """The tiles with changed pixels, merged into boxes.
+
+    Runs of changed tiles in a row of tiles make a box, which is merged
+    with the box of the row of tiles above if it spans the same columns.
+
+    :param changed: ``[M x N]`` boolean array of the changed pixels.
+    :param tuple tile_shape: ``(height, width)`` of the tiles.
+    :return: A list of ``(left, upper, right, lower)`` pixel boxes, clipped
+        to the array, with their corners on tile corners.
+
+    """
+    height, width = changed.shape
+    tile_height, tile_width = tile_shape
+    n_rows, n_columns = -(-height // tile_height), -(-width // tile_width)
+    padded = np.zeros((n_rows * tile_height, n_columns * tile_width), "bool")
+    padded[:height, :width] = changed
+    tiles = padded.reshape((n_rows, tile_height, n_columns, tile_width)).any(
+        axis=(1, 3)
+    )
+
+    boxes = []
+    # The boxes of the previous row of tiles, by their span of columns.
+    previous = {}
+    for row in range(n_rows):
+        # Starts and ends of the runs of changed tiles.
+        edges = np.flatnonzero(np.diff(np.concatenate(([0], tiles[row], [0]))))
+        current = {}
+        lower = min(height, (row + 1) * tile_height)
+        for start, end in zip(edges[::2], edges[1::2]):
+            box = previous.get((start, end))
+            if box is None:
+                box = [
+                    start * tile_width,
+                    row * tile_height,
+                    min(width, end * tile_width),
+                    lower,
+                ]
+                boxes.append(box)
+            else:
+                box[3] = lower
+            current[(start, end)] = box
+        previous = current
+    return [tuple(int(v) for v in box) for box in boxes]
@@ -0,0 +1,239 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+spatial
+-----------
+
+Spatial index for nearest palette colour queries.
+
+"""
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+from __future__ import absolute_import
+
+import numpy as np
+
+# Metrics for which the box distance bounds below are valid.
+SUPPORTED_ORDERS = (1, 2, np.inf)
+
+# Palettes with at least this many colours use a spatial index for
+# closest colour queries.
+SPATIAL_INDEX_MIN_COLOURS = 32
+
+
+class GridIndex(object):
+    """Uniform grid over RGB space with candidate colours per cell.
+
+    For every cell, only palette colours whose smallest possible distance
+    to the cell does not exceed the largest distance from the cell to
+    some single colour can be closest to a point in it. Queries then only
+    measure distances to the candidates of their cell, which are kept in
+    palette order so that ties resolve to the lowest index, as with
+    :func:`numpy.argmin` over all colours.
+
+    Pixels outside the grid are compared to all colours.
+
+    :param :class:`numpy.ndarray` colours: ``[N x 3]`` palette colours.
+    :param int order: Metric parameter ``ord`` of :func:`numpy.linalg.norm`,
+        one of ``1``, ``2`` or ``numpy.inf``.
+    :param int cells: Number of grid cells along each axis.
+
+    """
+
+    def __init__(self, colours, order=2, cells=16):
+        if order not in SUPPORTED_ORDERS:
+            raise ValueError("Unsupported metric order: {0}".format(order))
+        self.colours = np.array(colours, "float")
+        self.order = order
+        self.cells = cells
+        self.lo = min(0.0, self.colours.min())
+        self.hi = max(255.0, self.colours.max())
+        self.cell_size = (self.hi - self.lo) / cells
+
+        # Per axis, the smallest and largest distance from the cell slabs
+        # to every colour, combined per cell below as the metric does.
+        edges = self.lo + self.cell_size * np.arange(cells + 1)
+        lo, hi = edges[:-1, None], edges[1:, None]
+        nearest = [np.maximum(np.maximum(lo - c, c - hi), 0.0) for c in self.colours.T]
+        farthest = [np.maximum(np.abs(c - lo), np.abs(c - hi)) for c in self.colours.T]
+
+        is_candidate = np.empty((cells, cells, cells, len(self.colours)), "bool")
+        for i in range(cells):
+            min_distance = self._combine([nearest[0][i], nearest[1], nearest[2]])
+            max_distance = self._combine([farthest[0][i], farthest[1], farthest[2]])
+            bound = max_distance.min(axis=-1, keepdims=True)
+            # Leave some slack for rounding in the bounds.
+            is_candidate[i] = min_distance <= bound * (1.0 + 1e-9) + 1e-9
+        is_candidate = is_candidate.reshape((-1, len(self.colours)))
+
+        # Candidates first, in palette order.
+        n_candidates = is_candidate.sum(axis=1)
+        width = n_candidates.max()
+        ranked = np.argsort(~is_candidate, axis=1, kind="stable")[:, :width]
+        self.candidates = [row[:k] for row, k in zip(ranked, n_candidates)]
+        # Pad with the first candidate of the cell, which precedes the padding
+        # and therefore still wins any tie.
+        self.padded_candidates = np.where(
+            np.arange(width) < n_candidates[:, None], ranked, ranked[:, :1]
+        ).astype("intp")
+
+    def _combine(self, axes):
+        # Distances of the [cells x cells] cells of a slab from per axis
+        # distances of shapes [N], [cells x N] and [cells x N].
+        x, y, z = axes[0], axes[1][:, None, :], axes[2][None, :, :]
+        if self.order == 1:
+            return x + y + z
+        if self.order == 2:
+            return np.sqrt(x * x + y * y + z * z)
+        return np.maximum(np.maximum(x, y), z)
+
+    def _cell(self, pixels):
+        cell = np.floor((pixels - self.lo) / self.cell_size).astype("intp")
+        np.clip(cell, 0, self.cells - 1, out=cell)
+        return (cell[..., 0] * self.cells + cell[..., 1]) * self.cells + cell[..., 2]
+
+    def _inside(self, pixels):
+        return np.all((pixels >= self.lo) & (pixels <= self.hi), axis=-1)
+
+    def query(self, pixels, chunk_size=16384):
+        """Get the index of the closest colour for many pixels.
+
+        :param pixels: A ``[... x 3]`` array of colours.
+        :param int chunk_size: Number of pixels to measure at a time.
+        :return: An array of palette colour indices of shape ``[...]``.
+
+        """
+        pixels = np.asarray(pixels)
+        flat = pixels.reshape((-1, 3))
+        result = np.empty(len(flat), "intp")
+        for start in range(0, len(flat), chunk_size):
+            chunk = np.asarray(flat[start : start + chunk_size], "float")
+            candidates = self.padded_candidates[self._cell(chunk)]
+            distances = np.linalg.norm(
+                chunk[:, None, :] - self.colours[candidates], ord=self.order, axis=2
+            )
+            best = candidates[np.arange(len(chunk)), np.argmin(distances, axis=1)]
+            outside = ~self._inside(chunk)
+            if outside.any():
+                distances = np.linalg.norm(
+                    chunk[outside, None, :] - self.colours[None, :, :],
+                    ord=self.order,
+                    axis=2,
+                )
+                best[outside] = np.argmin(distances, axis=1)
+            result[start : start + chunk_size] = best
+        return result.reshape(pixels.shape[:-1])
+
+    def query_pixel(self, pixel):
+        """Get the index of the closest colour for a single pixel.
+
+        :param pixel: A colour of length 3.
+        :return: The palette colour index.
+
+        """
+        pixel = np.asarray(pixel, "float")
+        if not self._inside(pixel):
+            candidates = np.arange(len(self.colours))
+        else:
+            candidates = self.candidates[self._cell(pixel)]
+        distances = np.linalg.norm(
+            pixel - self.colours[candidates], ord=self.order, axis=1
+        )
+        return candidates[np.argmin(distances)]
+
+
+def closest_colours(colours, pixels, order=2, chunk_size=16384):
+    """Get the index of the closest colour for many pixels.
+
+    Uses a :class:`GridIndex` for many colours and measures distances to
+    all colours otherwise, a chunk of pixels at a time.
+
+    :param colours: ``[N x C]`` colours to choose from.
+    :param pixels: A ``[P x C]`` array of colours.
+    :param int order: Metric parameter ``ord`` of :func:`numpy.linalg.norm`.
+    :param int chunk_size: Number of pixels to measure at a time.
+    :return: A ``[P]`` array of colour indices.
+
+    """
+    colours = np.asarray(colours)
+    if (
+        len(colours) >= SPATIAL_INDEX_MIN_COLOURS
+        and colours.shape[1] == 3
+        and order in SUPPORTED_ORDERS
+    ):
+        return GridIndex(colours, order=order).query(pixels, chunk_size)
+    colours = np.asarray(colours, "float")
+    result = np.empty(len(pixels), "intp")
+    for start in range(0, len(pixels), chunk_size):
+        chunk = np.asarray(pixels[start : start + chunk_size], "float")
+        distances = np.linalg.norm(
+            chunk[:, None, :] - colours[None, :, :], ord=order, axis=2
+        )
+        result[start : start + chunk_size] = np.argmin(distances, axis=1)
+    return result
+
+
+def closest_colours_on_grid(colours, levels, order=2, block=16, out=None):
+    """Get the index of the closest colour for every point of a regular grid.
+
+    The grid is split into cubic blocks, and every block only measures the
+    colours whose smallest possible distance to it does not exceed the
+    largest distance from it to some single colour, as in
+    :class:`GridIndex`. Distances are added up from per axis tables, so
+    memory use is bounded by the size of a block.
+
+    :param colours: ``[N x 3]`` colours to choose from.
+    :param levels: The ``L`` coordinates of the grid along every axis.
+    :param int order: Metric parameter ``ord`` of :func:`numpy.linalg.norm`,
+        one of ``1``, ``2`` or ``numpy.inf``.
+    :param int block: Number of levels along each axis of the blocks.
+    :param out: An ``[L x L x L]`` integer array to write the indices to.
+    :return: An ``[L x L x L]`` array of colour indices.
+
+    """
+    if order not in SUPPORTED_ORDERS:
+        raise ValueError("Unsupported metric order: {0}".format(order))
+    colours = np.asarray(colours, "float")
+    levels = np.asarray(levels, "float")
+    if out is None:
+        out = np.empty((len(levels),) * 3, "intp")
+
+    # Distances along every axis from every level to every colour, squared
+    # for the Euclidean metric so that they add up.
+    axes = np.abs(levels[None, :, None] - colours.T[:, None, :])
+    if order == 2:
+        axes *= axes
+    blocks = [slice(start, start + block) for start in range(0, len(levels), block)]
+    nearest = np.array([[axis[b].min(axis=0) for b in blocks] for axis in axes])
+    farthest = np.array([[axis[b].max(axis=0) for b in blocks] for axis in axes])
+
+    def combine(x, y, z):
+        if order == np.inf:
+            return np.maximum(np.maximum(x, y), z)
+        return x + y + z
+
+    for i, rows in enumerate(blocks):
+        # Candidates of the blocks of a slab, [blocks x blocks x N].
+        shape = (1, 1, -1)
+        min_distance = combine(
+            nearest[0, i].reshape(shape), nearest[1][:, None], nearest[2][None]
+        )
+        max_distance = combine(
+            farthest[0, i].reshape(shape), farthest[1][:, None], farthest[2][None]
+        )
+        bound = max_distance.min(axis=-1, keepdims=True)
+        # Leave some slack for rounding in the bounds.
+        is_candidate = min_distance <= bound * (1.0 + 1e-9) + 1e-9
+        for j, columns in enumerate(blocks):
+            for k, depths in enumerate(blocks):
+                # In palette order, so that ties resolve to the lowest index.
+                candidates = np.flatnonzero(is_candidate[j, k])
+                distances = combine(
+                    axes[0][rows, candidates][:, None, None],
+                    axes[1][columns, candidates][None, :, None],
+                    axes[2][depths, candidates][None, None],
+                )
+                out[rows, columns, depths] = candidates[np.argmin(distances, axis=-1)]
+    return out
@@ -0,0 +1,163 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+streaming
+-----------
+
+Dithering of images too large for memory, in strips of rows.
+
+"""
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+from __future__ import absolute_import
+
+import numpy as np
+from PIL import Image
+
+from hitherdither.batch import _ALGORITHMS
+from hitherdither.diffusion import (
+    _DIFFUSION_MAPS,
+    _iter_error_diffusion_numba,
+    _iter_error_diffusion_rows,
+)
+from hitherdither._jit import HAS_NUMBA
+from hitherdither.utils import index_array
+
+
+def open_raw_image(filename, height, width, channels=3, offset=0):
+    """Open a raw ``uint8`` image file as a read-only memory map.
+
+    Rows are only read from disk when they are used, so such images can
+    be dithered in strips regardless of their size.
+
+    :param str filename: Path to the file, with rows of ``width`` pixels of
+        ``channels`` interleaved values each.
+    :param int height: Number of rows.
+    :param int width: Number of pixels per row.
+    :param int channels: Number of values per pixel.
+    :param int offset: Size of any header before the pixel data, in bytes.
+    :return: A ``[height x width x channels]`` :class:`numpy.memmap`.
+
+    """
+    return np.memmap(
+        filename, "uint8", "r", offset=offset, shape=(height, width, channels)
+    )
+
+
+def iter_strips(source, strip_height=256):
+    """Read an image in strips of rows.
+
+    :param source: A :class:`PIL.Image`, or an array such as a
+        :class:`numpy.memmap` from :func:`open_raw_image`.
+    :param int strip_height: Number of rows per strip.
+    :return: A generator of ``(y, strip)``, where ``strip`` is a ``uint8``
+        array of the rows from ``y``.
+
+    """
+    if isinstance(source, Image.Image):
+        width, height = source.size
+        for y in range(0, height, strip_height):
+            strip = source.crop((0, y, width, min(height, y + strip_height)))
+            yield y, np.asarray(strip, "uint8")
+    else:
+        for y in range(0, len(source), strip_height):
+            yield y, np.asarray(source[y : y + strip_height], "uint8")
+
+
+class _StripRows(object):
+    """Rows of an image, read in strips as they are requested in order."""
+
+    def __init__(self, source, strip_height):
+        if isinstance(source, Image.Image):
+            width, height = source.size
+            first_row = np.asarray(source.crop((0, 0, width, 1)))
+            self.shape = (height,) + first_row.shape[1:]
+        else:
+            self.shape = source.shape
+        self.strips = iter_strips(source, strip_height)
+        self.start = 0
+        self.strip = np.empty((0,) + tuple(self.shape[1:]), "uint8")
+
+    def __getitem__(self, y):
+        while y >= self.start + len(self.strip):
+            self.start, self.strip = next(self.strips)
+        return self.strip[y - self.start]
+
+
+def stream_dithering(source, palette, algorithm, strip_height=256, **params):
+    """Dither an image in strips of rows, in constant memory.
+
+    Ordered dithering processes strips whose height is a multiple of the
+    size of the threshold matrix, so the pattern continues across strips.
+    Error diffusion keeps the rows that receive error from the current
+    row between strips and gives the same result as for the whole image.
+
+    The index strips can be written out as they come, e.g. to a
+    :class:`numpy.memmap`::
+
+        out = np.memmap("out.raw", "uint8", "w+", shape=(height, width))
+        for y, indices in stream_dithering(source, palette, "bayer", ...):
+            out[y : y + len(indices)] = indices
+
+    :param source: A :class:`PIL.Image`, or an array such as a
+        :class:`numpy.memmap` from :func:`open_raw_image`.
+    :param :class:`~hitherdither.colour.Palette` palette: The palette to use.
+    :param str algorithm: One of ``"bayer"``, ``"cluster-dot"``,
+        ``"blue-noise"``, ``"threshold-map"``, ``"yliluoma-1"`` or
+        ``"error-diffusion"``.
+    :param int strip_height: Number of rows to read and yield at a time.
+    :param params: Parameters of the algorithm, see
+        :func:`~hitherdither.batch.dither_frames`. Error diffusion supports
+        ``method``, ``order``, ``serpentine`` and the ``"rows"`` and
+        ``"numba"`` backends.
+    :return: A generator of ``(y, indices)``, where ``indices`` is an array
+        of the palette colour indices of the rows from ``y``.
+
+    """
+    if algorithm == "error-diffusion":
+        return _stream_error_diffusion(source, palette, strip_height, **params)
+    if algorithm not in _ALGORITHMS:
+        raise ValueError("Unknown dithering algorithm: {0}".format(algorithm))
+    return _stream_ordered(
+        source, _ALGORITHMS[algorithm](palette, **params), strip_height
+    )
+
+
+def _stream_ordered(source, dither, strip_height):
+    # Round up to whole periods of the threshold matrix.
+    strip_height = -(-strip_height // dither.period) * dither.period
+    for y, strip in iter_strips(source, strip_height):
+        yield y, dither(strip)
+
+
+def _stream_error_diffusion(
+    source,
+    palette,
+    strip_height,
+    method="floyd-steinberg",
+    order=2,
+    backend="auto",
+    serpentine=False,
+):
+    if backend == "auto":
+        backend = "numba" if HAS_NUMBA else "rows"
+    if backend == "rows":
+        iter_rows = _iter_error_diffusion_rows
+    elif backend == "numba":
+        if not HAS_NUMBA:
+            raise ImportError("The numba backend requires Numba to be installed.")
+        iter_rows = _iter_error_diffusion_numba
+    else:
+        raise ValueError("Unsupported streaming backend: {0}".format(backend))
+    diff_map = _DIFFUSION_MAPS.get(method.lower())
+
+    rows = _StripRows(source, strip_height)
+    height, width = rows.shape[:2]
+    indices = index_array((min(strip_height, height), width), len(palette))
+    for y, cc_row in iter_rows(rows, palette, diff_map, order, serpentine):
+        n = y % strip_height
+        indices[n] = cc_row
+        if n == strip_height - 1 or y == height - 1:
+            yield y - n, indices[: n + 1].copy()
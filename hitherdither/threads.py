@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+threads
+-----------
+
+A thread pool shared by all calls in a process, for mapping images to
+palettes and ordered dithering in bands of rows.
+
+NumPy releases the GIL in most array operations, and the Numba kernels are
+compiled to release it, so the bands of an image are processed on all
+cores without copying or pickling. The pool is off by default. It is
+enabled for the whole process, e.g. in a threaded web server, with
+:func:`set_threads` or the ``HITHERDITHER_THREADS`` environment variable.
+
+Calls made by the threads of the pool, such as mapping a band to the
+palette, run in the calling thread, so the pool never waits on itself.
+
+"""
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+from __future__ import absolute_import
+
+import os
+import threading
+
+from hitherdither import profiling
+
+# Bands of fewer pixels are not worth handing to another thread.
+MIN_BAND_PIXELS = 2**15
+
+_threads = 1
+_pool = None
+_lock = threading.Lock()
+_local = threading.local()
+
+
+def set_threads(n=None):
+    """Set the number of threads of the shared pool.
+
+    :param int n: Number of threads, ``1`` to process images in the calling
+        thread only, or ``None`` for the number of CPUs.
+
+    """
+    global _threads, _pool
+    n = n or os.cpu_count() or 1
+    with _lock:
+        if _pool is not None and n != _threads:
+            # Running tasks finish, new ones go to a new pool.
+            _pool.shutdown(wait=False)
+            _pool = None
+        _threads = n
+
+
+def get_threads():
+    """The number of threads of the shared pool."""
+    return _threads
+
+
+def active():
+    """If images are split over the shared pool in the calling thread."""
+    return _threads > 1 and not getattr(_local, "in_pool", False)
+
+
+def band_rows(height, width, n_rows, period=1):
+    """The number of rows of the bands to process an image in.
+
+    :param int height: Number of rows of the image.
+    :param int width: Number of pixels per row.
+    :param int n_rows: Largest number of rows per band, e.g. to bound
+        memory use.
+    :param int period: The number of rows is rounded down to a multiple of
+        this, but not below it.
+    :return: ``n_rows``, or if the shared pool is :func:`active`, fewer for
+        every thread to get a band, down to :data:`MIN_BAND_PIXELS` pixels
+        per band.
+
+    """
+    if active():
+        per_thread = max(-(-height // _threads), MIN_BAND_PIXELS // max(1, width))
+        n_rows = min(n_rows, per_thread)
+    return max(1, n_rows // period) * period
+
+
+def for_each(function, items):
+    """Call a function for every item, in the shared pool if it is active.
+
+    :param function: The function, called with one item at a time. Calls
+        may run at the same time in different threads.
+    :param items: The items.
+    :return: The results of the calls, in order.
+
+    """
+    global _pool
+    items = list(items)
+    if len(items) <= 1 or not active():
+        return [function(item) for item in items]
+    with _lock:
+        if _pool is None:
+            # Imported here, as most uses do not need it.
+            from concurrent.futures import ThreadPoolExecutor
+
+            _pool = ThreadPoolExecutor(_threads, thread_name_prefix="hitherdither")
+        context = profiling.context()
+        futures = [_pool.submit(_in_pool, function, item, context) for item in items]
+    return [future.result() for future in futures]
+
+
+def _in_pool(function, item, context):
+    _local.in_pool = True
+    try:
+        with profiling.use_context(context):
+            return function(item)
+    finally:
+        _local.in_pool = False
+
+
+set_threads(int(os.environ.get("HITHERDITHER_THREADS", 1)))
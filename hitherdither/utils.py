@@ -20,8 +20,45 @@ from PIL import Image
 
 
 def np2pil(img):
-    return Image.fromarray(np.array(img, "uint8"))
+    return Image.fromarray(np.asarray(img, "uint8"))
 
 
-def pil2np(img):
+def pil2np(img, copy=False):
+    """Get an image as a writeable ``uint8`` array.
+
+    Arrays that already are ``uint8`` are returned as they are, unless
+    ``copy`` is set. Other images are always copied.
+
+    """
+    if not copy and isinstance(img, np.ndarray) and img.dtype == np.uint8:
+        return img
     return np.array(img, "uint8")
+
+
+def index_array(shape, n_colours, out=None):
+    """Get an array for the palette colour indices of an image.
+
+    :param tuple shape: The ``(M, N)`` shape of the image.
+    :param int n_colours: Number of colours in the palette.
+    :param :class:`numpy.ndarray` out: A buffer supplied by the caller, to
+        be checked and returned. If ``None``, a ``uint8`` array is
+        allocated, ``uint16`` for palettes of more than 256 colours.
+    :return: The index array.
+
+    """
+    if out is None:
+        return np.empty(shape, "uint8" if n_colours <= 256 else "uint16")
+    if tuple(out.shape) != tuple(shape):
+        raise ValueError(
+            "Output has shape {0}, expected {1}.".format(out.shape, tuple(shape))
+        )
+    if (
+        not np.issubdtype(out.dtype, np.integer)
+        or np.iinfo(out.dtype).max < n_colours - 1
+    ):
+        raise ValueError(
+            "Output of type {0} cannot hold {1} colour indices.".format(
+                out.dtype, n_colours
+            )
+        )
+    return out
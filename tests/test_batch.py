@@ -0,0 +1,151 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+:mod:`test_batch`
+=======================
+
+"""
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+from __future__ import absolute_import
+
+import pytest
+import numpy as np
+from PIL import Image
+
+from hitherdither import batch
+from hitherdither.data import palette as data_palette
+from hitherdither.diffusion import (
+    error_diffusion_dithering,
+    error_diffusion_dithering_indices,
+)
+from hitherdither.ordered.bayer import bayer_dithering, bayer_dithering_indices
+from hitherdither.ordered.blue_noise import (
+    blue_noise_dithering,
+    blue_noise_dithering_indices,
+)
+from hitherdither.ordered.cluster import (
+    cluster_dot_dithering,
+    cluster_dot_dithering_indices,
+)
+from hitherdither.ordered.threshold import (
+    threshold_map_dithering,
+    threshold_map_dithering_indices,
+)
+from hitherdither.ordered.yliluoma import (
+    yliluomas_1_ordered_dithering,
+    yliluomas_1_ordered_dithering_indices,
+)
+from hitherdither.palette import Palette
+
+_THRESHOLDS = [64, 64, 64]
+
+_ALGORITHMS = [
+    ("bayer", bayer_dithering, {"thresholds": _THRESHOLDS, "order": 4}),
+    ("cluster-dot", cluster_dot_dithering, {"thresholds": _THRESHOLDS}),
+    ("yliluoma-1", yliluomas_1_ordered_dithering, {}),
+    ("error-diffusion", error_diffusion_dithering, {"method": "stucki"}),
+    ("blue-noise", blue_noise_dithering, {"thresholds": _THRESHOLDS, "shape": 16}),
+    (
+        "threshold-map",
+        threshold_map_dithering,
+        {"thresholds": _THRESHOLDS, "threshold_matrix": np.linspace(0, 1, 6)[None]},
+    ),
+]
+
+
+@pytest.fixture(scope="module")
+def frames():
+    rng = np.random.RandomState(0)
+    return rng.randint(0, 256, (5, 11, 17, 3)).astype("uint8")
+
+
+@pytest.fixture(scope="module")
+def reference_palette():
+    return Palette(data_palette())
+
+
+@pytest.mark.parametrize("algorithm, function, params", _ALGORITHMS)
+def test_dither_frames_matches_single_images(
+    frames, reference_palette, algorithm, function, params
+):
+    expected = [
+        np.array(function(Image.fromarray(frame), reference_palette, **params))
+        for frame in frames
+    ]
+    result = batch.dither_frames(frames, reference_palette, algorithm, **params)
+    assert isinstance(result, np.ndarray) and result.shape == frames.shape[:3]
+    np.testing.assert_array_equal(result, expected)
+
+    images = [Image.fromarray(frame) for frame in frames]
+    result = batch.dither_frames(
+        iter(images), reference_palette, algorithm, output="images", **params
+    )
+    assert [image.mode for image in result] == ["P"] * len(frames)
+    np.testing.assert_array_equal([np.array(image) for image in result], expected)
+
+
+@pytest.mark.parametrize("algorithm, function, params", _ALGORITHMS[::3])
+def test_dither_frames_in_processes(
+    frames, reference_palette, algorithm, function, params
+):
+    # Shared memory needs Python 3.8.
+    pytest.importorskip("multiprocessing.shared_memory")
+    expected = batch.dither_frames(frames, reference_palette, algorithm, **params)
+    result = batch.dither_frames(
+        list(frames), reference_palette, algorithm, processes=2, **params
+    )
+    np.testing.assert_array_equal(result, expected)
+
+
+@pytest.mark.parametrize("algorithm", ["bayer", "error-diffusion"])
+def test_dither_frames_in_processes_with_lut(frames, algorithm):
+    pytest.importorskip("multiprocessing.shared_memory")
+    palette = Palette(data_palette())
+    # A coarse table maps many colours differently from the exact search.
+    palette.build_lut(bits=3)
+    params = {"thresholds": [64, 64, 64]} if algorithm == "bayer" else {}
+    expected = batch.dither_frames(frames, palette, algorithm, **params)
+    result = batch.dither_frames(frames, palette, algorithm, processes=2, **params)
+    np.testing.assert_array_equal(result, expected)
+
+
+def test_dither_frames_errors(frames, reference_palette):
+    with pytest.raises(ValueError):
+        batch.dither_frames(frames, reference_palette, "ostromoukhov")
+    with pytest.raises(ValueError):
+        batch.dither_frames(frames, reference_palette, "yliluoma-1", output="gif")
+    with pytest.raises(ValueError):
+        batch.dither_frames(
+            [frames[0], frames[0, :5]], reference_palette, "yliluoma-1", processes=2
+        )
+
+
+@pytest.mark.parametrize("algorithm, function, params", _ALGORITHMS)
+def test_indices_variants_write_to_out(
+    frames, reference_palette, algorithm, function, params
+):
+    indices_function = {
+        "bayer": bayer_dithering_indices,
+        "cluster-dot": cluster_dot_dithering_indices,
+        "yliluoma-1": yliluomas_1_ordered_dithering_indices,
+        "error-diffusion": error_diffusion_dithering_indices,
+        "blue-noise": blue_noise_dithering_indices,
+        "threshold-map": threshold_map_dithering_indices,
+    }[algorithm]
+    expected = np.array(
+        function(Image.fromarray(frames[0]), reference_palette, **params)
+    )
+    out = np.full(frames.shape[:3], 255, "uint8")
+    result = indices_function(frames[1], reference_palette, out=out[1], **params)
+    assert np.shares_memory(result, out)
+    result = indices_function(frames[0], reference_palette, out=out[0], **params)
+    np.testing.assert_array_equal(out[0], expected)
+    with pytest.raises(ValueError):
+        indices_function(frames[0], reference_palette, out=out[:, 0], **params)
+    with pytest.raises(ValueError):
+        indices_function(
+            frames[0], reference_palette, out=out[0].astype("float"), **params
+        )
@@ -53,3 +53,33 @@ def test_bayer(order):
     np.testing.assert_allclose(bayer.B(order, False), _BAYER_MATRICES.get(order))
 
 
+def _recursive_index_matrix(n):
+    if n == 1:
+        return np.zeros((1, 1), "int")
+    smaller = 4 * _recursive_index_matrix(n // 2)
+    return np.block([[smaller, smaller + 2], [smaller + 3, smaller + 1]])
+
+
+@pytest.mark.parametrize("order", [1, 2, 4, 8, 16, 64, 128, 256])
+def test_index_matrix(order):
+    expected = _recursive_index_matrix(order)
+    index = bayer.I(order)
+    assert type(index) is np.ndarray
+    np.testing.assert_array_equal(index, expected)
+    np.testing.assert_array_equal(bayer.I(order, transposed=True), expected.T)
+    np.testing.assert_array_equal(np.sort(index.ravel()), np.arange(order * order))
+
+
+def test_matrices_are_cached_and_read_only():
+    assert bayer.B(64) is bayer.B(64)
+    assert bayer.I(64, True) is bayer.I(64, transposed=True)
+    with pytest.raises(ValueError):
+        bayer.B(8)[0, 0] = 0
+    with pytest.raises(ValueError):
+        bayer.I(8)[0, 0] = 0
+
+
+@pytest.mark.parametrize("order", [0, 3, 12])
+def test_matrix_order_must_be_power_of_two(order):
+    with pytest.raises(ValueError):
+        bayer.I(order)
@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+:mod:`test_cache`
+=======================
+
+"""
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+from __future__ import absolute_import
+
+import os
+
+import pytest
+import numpy as np
+
+from hitherdither import cache as hd_cache
+from hitherdither.cache import DiskCache, LRUCache
+from hitherdither.data import palette as data_palette
+from hitherdither.ordered.yliluoma import yliluomas_1_ordered_dithering_indices
+from hitherdither.palette import Palette
+
+
+@pytest.fixture
+def disk_cache(tmp_path):
+    disk_cache = DiskCache(str(tmp_path / "cache"))
+    previous = hd_cache.get_disk_cache()
+    hd_cache.set_disk_cache(disk_cache)
+    yield disk_cache
+    hd_cache.set_disk_cache(previous)
+
+
+def test_lru_cache_evicts_least_recently_used():
+    cache = LRUCache(maxsize=2)
+    cache[1] = "a"
+    cache[2] = "b"
+    assert cache.get(1) == "a"
+    cache[3] = "c"
+    assert 2 not in cache
+    assert 1 in cache and 3 in cache
+    assert cache.get(2) is None
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_disk_cache_key_depends_on_content_and_parameters():
+    colours = np.arange(12).reshape((4, 3))
+    key = DiskCache.key(colours, "lut", 6, 2)
+    assert DiskCache.key(colours.copy(), "lut", 6, 2) == key
+    assert DiskCache.key(colours, "lut", 5, 2) != key
+    assert DiskCache.key(colours[::-1], "lut", 6, 2) != key
+
+
+def test_disk_cache_round_trip(tmp_path):
+    disk_cache = DiskCache(str(tmp_path))
+    calls = []
+
+    def factory():
+        calls.append(None)
+        return np.arange(5), np.ones((2, 3), "uint8")
+
+    for _ in range(2):
+        a, b = disk_cache.get("k", factory)
+        assert isinstance(a, np.memmap) and not a.flags.writeable
+        np.testing.assert_array_equal(a, np.arange(5))
+        np.testing.assert_array_equal(b, np.ones((2, 3)))
+    assert len(calls) == 1
+    assert (disk_cache.hits, disk_cache.misses) == (1, 1)
+
+
+@pytest.mark.parametrize("policy", ["lru", "fifo"])
+def test_disk_cache_evicts_oldest(tmp_path, policy):
+    disk_cache = DiskCache(str(tmp_path), policy=policy)
+    for n, key in enumerate("abc"):
+        disk_cache.store(key, (np.zeros(1000),))
+        os.utime(os.path.join(str(tmp_path), key), (n, n))
+    disk_cache.load("a")
+    disk_cache.max_bytes = 2 * os.path.getsize(str(tmp_path / "b" / "0.npy"))
+    disk_cache.evict()
+    expected = ["a", "c"] if policy == "lru" else ["b", "c"]
+    assert sorted(key for key, _, _ in disk_cache.entries()) == expected
+
+
+def test_disk_cache_incomplete_entries_are_misses(tmp_path):
+    disk_cache = DiskCache(str(tmp_path))
+    disk_cache.store("k", (np.arange(5), np.arange(3), np.arange(2)))
+    os.remove(str(tmp_path / "k" / "1.npy"))
+    assert disk_cache.load("k") is None
+    os.remove(str(tmp_path / "k" / "0.npy"))
+    os.remove(str(tmp_path / "k" / "2.npy"))
+    assert disk_cache.load("k") is None
+
+    disk_cache.store("a", (np.arange(5),))
+    disk_cache.clear()
+    assert disk_cache.entries() == []
+    assert os.listdir(str(tmp_path)) == []
+    assert disk_cache.load("a") is None
+
+
+def test_disk_cache_unknown_policy():
+    with pytest.raises(ValueError):
+        DiskCache(policy="random")
+
+
+def test_palette_tables_are_shared_through_disk_cache(disk_cache):
+    lut = Palette(data_palette()).build_lut(bits=4)
+    assert len(disk_cache.entries()) == 1
+
+    p = Palette(data_palette())
+    np.testing.assert_array_equal(p.build_lut(bits=4), lut)
+    assert disk_cache.hits == 1
+    image = np.random.RandomState(0).randint(0, 256, (7, 9, 3)).astype("uint8")
+    cells = image >> 4
+    np.testing.assert_array_equal(
+        p.lut_closest_colour(image), lut[cells[..., 0], cells[..., 1], cells[..., 2]]
+    )
+
+
+@pytest.mark.parametrize("backend", ["numpy", "numba"])
+def test_yliluoma_tables_are_mapped_from_disk_cache(disk_cache, backend):
+    if backend == "numba":
+        pytest.importorskip("numba")
+    image = np.random.RandomState(0).randint(0, 256, (7, 9, 3)).astype("uint8")
+    expected = yliluomas_1_ordered_dithering_indices(
+        image, Palette(data_palette()), backend=backend
+    )
+    p = Palette(data_palette())
+    result = yliluomas_1_ordered_dithering_indices(image, p, backend=backend)
+    np.testing.assert_array_equal(result, expected)
+    assert disk_cache.hits == 1
+    # Used as mapped, rather than copied into every process.
+    mixing_errors = p.derived(("yliluoma_1_mixing_errors", 8, backend), None)
+    for table in (
+        mixing_errors.mixing_matrix,
+        mixing_errors.colour_component_distances,
+        mixing_errors.luma_mat,
+        mixing_errors.luma_order,
+        mixing_errors.luma_sorted,
+    ):
+        assert isinstance(table, np.memmap)
@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+:mod:`test_diffusion`
+=======================
+
+"""
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+from __future__ import absolute_import
+
+import pytest
+import numpy as np
+from PIL import Image
+
+from hitherdither import diffusion
+from hitherdither.data import palette as data_palette
+from hitherdither.palette import Palette
+
+
+@pytest.fixture(scope="module")
+def random_image():
+    rng = np.random.RandomState(0)
+    return Image.fromarray(rng.randint(0, 256, (24, 31, 3)).astype("uint8"))
+
+
+@pytest.fixture(scope="module")
+def reference_palette():
+    return Palette(data_palette())
+
+
+_BACKENDS = [
+    "rows",
+    pytest.param(
+        "numba",
+        marks=pytest.mark.skipif(
+            not diffusion.HAS_NUMBA, reason="Numba is not installed."
+        ),
+    ),
+]
+
+
+@pytest.mark.parametrize("backend", _BACKENDS)
+@pytest.mark.parametrize("method", sorted(diffusion._DIFFUSION_MAPS))
+@pytest.mark.parametrize("order", [1, 2, np.inf])
+def test_backend_matches_reference(
+    random_image, reference_palette, backend, method, order
+):
+    expected = diffusion.error_diffusion_dithering(
+        random_image, reference_palette, method, order, backend="python"
+    )
+    result = diffusion.error_diffusion_dithering(
+        random_image, reference_palette, method, order, backend=backend
+    )
+    np.testing.assert_array_equal(np.array(result), np.array(expected))
+    assert result.getpalette() == expected.getpalette()
+
+
+@pytest.mark.parametrize("backend", _BACKENDS)
+@pytest.mark.parametrize("method", ["floyd-steinberg", "stucki", "atkinson"])
+def test_serpentine_matches_reference(random_image, reference_palette, backend, method):
+    expected = diffusion.error_diffusion_dithering(
+        random_image, reference_palette, method, backend="python", serpentine=True
+    )
+    result = diffusion.error_diffusion_dithering(
+        random_image, reference_palette, method, backend=backend, serpentine=True
+    )
+    np.testing.assert_array_equal(np.array(result), np.array(expected))
+
+
+@pytest.mark.skipif(not diffusion.HAS_NUMBA, reason="Numba is not installed.")
+@pytest.mark.parametrize("method", sorted(diffusion._DIFFUSION_MAPS))
+@pytest.mark.parametrize("serpentine", [False, True])
+@pytest.mark.parametrize("n_threads", [2, 5])
+def test_wavefront_matches_serial(reference_palette, method, serpentine, n_threads):
+    rng = np.random.RandomState(1)
+    image = Image.fromarray(rng.randint(0, 256, (19, 150, 3)).astype("uint8"))
+    expected = diffusion.error_diffusion_dithering(
+        image, reference_palette, method, backend="numba", serpentine=serpentine
+    )
+    result = diffusion.error_diffusion_dithering(
+        image,
+        reference_palette,
+        method,
+        backend="numba",
+        serpentine=serpentine,
+        n_threads=n_threads,
+    )
+    np.testing.assert_array_equal(np.array(result), np.array(expected))
+
+
+def test_threads_require_numba(random_image, reference_palette):
+    with pytest.raises(ValueError):
+        diffusion.error_diffusion_dithering(
+            random_image, reference_palette, backend="rows", n_threads=2
+        )
+
+
+def test_unknown_backend(random_image, reference_palette):
+    with pytest.raises(ValueError):
+        diffusion.error_diffusion_dithering(
+            random_image, reference_palette, backend="fortran"
+        )
+
+
+@pytest.mark.parametrize("backend", ["python"] + _BACKENDS)
+def test_large_palette(backend):
+    rng = np.random.RandomState(2)
+    palette = Palette(rng.randint(0, 256, (300, 3)))
+    image = rng.randint(0, 256, (9, 11, 3)).astype("uint8")
+    result = diffusion.error_diffusion_dithering_indices(
+        image, palette, backend=backend
+    )
+    assert result.dtype == np.uint16
+    expected = diffusion.error_diffusion_dithering_indices(
+        image, palette, backend="python"
+    )
+    np.testing.assert_array_equal(result, expected)
+    assert result.max() > 255
+
+
+@pytest.mark.parametrize("backend", _BACKENDS)
+def test_reference_ignores_lut(random_image, backend):
+    palette = Palette(data_palette())
+    expected = diffusion.error_diffusion_dithering_indices(
+        random_image, palette, backend="python"
+    )
+    # A coarse table would map some of the dithered colours elsewhere.
+    palette.build_lut(bits=3)
+    for name in ("python", backend):
+        result = diffusion.error_diffusion_dithering_indices(
+            random_image, palette, backend=name
+        )
+        np.testing.assert_array_equal(result, expected)
@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+:mod:`test_imports`
+=======================
+
+"""
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+from __future__ import absolute_import
+
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+import hitherdither
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _modules_after(statement):
+    # Import in a fresh interpreter and list the modules it has loaded.
+    code = "import sys, json\n{0}\nprint(json.dumps(sorted(sys.modules)))".format(
+        statement
+    )
+    env = dict(os.environ, PYTHONPATH=_ROOT)
+    output = subprocess.check_output([sys.executable, "-c", code], env=env)
+    return set(json.loads(output.decode("utf-8")))
+
+
+def test_package_import_is_lazy():
+    modules = _modules_after("import hitherdither")
+    assert not {"numpy", "PIL", "numba", "hitherdither.palette"} & modules
+
+
+@pytest.mark.parametrize(
+    "statement",
+    [
+        "from hitherdither.ordered.bayer import bayer_dithering",
+        "import hitherdither; hitherdither.ordered.yliluoma",
+        "from hitherdither.diffusion import error_diffusion_dithering",
+    ],
+)
+def test_algorithm_import_loads_only_what_it_needs(statement):
+    modules = _modules_after(statement)
+    assert "numba" not in modules
+    assert "hitherdither.data" not in modules
+    assert "hitherdither.batch" not in modules
+    assert "hitherdither.ordered.cluster" not in modules
+
+
+def test_submodules_are_attributes():
+    assert hitherdither.palette.Palette
+    assert hitherdither.ordered.bayer.bayer_dithering
+    assert set(hitherdither.__all__) <= set(dir(hitherdither))
+    with pytest.raises(AttributeError):
+        hitherdither.no_such_module
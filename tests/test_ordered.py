@@ -0,0 +1,160 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+:mod:`test_ordered`
+=======================
+
+"""
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+from __future__ import absolute_import
+
+import pytest
+import numpy as np
+from PIL import Image
+
+from hitherdither.data import palette as data_palette
+from hitherdither.palette import Palette
+from hitherdither import cache
+from hitherdither.ordered import bayer, blue_noise, cluster, threshold
+from hitherdither.ordered._engine import ordered_dithering
+
+
+@pytest.fixture(scope="module")
+def random_image():
+    rng = np.random.RandomState(0)
+    return Image.fromarray(rng.randint(0, 256, (37, 29, 3)).astype("uint8"))
+
+
+def _addend_image(image, threshold_matrix, thresholds):
+    ni = np.array(image, "int")
+    h, w = threshold_matrix.shape
+    yy, xx = np.mgrid[: ni.shape[0], : ni.shape[1]]
+    return ni + np.rint(
+        threshold_matrix[yy % h, xx % w][:, :, None] * np.array(thresholds, "uint8")
+    ).astype("int")
+
+
+def _reference(image, palette, threshold_matrix, thresholds):
+    return palette.image_closest_colour(
+        _addend_image(image, threshold_matrix, thresholds)
+    )
+
+
+@pytest.mark.parametrize("n_colours", [16, 64])
+@pytest.mark.parametrize("max_bytes", [1, 10000, 2**22])
+@pytest.mark.parametrize(
+    "threshold_matrix",
+    [np.asarray(bayer.B(8)), cluster._CLUSTER_DOT_MATRICES[4], np.ones((3, 5)) / 2],
+)
+def test_engine_matches_reference(random_image, n_colours, max_bytes, threshold_matrix):
+    p = Palette(np.random.RandomState(1).randint(0, 256, (n_colours, 3)))
+    thresholds = [96, 64, 128]
+    expected = _reference(random_image, p, threshold_matrix, thresholds)
+    result = ordered_dithering(
+        random_image, p, threshold_matrix, thresholds, max_bytes=max_bytes
+    )
+    assert result.dtype == np.uint8
+    np.testing.assert_array_equal(result, expected)
+
+
+def test_engine_with_lut(random_image):
+    p = Palette(data_palette())
+    p.build_lut(bits=6)
+    threshold_matrix = np.asarray(bayer.B(4))
+    thresholds = [255, 255, 255]
+    # Sums above 255 saturate before lookup in the table.
+    expected = p.lut_closest_colour(
+        np.clip(_addend_image(random_image, threshold_matrix, thresholds), 0, 255)
+    )
+    result = ordered_dithering(random_image, p, threshold_matrix, thresholds)
+    np.testing.assert_array_equal(result, expected)
+
+
+def test_bayer_and_cluster_dot_dithering(random_image):
+    p = Palette(data_palette())
+    thresholds = [256 / 4, 256 / 4, 256 / 4]
+    result = bayer.bayer_dithering(random_image, p, thresholds, order=8)
+    np.testing.assert_array_equal(
+        np.array(result),
+        _reference(random_image, p, np.asarray(bayer.B(8)), thresholds),
+    )
+    result = cluster.cluster_dot_dithering(random_image, p, thresholds, order=4)
+    np.testing.assert_array_equal(
+        np.array(result),
+        _reference(random_image, p, cluster._CLUSTER_DOT_MATRICES[4], thresholds),
+    )
+
+
+def test_cluster_dot_line_screen(random_image):
+    p = Palette(data_palette())
+    thresholds = [256 / 4, 256 / 4, 256 / 4]
+    matrix = cluster._CLUSTER_DOT_MATRICES[(5, 3)]
+    assert matrix.shape == (3, 5)
+    expected = _reference(random_image, p, matrix, thresholds)
+    for order in [(5, 3), [5, 3]]:
+        result = cluster.cluster_dot_dithering_indices(
+            random_image, p, thresholds, order=order
+        )
+        np.testing.assert_array_equal(result, expected)
+    with pytest.raises(NotImplementedError):
+        cluster.cluster_dot_dithering(random_image, p, thresholds, order=6)
+
+
+@pytest.mark.parametrize("shape", [(16, 16), (12, 20), (64, 64)])
+def test_void_and_cluster_ranks(shape):
+    ranks = blue_noise.void_and_cluster(shape, seed=1)
+    assert ranks.shape == shape
+    np.testing.assert_array_equal(np.sort(ranks.ravel()), np.arange(ranks.size))
+    np.testing.assert_array_equal(ranks, blue_noise.void_and_cluster(shape, seed=1))
+
+    # Threshold levels are spread evenly, with little low frequency power.
+    for level in [ranks.size // 4, ranks.size // 2]:
+        pattern = (ranks < level).astype("float")
+        power = np.abs(np.fft.fft2(pattern - pattern.mean())) ** 2
+        assert power[:2, :2].sum() < 0.01 * power.sum()
+
+
+def test_blue_noise_matrix_is_cached(tmpdir):
+    matrix = blue_noise.blue_noise_matrix(16, seed=2)
+    assert matrix is blue_noise.blue_noise_matrix((16, 16), seed=2)
+    assert not matrix.flags.writeable
+    assert matrix.min() > 0 and matrix.max() < 1
+    np.testing.assert_allclose(
+        np.sort(matrix.ravel()), np.arange(1, 257) / 257.0, rtol=1e-12
+    )
+
+    cache.set_disk_cache(cache.DiskCache(str(tmpdir)))
+    try:
+        blue_noise._blue_noise_matrix.cache_clear()
+        stored = blue_noise.blue_noise_matrix(16, seed=2)
+        assert len(tmpdir.listdir()) == 1
+        blue_noise._blue_noise_matrix.cache_clear()
+        loaded = blue_noise.blue_noise_matrix(16, seed=2)
+    finally:
+        cache.set_disk_cache(None)
+        blue_noise._blue_noise_matrix.cache_clear()
+    np.testing.assert_array_equal(stored, matrix)
+    np.testing.assert_array_equal(loaded, matrix)
+
+
+def test_blue_noise_dithering(random_image):
+    p = Palette(data_palette())
+    thresholds = [96, 96, 96]
+    result = blue_noise.blue_noise_dithering(random_image, p, thresholds, shape=(8, 16))
+    expected = _reference(
+        random_image, p, blue_noise.blue_noise_matrix((8, 16)), thresholds
+    )
+    np.testing.assert_array_equal(np.array(result), expected)
+
+
+def test_threshold_map_dithering(random_image):
+    p = Palette(data_palette())
+    thresholds = [64, 128, 96]
+    matrix = np.random.RandomState(3).rand(7, 3)
+    result = threshold.threshold_map_dithering(random_image, p, matrix, thresholds)
+    np.testing.assert_array_equal(
+        np.array(result), _reference(random_image, p, matrix, thresholds)
+    )
@@ -20,6 +20,7 @@ import numpy as np
 from hitherdither import palette
 from hitherdither.exceptions import PaletteCouldNotBeCreatedError
 from hitherdither.data import scene, scene_bayer0, scene_undithered
+from hitherdither.data import palette as data_palette
 
 
 @pytest.mark.parametrize(
@@ -184,3 +185,51 @@ def test_create_fails_3(test_jpeg):
 def test_create_fails_4(test_jpeg):
     with pytest.raises(PaletteCouldNotBeCreatedError):
         p = palette.Palette(scene())
+
+
+@pytest.mark.parametrize("order", [1, 2, np.inf])
+def test_lut_closest_colour_exact(order):
+    rng = np.random.RandomState(0)
+    p = palette.Palette(rng.randint(0, 256, (4, 3)))
+    image = rng.randint(0, 256, (20, 30, 3)).astype("uint8")
+    expected = p.image_closest_colour(image, order=order)
+    p.build_lut(bits=8, order=order)
+    np.testing.assert_array_equal(p.image_closest_colour(image, order=order), expected)
+
+
+def test_lut_closest_colour_quantized():
+    p = palette.Palette(data_palette())
+    lut = p.build_lut(bits=5)
+    assert lut.shape == (32, 32, 32)
+    assert lut.dtype == np.uint8
+    # Palette colours themselves are far enough apart to survive quantization.
+    image = np.array(p.colours, "uint8").reshape((4, 4, 3))
+    np.testing.assert_array_equal(
+        p.image_closest_colour(image), np.arange(16).reshape((4, 4))
+    )
+    # Out of range values are clipped.
+    image = np.array([[[-20.0, 300.0, 0.0]]])
+    assert (
+        p.lut_closest_colour(image)[0, 0]
+        == p.lut_closest_colour(np.array([[[0, 255, 0]]], "uint8"))[0, 0]
+    )
+
+
+def test_lut_bits_out_of_range():
+    p = palette.Palette(data_palette())
+    with pytest.raises(ValueError):
+        p.build_lut(bits=9)
+
+
+@pytest.mark.parametrize("n_colours", [16, 40])
+def test_image_closest_colour_in_bands(n_colours):
+    rng = np.random.RandomState(2)
+    p = palette.Palette(rng.randint(0, 256, (n_colours, 3)))
+    image = rng.randint(0, 256, (37, 23, 3)).astype("uint8")
+    expected = p.image_closest_colour(image)
+    # A budget of a few rows per band.
+    result = p.image_closest_colour(image, max_bytes=3 * 23 * 8 * (n_colours + 7))
+    assert result.dtype == np.uint8
+    np.testing.assert_array_equal(result, expected)
+    # Budgets smaller than a row still make progress.
+    np.testing.assert_array_equal(p.image_closest_colour(image, max_bytes=1), expected)
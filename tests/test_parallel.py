@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+:mod:`test_parallel`
+=======================
+
+"""
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+from __future__ import absolute_import
+
+import gc
+
+import pytest
+import numpy as np
+from PIL import Image
+
+from hitherdither import batch, parallel
+from hitherdither.data import palette as data_palette
+from hitherdither.palette import Palette
+
+# Shared memory needs Python 3.8.
+pytest.importorskip("multiprocessing.shared_memory")
+
+
+@pytest.fixture(scope="module")
+def image():
+    rng = np.random.RandomState(0)
+    return rng.randint(0, 256, (67, 93, 3)).astype("uint8")
+
+
+@pytest.fixture(scope="module")
+def reference_palette():
+    return Palette(data_palette())
+
+
+@pytest.mark.parametrize(
+    "algorithm, params",
+    [
+        ("bayer", {"thresholds": [64, 64, 64], "order": 8}),
+        ("cluster-dot", {"thresholds": [64, 64, 64], "order": (5, 3)}),
+        ("yliluoma-1", {"order": 4}),
+    ],
+)
+def test_tile_scheduler_matches_single_process(
+    image, reference_palette, algorithm, params
+):
+    expected = batch.dither_frames(image[None], reference_palette, algorithm, **params)
+    with parallel.TileScheduler(
+        reference_palette, algorithm, processes=2, tile_shape=(10, 7), **params
+    ) as tiles:
+        first = tiles(image)
+        second = tiles(Image.fromarray(image[:40]))
+    np.testing.assert_array_equal(first, expected[0])
+    np.testing.assert_array_equal(second, expected[0, :40])
+    # The indices stay valid in shared memory until they are freed.
+    del expected
+    gc.collect()
+    assert first.flags.writeable
+    first[0, 0] = 0
+
+
+def test_tile_scheduler_with_lut(image):
+    palette = Palette(data_palette())
+    palette.build_lut(bits=3)
+    params = {"thresholds": [64, 64, 64], "order": 8}
+    expected = batch.dither_frames(image[None], palette, "bayer", **params)
+    result = parallel.dither_in_processes(
+        image, palette, "bayer", processes=2, tile_shape=(10, 7), **params
+    )
+    np.testing.assert_array_equal(result, expected[0])
+
+
+def test_tiles_are_aligned_and_balanced(reference_palette):
+    with parallel.TileScheduler(
+        reference_palette, "cluster-dot", processes=2, thresholds=[64] * 3, order=8
+    ) as tiles:
+        for rows, columns in tiles._tiles(100, 9000):
+            assert rows.start % 8 == 0 and columns.start % 8 == 0
+        assert len(tiles._tiles(100, 9000)) >= 8
+        assert len(tiles._tiles(10000, 100)) == -(-10000 // 512)
+
+
+def test_dither_in_processes(image, reference_palette):
+    params = {"thresholds": [64, 64, 64], "shape": (12, 20)}
+    expected = batch.dither_frames(
+        image[None], reference_palette, "blue-noise", **params
+    )
+    result = parallel.dither_in_processes(
+        image, reference_palette, "blue-noise", processes=2, **params
+    )
+    np.testing.assert_array_equal(result, expected[0])
+    assert parallel.dither_in_processes(
+        image[:0], reference_palette, "blue-noise", processes=1, **params
+    ).shape == (0, 93)
+    with pytest.raises(ValueError):
+        parallel.TileScheduler(reference_palette, "error-diffusion")
@@ -0,0 +1,174 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+:mod:`test_profiling`
+=======================
+
+"""
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+from __future__ import absolute_import
+
+import asyncio
+import threading
+
+import pytest
+import numpy as np
+
+from hitherdither import profiling, threads
+from hitherdither.data import palette as data_palette
+from hitherdither.diffusion import error_diffusion_dithering
+from hitherdither.ordered.bayer import bayer_dithering
+from hitherdither.ordered.yliluoma import yliluomas_1_ordered_dithering
+from hitherdither.palette import Palette
+
+
+@pytest.fixture(scope="module")
+def image():
+    return np.random.RandomState(0).randint(0, 256, (24, 20, 3)).astype("uint8")
+
+
+def test_stages_do_nothing_without_profile():
+    assert not profiling.enabled()
+    stage = profiling.stage("anything", 10)
+    with stage as entered:
+        entered.pixels = 5
+    assert stage is profiling.stage("other")
+    profiling.record_cache("anything", hits=1)
+
+
+def test_profile_records_nested_stages():
+    with profiling.Profile() as profile:
+        assert profiling.enabled()
+        for _ in range(2):
+            with profiling.stage("outer", 100):
+                with profiling.stage("inner") as stage:
+                    stage.pixels = 7
+        profiling.record_cache("table", hits=3, misses=1)
+    assert not profiling.enabled()
+    with profiling.stage("outer", 100):
+        pass
+
+    result = profile.as_dict()
+    assert sorted(result["stages"]) == ["outer", "outer/inner"]
+    assert result["stages"]["outer"]["calls"] == 2
+    assert result["stages"]["outer"]["pixels"] == 200
+    assert result["stages"]["outer/inner"]["pixels"] == 14
+    outer, inner = result["stages"]["outer"], result["stages"]["outer/inner"]
+    assert outer["seconds"] >= inner["seconds"] > 0
+    assert result["caches"]["table"] == {"hits": 3, "misses": 1, "hit_rate": 0.75}
+
+
+def test_profile_of_dithering(image):
+    p = Palette(data_palette())
+    with profiling.Profile() as profile:
+        bayer_dithering(image, p, [64, 64, 64], order=4)
+        yliluomas_1_ordered_dithering(image, p, order=4, cache_size=1000)
+        yliluomas_1_ordered_dithering(image, p, order=4, cache_size=1000)
+        error_diffusion_dithering(image, p, backend="rows")
+    stages = profile.as_dict()["stages"]
+    pixels = image.shape[0] * image.shape[1]
+    assert stages["ordered_dithering"]["pixels"] == pixels
+    assert stages["ordered_dithering/convert"]["calls"] == 1
+    assert stages["ordered_dithering/closest_colour"]["pixels"] == pixels
+    assert stages["yliluoma_1"]["pixels"] == 2 * pixels
+    assert stages["mixing_plans"]["calls"] == 1
+    assert stages["yliluoma_1/closest_mixes"]["pixels"] == 2 * pixels
+    assert stages["error_diffusion"]["pixels"] == pixels
+    assert stages["png"]["calls"] == 4
+
+    caches = profile.as_dict()["caches"]
+    n_colours = len(np.unique(image.reshape((-1, 3)), axis=0))
+    assert caches["yliluoma_1_plans"]["hits"] == n_colours
+    assert caches["yliluoma_1_plans"]["misses"] == n_colours
+    assert caches["palette_tables"]["hits"] > 0
+
+
+def test_profile_of_memory():
+    with profiling.Profile(memory=True) as profile:
+        with profiling.stage("outer"):
+            with profiling.stage("inner"):
+                block = np.ones(2**20, "uint8")
+                del block
+            small = np.ones(2**10, "uint8")
+            del small
+    stages = profile.as_dict()["stages"]
+    assert stages["outer/inner"]["peak_bytes"] >= 2**20
+    assert stages["outer"]["peak_bytes"] >= stages["outer/inner"]["peak_bytes"]
+
+
+def test_profiles_are_per_thread():
+    recorded = {}
+
+    def run(name):
+        with profiling.Profile(memory=True) as profile:
+            with profiling.stage(name):
+                block = np.ones(2**20, "uint8")
+                del block
+                if name == "first":
+                    # Stages of another thread reset the peak of tracemalloc.
+                    thread = threading.Thread(target=run, args=("second",))
+                    thread.start()
+                    thread.join()
+        recorded[name] = profile.as_dict()["stages"]
+
+    run("first")
+    assert sorted(recorded["first"]) == ["first"]
+    assert sorted(recorded["second"]) == ["second"]
+    assert recorded["first"]["first"]["peak_bytes"] >= 2**20
+
+
+def test_profiles_are_per_task():
+    recorded = {}
+
+    async def run(name):
+        with profiling.Profile() as profile:
+            with profiling.stage(name):
+                # Let the other task run its stage in between.
+                await asyncio.sleep(0)
+            recorded[name] = sorted(profile.as_dict()["stages"])
+
+    async def main():
+        await asyncio.gather(run("first"), run("second"))
+
+    asyncio.run(main())
+    assert recorded == {"first": ["first"], "second": ["second"]}
+
+
+def test_profile_of_thread_pool(image, monkeypatch):
+    monkeypatch.setattr(threads, "MIN_BAND_PIXELS", 16)
+    threads.set_threads(3)
+    try:
+        with profiling.Profile() as profile:
+            with profiling.stage("request"):
+                bayer_dithering(image, Palette(data_palette()), [64] * 3, order=4)
+    finally:
+        threads.set_threads(1)
+    stages = profile.as_dict()["stages"]
+    pixels = image.shape[0] * image.shape[1]
+    assert stages["request/ordered_dithering/closest_colour"]["calls"] > 1
+    assert stages["request/ordered_dithering/closest_colour"]["pixels"] == pixels
+
+
+def test_profile_exports():
+    written = []
+    with profiling.Profile(sink=written.append) as profile:
+        with profiling.stage("outer", 10):
+            with profiling.stage("inner"):
+                pass
+        profiling.record_cache("table", hits=1, misses=1)
+    assert written == [profile]
+
+    text = profile.to_prometheus()
+    assert "# TYPE hitherdither_stage_seconds_total counter\n" in text
+    assert 'hitherdither_stage_calls_total{stage="outer/inner"} 1\n' in text
+    assert 'hitherdither_stage_pixels_total{stage="outer"} 10\n' in text
+    assert 'hitherdither_cache_hit_ratio{cache="table"} 0.5\n' in text
+
+    lines = profile.to_statsd(prefix="app").splitlines()
+    assert "app.stage.outer.inner.calls:1|c" in lines
+    assert "app.stage.outer.pixels:10|c" in lines
+    assert "app.cache.table.misses:1|c" in lines
+    assert any(line.startswith("app.stage.outer.time:") for line in lines)
@@ -0,0 +1,251 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+:mod:`test_quantization`
+=======================
+
+"""
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+from __future__ import absolute_import
+
+import pytest
+import numpy as np
+from PIL import Image
+
+from hitherdither import quantization
+from hitherdither.palette import Palette
+
+
+@pytest.fixture(scope="module")
+def photo():
+    # Smooth gradients with noise, many distinct colours.
+    rng = np.random.RandomState(0)
+    yy, xx = np.mgrid[:120, :160]
+    image = np.stack((xx * 1.5, yy * 2.0, (xx + yy) * 0.9), axis=2)
+    image += rng.normal(0, 8, image.shape)
+    return np.clip(image, 0, 255).astype("uint8")
+
+
+@pytest.mark.parametrize("max_dense_cells", [0, 2**24])
+@pytest.mark.parametrize("bits", [5, 8])
+def test_colour_histogram(photo, bits, max_dense_cells, monkeypatch):
+    monkeypatch.setattr(quantization, "_MAX_DENSE_CELLS", max_dense_cells)
+    pixels = quantization.image_pixels(photo)
+    histogram = quantization.ColourHistogram(pixels, bits)
+    assert histogram.counts.sum() == len(pixels)
+    np.testing.assert_allclose(histogram.sums.sum(axis=0), pixels.sum(axis=0))
+    shift = 8 - bits
+    first = histogram.cells[0]
+    in_first = np.all((pixels >> shift) == first, axis=1)
+    assert in_first.sum() == histogram.counts[0]
+    np.testing.assert_array_equal(
+        histogram.mean_colour([0]), np.rint(pixels[in_first].mean(axis=0))
+    )
+
+
+@pytest.mark.parametrize("n", [1, 2, 7, 16, 100, 256])
+def test_median_cut_gives_n_colours(photo, n):
+    p = Palette.create_by_median_cut(photo, n)
+    assert p.colours.shape == (n, 3)
+    assert p.colours.dtype == np.uint8
+
+
+def test_median_cut_of_pil_image(photo):
+    expected = Palette.create_by_median_cut(photo, 16)
+    p = Palette.create_by_median_cut(Image.fromarray(photo), 16)
+    np.testing.assert_array_equal(p.colours, expected.colours)
+
+
+def test_median_cut_splits_at_weighted_median():
+    colours = np.array([[0, 0, 0], [100, 0, 0], [200, 0, 0]], "uint8")
+    image = np.repeat(colours, [10, 1, 1], axis=0)[None]
+    p = Palette.create_by_median_cut(image, 2)
+    assert sorted(map(tuple, p.colours)) == [(0, 0, 0), (150, 0, 0)]
+
+
+def test_median_cut_with_few_colours():
+    colours = np.array([[0, 0, 0], [1, 0, 0], [2, 0, 0], [255, 255, 255]], "uint8")
+    image = np.repeat(colours, 3, axis=0)[None]
+    # Fewer occupied histogram cells than colours asked for: exact colours.
+    p = Palette.create_by_median_cut(image, 4)
+    assert sorted(map(tuple, p.colours)) == sorted(map(tuple, colours))
+    p = Palette.create_by_median_cut(image, 10)
+    assert len(p) == 4
+
+
+def test_median_cut_along_fixed_dimension(photo):
+    p = Palette.create_by_median_cut(photo, 8, dim=1)
+    assert len(p) == 8
+
+
+@pytest.fixture(scope="module")
+def clusters():
+    # Four well separated clusters of different sizes.
+    rng = np.random.RandomState(1)
+    centres = np.array([[30, 30, 30], [220, 40, 40], [40, 200, 60], [60, 60, 230]])
+    labels = rng.choice(4, 4000, p=[0.4, 0.3, 0.2, 0.1])
+    pixels = centres[labels] + rng.normal(0, 6, (4000, 3))
+    return centres, np.clip(np.rint(pixels), 0, 255).astype("uint8").reshape(40, 100, 3)
+
+
+@pytest.mark.parametrize("init", ["k-means++", "median-cut"])
+@pytest.mark.parametrize("batch_size", [None, 256])
+def test_kmeans_recovers_clusters(clusters, init, batch_size):
+    centres, image = clusters
+    p = Palette.create_by_kmeans(
+        image, 4, init=init, batch_size=batch_size, random_state=0
+    )
+    assert p.colours.shape == (4, 3)
+    assert p.colours.dtype == np.uint8
+    found = sorted(map(tuple, p.colours))
+    for colour, centre in zip(found, sorted(map(tuple, centres))):
+        assert np.abs(np.subtract(colour, centre)).max() <= 3
+
+
+@pytest.mark.parametrize("n", [2, 16, 64])
+def test_kmeans_gives_n_colours(photo, n):
+    p = Palette.create_by_kmeans(photo, n, random_state=0)
+    assert len(set(map(tuple, p.colours))) == n
+
+
+def test_kmeans_is_deterministic(photo):
+    a = Palette.create_by_kmeans(photo, 16, batch_size=512, random_state=3)
+    b = Palette.create_by_kmeans(
+        photo, 16, batch_size=512, random_state=np.random.RandomState(3)
+    )
+    np.testing.assert_array_equal(a.colours, b.colours)
+
+
+def test_kmeans_seeded_by_palette(photo):
+    seed = Palette.create_by_median_cut(photo, 8)
+    p = Palette.create_by_kmeans(photo, 8, init=seed, max_iter=0)
+    np.testing.assert_array_equal(p.colours, seed.colours)
+    p = Palette.create_by_kmeans(photo, 8, init=seed.colours)
+    assert len(p) == 8
+
+
+def test_kmeans_improves_on_median_cut(photo):
+    def error(palette):
+        cc = palette.image_closest_colour(photo)
+        return np.mean((palette.render(cc).astype("float") - photo) ** 2)
+
+    seed = Palette.create_by_median_cut(photo, 16)
+    p = Palette.create_by_kmeans(photo, 16, init=seed, tol=0.0)
+    assert error(p) < error(seed)
+
+
+def test_kmeans_with_few_colours():
+    colours = np.array([[0, 0, 0], [1, 0, 0], [255, 255, 255]], "uint8")
+    image = np.repeat(colours, 3, axis=0)[None]
+    p = Palette.create_by_kmeans(image, 4)
+    assert sorted(map(tuple, p.colours)) == sorted(map(tuple, colours))
+
+
+def test_kmeans_samples_large_images(clusters):
+    centres, image = clusters
+    p = Palette.create_by_kmeans(image, 4, random_state=0, max_pixels=64)
+    found = sorted(map(tuple, p.colours))
+    for colour, centre in zip(found, sorted(map(tuple, centres))):
+        assert np.abs(np.subtract(colour, centre)).max() <= 3
+    again = Palette.create_by_kmeans(image, 4, random_state=0, max_pixels=64)
+    np.testing.assert_array_equal(again.colours, p.colours)
+
+
+def test_kmeans_assigns_closest_centroid(photo):
+    points = quantization.image_pixels(photo).astype("float")
+    centroids = quantization.kmeans_plus_plus(points, np.ones(len(points)), 32, 0)
+    np.testing.assert_array_equal(
+        quantization._closest_centroids(centroids, points, 2, chunk=1000),
+        quantization.closest_colours(centroids, points, 2),
+    )
+
+
+def test_kmeans_unknown_init(photo):
+    with pytest.raises(ValueError):
+        Palette.create_by_kmeans(photo, 4, init="random")
+
+
+def test_kmeans_stops_on_small_movement(photo):
+    histogram = quantization.ColourHistogram(quantization.image_pixels(photo))
+    points = histogram.sums / histogram.counts[:, None]
+    centroids = quantization.kmeans_plus_plus(points, histogram.counts, 8, 0)
+    once = quantization.kmeans(points, histogram.counts, centroids, max_iter=1)
+    stopped = quantization.kmeans(points, histogram.counts, centroids, tol=np.inf)
+    np.testing.assert_array_equal(stopped, once)
+    converged = quantization.kmeans(
+        points, histogram.counts, centroids, max_iter=1000, tol=0.0
+    )
+    again = quantization.kmeans(points, histogram.counts, converged, max_iter=1)
+    np.testing.assert_allclose(again, converged)
+
+
+def test_kmeans_plus_plus_with_few_points():
+    points = np.array([[0, 0, 0], [0, 0, 0], [10, 0, 0]], "float")
+    centroids = quantization.kmeans_plus_plus(points, [1, 1, 1], 3, 0)
+    assert sorted(map(tuple, centroids)) == [(0, 0, 0), (10, 0, 0)]
+
+
+@pytest.mark.parametrize("method", ["octree", "wu"])
+@pytest.mark.parametrize("n", [1, 2, 7, 16, 100, 256])
+def test_octree_and_wu_give_n_colours(photo, method, n):
+    p = getattr(Palette, "create_by_" + method)(photo, n)
+    assert p.colours.shape == (n, 3)
+    assert p.colours.dtype == np.uint8
+    assert len(set(map(tuple, p.colours))) == n
+
+
+@pytest.mark.parametrize("method", ["octree", "wu"])
+def test_octree_and_wu_recover_clusters(clusters, method):
+    centres, image = clusters
+    p = getattr(Palette, "create_by_" + method)(image, 4)
+    found = sorted(map(tuple, p.colours))
+    for colour, centre in zip(found, sorted(map(tuple, centres))):
+        assert np.abs(np.subtract(colour, centre)).max() <= 3
+
+
+@pytest.mark.parametrize("method", ["octree", "wu"])
+def test_octree_and_wu_with_few_colours(method):
+    colours = np.array([[0, 0, 0], [1, 0, 0], [2, 0, 0], [255, 255, 255]], "uint8")
+    image = np.repeat(colours, 3, axis=0)[None]
+    create = getattr(Palette, "create_by_" + method)
+    p = create(image, 4)
+    assert sorted(map(tuple, p.colours)) == sorted(map(tuple, colours))
+    assert len(create(image, 10)) == 4
+    assert len(create(image, 3)) == 3
+
+
+@pytest.mark.parametrize("method", ["octree", "wu"])
+def test_octree_and_wu_with_stride(photo, method):
+    create = getattr(Palette, "create_by_" + method)
+    p = create(photo, 16, stride=7)
+    expected = create(quantization.image_pixels(photo)[::7][None], 16)
+    np.testing.assert_array_equal(p.colours, expected.colours)
+
+
+@pytest.mark.parametrize("method", [quantization.octree, quantization.wu])
+def test_octree_and_wu_of_greyscale(photo, method):
+    pixels = quantization.image_pixels(photo[:, :, 1])
+    histogram = quantization.ColourHistogram(pixels, 6)
+    groups = method(histogram, 5)
+    assert len(groups) == 5
+    np.testing.assert_array_equal(
+        np.sort(np.concatenate(groups)), np.arange(len(histogram))
+    )
+
+
+def test_octree_reduces_least_populated_first():
+    # Two nodes at the deepest level, the less populated one is merged.
+    colours = np.array([[0, 0, 0], [1, 0, 0], [8, 0, 0], [9, 0, 0]], "uint8")
+    image = np.repeat(colours, [1, 1, 5, 5], axis=0)[None]
+    p = Palette.create_by_octree(image, 3, bits=8)
+    assert sorted(map(tuple, p.colours)) == [(0, 0, 0), (8, 0, 0), (9, 0, 0)]
+
+
+def test_wu_cuts_between_clusters():
+    colours = np.array([[0, 0, 0], [10, 0, 0], [200, 0, 0], [210, 0, 0]], "uint8")
+    image = np.repeat(colours, 5, axis=0)[None]
+    p = Palette.create_by_wu(image, 2, bits=5)
+    assert sorted(map(tuple, p.colours)) == [(5, 0, 0), (205, 0, 0)]
@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+:mod:`test_sequence`
+=======================
+
+"""
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+from __future__ import absolute_import
+
+import pytest
+import numpy as np
+from PIL import Image
+
+from hitherdither import batch, sequence
+from hitherdither.data import palette as data_palette
+from hitherdither.palette import Palette
+
+
+@pytest.fixture(scope="module")
+def reference_palette():
+    return Palette(data_palette())
+
+
+@pytest.fixture(scope="module")
+def frames():
+    # A static background with a moving square and a flickering pixel.
+    rng = np.random.RandomState(0)
+    background = rng.randint(0, 256, (30, 45, 3)).astype("uint8")
+    frames = np.repeat(background[None], 4, axis=0)
+    for t in range(1, 4):
+        frames[t, 5 : 5 + 6, 4 * t : 4 * t + 6] = 255
+    frames[2, 29, 44] = 0
+    return frames
+
+
+@pytest.mark.parametrize(
+    "algorithm, params",
+    [
+        ("bayer", {"thresholds": [64, 64, 64], "order": 8}),
+        ("cluster-dot", {"thresholds": [64, 64, 64], "order": (5, 3)}),
+        ("yliluoma-1", {"order": 4}),
+    ],
+)
+@pytest.mark.parametrize("tile_size", [1, 8, 100])
+def test_dither_sequence_matches_full_frames(
+    frames, reference_palette, algorithm, params, tile_size
+):
+    expected = batch.dither_frames(frames, reference_palette, algorithm, **params)
+    result = list(
+        sequence.dither_sequence(
+            iter(frames), reference_palette, algorithm, tile_size, **params
+        )
+    )
+    np.testing.assert_array_equal([indices for indices, _ in result], expected)
+
+    assert result[0][1] == [(0, 0, 45, 30)]
+    for t in range(1, len(frames)):
+        changed = (frames[t] != frames[t - 1]).any(axis=2)
+        covered = np.zeros_like(changed)
+        for left, upper, right, lower in result[t][1]:
+            assert not covered[upper:lower, left:right].any()
+            covered[upper:lower, left:right] = True
+        assert covered[changed].all()
+        assert not (expected[t] != expected[t - 1])[~covered].any()
+
+
+def test_dither_sequence_tolerance(frames, reference_palette):
+    params = {"thresholds": [64, 64, 64], "order": 4}
+    # Small changes, growing over the frames, are ignored until they add up.
+    drift = np.array([0, 2, 4, 6], "uint8")[:, None, None, None]
+    drifting = np.full(frames.shape, 100, "uint8") + drift
+    result = list(
+        sequence.dither_sequence(
+            drifting, reference_palette, "bayer", tolerance=3, **params
+        )
+    )
+    assert result[1][1] == [] and result[2][1] != [] and result[3][1] == []
+    np.testing.assert_array_equal(result[1][0], result[0][0])
+    expected = batch.dither_frames(drifting, reference_palette, "bayer", **params)
+    np.testing.assert_array_equal(result[2][0], expected[2])
+    np.testing.assert_array_equal(result[3][0], expected[2])
+
+
+def test_dither_sequence_images_and_errors(frames, reference_palette):
+    images = [Image.fromarray(frame) for frame in frames]
+    result = list(
+        sequence.dither_sequence(
+            images, reference_palette, "bayer", output="images", thresholds=[64] * 3
+        )
+    )
+    assert [image.mode for image, _ in result] == ["P"] * len(frames)
+
+    with pytest.raises(ValueError):
+        list(sequence.dither_sequence(frames, reference_palette, "error-diffusion"))
+    with pytest.raises(ValueError):
+        list(
+            sequence.dither_sequence(
+                frames, reference_palette, "yliluoma-1", output="x"
+            )
+        )
+    with pytest.raises(ValueError):
+        list(
+            sequence.dither_sequence(
+                [frames[0], frames[1, :10]], reference_palette, "yliluoma-1"
+            )
+        )
+
+
+def test_dirty_boxes():
+    changed = np.zeros((10, 13), "bool")
+    assert sequence.dirty_boxes(changed, (4, 4)) == []
+    changed[1, 1] = changed[5, 2] = changed[9, 12] = changed[0, 9] = True
+    assert sequence.dirty_boxes(changed, (4, 4)) == [
+        (0, 0, 4, 8),
+        (8, 0, 12, 4),
+        (12, 8, 13, 10),
+    ]
+    changed[5, 6] = True
+    assert sequence.dirty_boxes(changed, (4, 4)) == [
+        (0, 0, 4, 4),
+        (8, 0, 12, 4),
+        (0, 4, 8, 8),
+        (12, 8, 13, 10),
+    ]
@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+:mod:`test_spatial`
+=======================
+
+"""
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+from __future__ import absolute_import
+
+import pytest
+import numpy as np
+
+from hitherdither import palette
+from hitherdither.spatial import GridIndex, closest_colours, closest_colours_on_grid
+
+
+@pytest.mark.parametrize("order", [1, 2, np.inf])
+def test_grid_index_matches_brute_force(order):
+    rng = np.random.RandomState(0)
+    p = palette.Palette(rng.randint(0, 256, (64, 3)))
+    # Include pixels outside of the RGB cube, as ordered dithering produces.
+    image = rng.rand(40, 50, 3) * 300.0 - 20.0
+    expected = np.argmin(p.image_distance(image, order=order), axis=2)
+    index = GridIndex(p.colours, order=order)
+    np.testing.assert_array_equal(index.query(image, chunk_size=500), expected)
+    for y, x in rng.randint(0, 40, (50, 2)):
+        assert index.query_pixel(image[y, x]) == expected[y, x]
+
+
+def test_grid_index_ties_resolve_to_lowest_index():
+    index = GridIndex([(0, 0, 0), (10, 0, 0), (10, 0, 0), (20, 0, 0)], cells=4)
+    assert index.query_pixel((10, 0, 0)) == 1
+    assert index.query_pixel((5, 0, 0)) == 0
+    assert index.query_pixel((15, 0, 0)) == 1
+
+
+def test_grid_index_unsupported_order():
+    with pytest.raises(ValueError):
+        GridIndex([(0, 0, 0)], order=3)
+
+
+def test_palette_uses_spatial_index():
+    rng = np.random.RandomState(1)
+    p = palette.Palette(rng.randint(0, 256, (palette.SPATIAL_INDEX_MIN_COLOURS, 3)))
+    image = rng.randint(0, 256, (10, 10, 3)).astype("uint8")
+    expected = np.argmin(p.image_distance(image), axis=2)
+    np.testing.assert_array_equal(p.image_closest_colour(image), expected)
+    index = p.spatial_index(2)
+    assert p.spatial_index(2) is index
+    np.testing.assert_array_equal(
+        p.pixel_closest_colour(image[3, 4]), p.colours[expected[3, 4]]
+    )
+
+    p.colours = p.colours[::-1]
+    assert p.spatial_index(2) is not index
+    np.testing.assert_array_equal(
+        p.image_closest_colour(image), np.argmin(p.image_distance(image), axis=2)
+    )
+
+
+@pytest.mark.parametrize("n_colours", [8, 64])
+def test_closest_colours(n_colours):
+    rng = np.random.RandomState(n_colours)
+    colours = rng.uniform(0, 255, (n_colours, 3))
+    pixels = rng.randint(0, 256, (1000, 3))
+    expected = np.argmin(
+        np.linalg.norm(pixels[:, None, :] - colours[None, :, :], axis=2), axis=1
+    )
+    np.testing.assert_array_equal(
+        closest_colours(colours, pixels, chunk_size=100), expected
+    )
+
+
+@pytest.mark.parametrize("order", [1, 2, np.inf])
+@pytest.mark.parametrize("n_colours", [3, 40])
+def test_closest_colours_on_grid(order, n_colours):
+    rng = np.random.RandomState(n_colours)
+    colours = rng.randint(0, 256, (n_colours, 3))
+    # Duplicate colours, which must resolve to the lowest index.
+    colours[-1] = colours[0]
+    levels = np.arange(0, 256, 9) + 4.5
+    grid = np.stack(np.meshgrid(levels, levels, levels, indexing="ij"), axis=-1)
+    expected = np.argmin(
+        np.linalg.norm(grid[..., None, :] - colours, ord=order, axis=-1), axis=-1
+    )
+    result = closest_colours_on_grid(colours, levels, order, block=5)
+    np.testing.assert_array_equal(result, expected)
+    with pytest.raises(ValueError):
+        closest_colours_on_grid(colours, levels, order=3)
@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+:mod:`test_streaming`
+=======================
+
+"""
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+from __future__ import absolute_import
+
+import pytest
+import numpy as np
+from PIL import Image
+
+from hitherdither import batch, streaming
+from hitherdither.data import palette as data_palette
+from hitherdither.palette import Palette
+
+_BACKENDS = [
+    "rows",
+    pytest.param(
+        "numba",
+        marks=pytest.mark.skipif(
+            not streaming.HAS_NUMBA, reason="Numba is not installed."
+        ),
+    ),
+]
+
+
+@pytest.fixture(scope="module")
+def image():
+    rng = np.random.RandomState(0)
+    return rng.randint(0, 256, (29, 23, 3)).astype("uint8")
+
+
+@pytest.fixture(scope="module")
+def raw_image(image, tmp_path_factory):
+    filename = str(tmp_path_factory.mktemp("streaming") / "image.raw")
+    image.tofile(filename)
+    return streaming.open_raw_image(filename, *image.shape)
+
+
+@pytest.fixture(scope="module")
+def reference_palette():
+    return Palette(data_palette())
+
+
+def _stream(source, palette, algorithm, strip_height, **params):
+    strips = list(
+        streaming.stream_dithering(source, palette, algorithm, strip_height, **params)
+    )
+    assert [y for y, _ in strips] == list(
+        np.cumsum([0] + [len(s) for _, s in strips[:-1]])
+    )
+    return np.concatenate([s for _, s in strips])
+
+
+@pytest.mark.parametrize("source", ["array", "raw", "pil"])
+@pytest.mark.parametrize(
+    "algorithm, params",
+    [
+        ("bayer", {"thresholds": [64, 64, 64], "order": 8}),
+        ("cluster-dot", {"thresholds": [64, 64, 64]}),
+        ("cluster-dot", {"thresholds": [64, 64, 64], "order": (5, 3)}),
+        ("blue-noise", {"thresholds": [64, 64, 64], "shape": (12, 20)}),
+        ("yliluoma-1", {}),
+    ],
+)
+def test_stream_ordered_dithering(
+    image, raw_image, reference_palette, source, algorithm, params
+):
+    expected = batch.dither_frames(image[None], reference_palette, algorithm, **params)
+    source = {"array": image, "raw": raw_image, "pil": Image.fromarray(image)}[source]
+    strips = list(
+        streaming.stream_dithering(source, reference_palette, algorithm, 5, **params)
+    )
+    # Strips are a whole number of periods of the threshold matrix.
+    period = batch._ALGORITHMS[algorithm](reference_palette, **params).period
+    assert len(strips[0][1]) == -(-5 // period) * period
+    np.testing.assert_array_equal(
+        _stream(source, reference_palette, algorithm, 5, **params), expected[0]
+    )
+
+
+@pytest.mark.parametrize("backend", _BACKENDS)
+@pytest.mark.parametrize("method", ["floyd-steinberg", "stucki"])
+@pytest.mark.parametrize("serpentine", [False, True])
+@pytest.mark.parametrize("strip_height", [1, 4, 100])
+def test_stream_error_diffusion(
+    image, raw_image, reference_palette, backend, method, serpentine, strip_height
+):
+    params = {"method": method, "backend": backend, "serpentine": serpentine}
+    expected = batch.dither_frames(
+        image[None], reference_palette, "error-diffusion", **params
+    )
+    for source in (raw_image, Image.fromarray(image)):
+        result = _stream(
+            source, reference_palette, "error-diffusion", strip_height, **params
+        )
+        np.testing.assert_array_equal(result, expected[0])
+
+
+@pytest.mark.parametrize("backend", _BACKENDS)
+def test_stream_error_diffusion_large_palette(image, backend):
+    palette = Palette(np.random.RandomState(1).randint(0, 256, (300, 3)))
+    expected = batch.dither_frames(
+        image[None], palette, "error-diffusion", backend=backend
+    )
+    result = _stream(image, palette, "error-diffusion", 4, backend=backend)
+    assert result.dtype == np.uint16
+    np.testing.assert_array_equal(result, expected[0])
+
+
+def test_stream_unsupported(image, reference_palette):
+    with pytest.raises(ValueError):
+        list(streaming.stream_dithering(image, reference_palette, "ostromoukhov"))
+    with pytest.raises(ValueError):
+        list(
+            streaming.stream_dithering(
+                image, reference_palette, "error-diffusion", backend="python"
+            )
+        )
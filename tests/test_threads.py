@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+:mod:`test_threads`
+=======================
+
+"""
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+from __future__ import absolute_import
+
+import threading
+
+import pytest
+import numpy as np
+
+from hitherdither import threads
+from hitherdither.data import palette as data_palette
+from hitherdither.ordered.bayer import bayer_dithering_indices
+from hitherdither.ordered.yliluoma import yliluomas_1_ordered_dithering_indices
+from hitherdither.palette import Palette
+
+
+@pytest.fixture(scope="module")
+def image():
+    rng = np.random.RandomState(0)
+    return rng.randint(0, 256, (61, 47, 3)).astype("uint8")
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    # Small bands, so that small images are split over the threads.
+    monkeypatch.setattr(threads, "MIN_BAND_PIXELS", 64)
+    threads.set_threads(4)
+    yield
+    threads.set_threads(1)
+
+
+def _run(function, *args, **kwargs):
+    with_threads = function(*args, **kwargs)
+    threads.set_threads(1)
+    try:
+        without_threads = function(*args, **kwargs)
+    finally:
+        threads.set_threads(4)
+    return with_threads, without_threads
+
+
+def test_band_rows(pool):
+    assert threads.band_rows(61, 47, 100) == 16
+    assert threads.band_rows(61, 47, 100, period=8) == 16
+    assert threads.band_rows(61, 47, 5, period=8) == 8
+    assert threads.for_each(lambda n: threads.band_rows(61, 47, 100), [1, 2]) == [
+        100,
+        100,
+    ]
+    threads.set_threads(1)
+    assert not threads.active()
+    assert threads.band_rows(61, 47, 100) == 100
+
+
+@pytest.mark.parametrize("n_colours", [16, 64])
+@pytest.mark.parametrize("max_bytes", [None, 10000])
+def test_image_closest_colour_in_threads(pool, image, n_colours, max_bytes):
+    p = Palette(np.random.RandomState(1).randint(0, 256, (n_colours, 3)))
+    result, expected = _run(p.image_closest_colour, image, max_bytes=max_bytes)
+    np.testing.assert_array_equal(result, expected)
+    p.build_lut(bits=5)
+    result, expected = _run(p.image_closest_colour, image, max_bytes=max_bytes)
+    np.testing.assert_array_equal(result, expected)
+
+
+def test_ordered_dithering_in_threads(pool, image):
+    p = Palette(data_palette())
+    result, expected = _run(bayer_dithering_indices, image, p, [64, 64, 64], 8)
+    np.testing.assert_array_equal(result, expected)
+    result, expected = _run(
+        yliluomas_1_ordered_dithering_indices, image, p, order=4, cache_size=100
+    )
+    np.testing.assert_array_equal(result, expected)
+
+
+def test_concurrent_calls(pool, image):
+    p = Palette(data_palette())
+    expected = yliluomas_1_ordered_dithering_indices(image, p, order=4)
+    results = [None] * 6
+    errors = []
+
+    def request(n):
+        try:
+            # Requests share the palette and its cache of mixing plans.
+            results[n] = yliluomas_1_ordered_dithering_indices(
+                image[:, ::-1] if n % 2 else image, p, order=4, cache_size=50
+            )
+        except Exception as error:
+            errors.append(error)
+
+    requests = [threading.Thread(target=request, args=(n,)) for n in range(6)]
+    for thread in requests:
+        thread.start()
+    for thread in requests:
+        thread.join()
+    assert not errors
+    for n, result in enumerate(results):
+        if n % 2 == 0:
+            np.testing.assert_array_equal(result, expected)
@@ -0,0 +1,32 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+:mod:`test_utils`
+=======================
+
+"""
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+from __future__ import absolute_import
+
+import numpy as np
+
+from hitherdither import utils
+
+
+def test_pil2np_does_not_copy_arrays():
+    image = np.random.RandomState(0).randint(0, 256, (5, 7, 3)).astype("uint8")
+    assert utils.pil2np(image) is image
+    assert utils.pil2np(image, copy=True) is not image
+    converted = utils.pil2np(image.astype("int64"))
+    assert converted.dtype == np.uint8
+    np.testing.assert_array_equal(converted, image)
+
+
+def test_pil2np_of_pil_image_is_writeable():
+    image = np.random.RandomState(0).randint(0, 256, (5, 7, 3)).astype("uint8")
+    array = utils.pil2np(utils.np2pil(image))
+    np.testing.assert_array_equal(array, image)
+    array[0, 0] = 0
@@ -0,0 +1,170 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+:mod:`test_yliluoma`
+=======================
+
+"""
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+from __future__ import absolute_import
+
+import pytest
+import numpy as np
+from PIL import Image
+
+from hitherdither.data import palette as data_palette
+from hitherdither.palette import Palette
+from hitherdither.ordered.bayer import I
+from hitherdither.ordered.yliluoma import _algorithm_one
+from hitherdither.ordered.yliluoma import yliluomas_1_ordered_dithering
+
+
+@pytest.fixture(scope="module")
+def reference_palette():
+    return Palette(data_palette())
+
+
+@pytest.fixture(scope="module")
+def random_image():
+    rng = np.random.RandomState(0)
+    return Image.fromarray(rng.randint(0, 256, (9, 13, 3)).astype("uint8"))
+
+
+def _per_pixel_dithering(image, palette, order=8):
+    """Yliluoma's algorithm 1, one pixel at a time."""
+    bayer_matrix = np.asarray(I(order, transposed=True)) / 64.0
+    ni = np.array(image, "uint8")
+    mixing_matrix, distances, plans = _algorithm_one._get_mixing_plan_matrix(palette)
+    mixing_matrix = np.array(mixing_matrix, "int")
+    cc = np.zeros(ni.shape[:2], "uint8")
+    for y in range(ni.shape[0]):
+        for x in range(ni.shape[1]):
+            plan = plans[
+                np.argmin(
+                    _algorithm_one._improved_mixing_error_fcn(
+                        ni[y, x], mixing_matrix, distances
+                    )
+                )
+            ]
+            factor = bayer_matrix[y % order, x % order]
+            cc[y, x] = plan["j"] if factor < plan["ratio"] else plan["i"]
+    return cc
+
+
+_BACKENDS = [
+    "numpy",
+    pytest.param(
+        "numba",
+        marks=pytest.mark.skipif(
+            not _algorithm_one.HAS_NUMBA, reason="Numba is not installed."
+        ),
+    ),
+]
+
+
+@pytest.mark.parametrize("backend", _BACKENDS)
+@pytest.mark.parametrize("max_bytes", [1, 2**20])
+def test_matches_per_pixel_dithering(
+    random_image, reference_palette, backend, max_bytes
+):
+    expected = _per_pixel_dithering(random_image, reference_palette)
+    result = yliluomas_1_ordered_dithering(
+        random_image, reference_palette, max_bytes=max_bytes, backend=backend
+    )
+    np.testing.assert_array_equal(np.array(result), expected)
+
+
+def test_mixing_plan_matrix_matches_loop(reference_palette):
+    expected_mixes, expected_distances, expected_plans = [], [], []
+    for i in range(len(reference_palette)):
+        for j in range(i, len(reference_palette)):
+            for ratio in range(1 if i == j else 64):
+                c1 = np.array(reference_palette[i], "int")
+                c2 = np.array(reference_palette[j], "int")
+                expected_mixes.append(np.array(c1 + ratio / 64.0 * (c2 - c1), "uint8"))
+                expected_distances.append(
+                    _algorithm_one.color_compare(c1, c2)
+                    * 0.1
+                    * (np.abs(ratio / 64.0 - 0.5) + 0.5)
+                )
+                expected_plans.append((i, j, ratio / 64))
+
+    mixing_matrix, distances, plans = _algorithm_one._get_mixing_plan_matrix(
+        reference_palette
+    )
+    np.testing.assert_array_equal(mixing_matrix, expected_mixes)
+    np.testing.assert_array_equal(distances, expected_distances)
+    np.testing.assert_array_equal(plans.tolist(), expected_plans)
+
+    mixing_plans = _algorithm_one._MixingPlans(len(reference_palette))
+    assert len(mixing_plans) == len(expected_plans)
+    np.testing.assert_array_equal(
+        mixing_plans[np.arange(len(mixing_plans))].tolist(), expected_plans
+    )
+
+    parts = list(
+        _algorithm_one._iter_mixing_plan_matrix(reference_palette, max_mixes=1000)
+    )
+    assert [start for start, _ in parts] == list(range(0, len(plans), 1000))
+    np.testing.assert_array_equal(
+        np.concatenate([part[0] for _, part in parts]), mixing_matrix
+    )
+    np.testing.assert_array_equal(np.concatenate([part[2] for _, part in parts]), plans)
+
+
+@pytest.mark.parametrize("backend", _BACKENDS)
+def test_max_mixes_gives_same_result(random_image, reference_palette, backend):
+    expected = yliluomas_1_ordered_dithering(
+        random_image, reference_palette, backend=backend
+    )
+    result = yliluomas_1_ordered_dithering(
+        random_image, reference_palette, backend=backend, max_mixes=777
+    )
+    np.testing.assert_array_equal(np.array(result), np.array(expected))
+
+
+def test_mixing_error_of_block_matches_single_colours(reference_palette):
+    mixing_matrix, distances, _ = _algorithm_one._get_mixing_plan_matrix(
+        reference_palette
+    )
+    mixing_matrix = np.array(mixing_matrix, "int")
+    colours = np.random.RandomState(1).randint(0, 256, (5, 3))
+    expected = [
+        _algorithm_one._improved_mixing_error_fcn(c, mixing_matrix, distances)
+        for c in colours
+    ]
+    np.testing.assert_array_equal(
+        _algorithm_one._improved_mixing_error_fcn(colours, mixing_matrix, distances),
+        expected,
+    )
+    mixing_errors = _algorithm_one._MixingErrors(mixing_matrix, distances)
+    np.testing.assert_array_equal(mixing_errors(colours), expected)
+    # The tables do not grow with the number of mixes.
+    assert [table.shape for table in mixing_errors.tables] == [(256, 256)] * 3
+
+
+def test_plan_cache_is_kept_on_palette(random_image):
+    p = Palette(data_palette())
+    expected = np.array(yliluomas_1_ordered_dithering(random_image, p))
+    result = yliluomas_1_ordered_dithering(random_image, p, cache_size=1000)
+    np.testing.assert_array_equal(np.array(result), expected)
+
+    cache = p.derived(("yliluoma_1_plan_cache", 8), None)
+    n_colours = len(np.unique(np.array(random_image).reshape((-1, 3)), axis=0))
+    assert len(cache) == n_colours
+    assert cache.hits == 0
+
+    result = yliluomas_1_ordered_dithering(random_image, p, cache_size=1000)
+    np.testing.assert_array_equal(np.array(result), expected)
+    assert cache.hits == n_colours
+
+    # Bounded, least recently used colours are evicted.
+    yliluomas_1_ordered_dithering(random_image, p, cache_size=10)
+    assert len(cache) == 10
+
+    p.colours = p.colours.copy()
+    yliluomas_1_ordered_dithering(random_image, p, cache_size=1000)
+    assert p.derived(("yliluoma_1_plan_cache", 8), None) is not cache